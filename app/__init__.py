@@ -1,30 +1,82 @@
+import click
 from flask import Flask
 from flask_bootstrap import Bootstrap
-<<<<<<< HEAD
-from .config import Config
-
-def create_app():
-    app = Flask(__name__)
-    Bootstrap(app)
-
-    app.config.from_object(Config)
-=======
 from flask_sqlalchemy import SQLAlchemy
-from .config import Config
+from sqlalchemy import text
+from .config import obtener_config
 
 db = SQLAlchemy()
 
-def create_app():
+def create_app(entorno=None):
     app = Flask(__name__)
     bootstrap = Bootstrap(app)
-    app.config.from_object(Config)
+    app.config.from_object(obtener_config(entorno))
     db.init_app(app)
 
     from .forms import LoginForm
     from .routes import register_routes
     register_routes(app)
 
+    # Latencia por endpoint y consultas SQL, expuestas en /metrics
+    from . import metricas
+    metricas.init_app(app)
+
+    # Perfil SQL por petición con avisos de N+1 (solo con PARKEASE_PERFIL_SQL=1)
+    from .perfil_sql import perfil_sql
+    perfil_sql.init_app(app)
+
+    # Completar columnas e índices que falten en bases de datos existentes
+    from .esquema import actualizar_esquema
+    actualizar_esquema(app)
+
+    # Reconstruir el estado de ocupación en memoria desde la base de datos
+    from .ocupacion import ocupacion
+    ocupacion.init_app(app)
+
+    from .matriculas import registro_matriculas
+    registro_matriculas.init_app(app)
+
+    from .sesiones import sesiones_abiertas
+    sesiones_abiertas.init_app(app)
+
+    from .sensores import sensores
+    sensores.init_app(app)
+
+    from .eventos import eventos
+    eventos.init_app(app)
+
+    # Acumulados por minuto y por hora para /api/stats
+    from .estadisticas import estadisticas
+    estadisticas.init_app(app)
+
+    # Archivado del historial antiguo de parking_log (flask archivar-log)
+    from . import archivo
+    archivo.init_app(app)
+
+    calentar_pool(app, app.config.get('DB_POOL_CALENTAR', 0))
+
+    # Lecturas de los sensores por su propio puerto (HTTP y UDP), escritas por lotes.
+    # Nunca dentro de un comando de flask: el CLI encuentra la aplicación importando wsgi.py
+    if app.config.get('INGESTA_ACTIVA') and click.get_current_context(silent=True) is None:
+        from . import ingesta
+        ingesta.init_app(app)
 
->>>>>>> origin/alex
     return app
-    
\ No newline at end of file
+
+
+def calentar_pool(app, conexiones):
+    """Abre `conexiones` conexiones a la vez y las devuelve al pool, ya establecidas."""
+    if conexiones <= 0:
+        return
+    with app.app_context():
+        abiertas = []
+        try:
+            for _ in range(conexiones):
+                conexion = db.engine.connect()
+                abiertas.append(conexion)
+                conexion.execute(text("SELECT 1"))
+        except Exception as e:
+            print(f"❌ Error al abrir las conexiones iniciales con la base de datos: {e}")
+        finally:
+            for conexion in abiertas:
+                conexion.close()
@@ -0,0 +1,222 @@
+import csv
+import gzip
+import os
+import re
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, inspect, select
+
+from . import db
+from .models import ParkingLog
+
+
+# Las tablas de archivo no forman parte de db.metadata para que create_all no las cree
+metadata_archivo = MetaData()
+_tablas_archivo = {}
+
+PATRON_TABLA = re.compile(r'^parking_log_(\d{4})(\d{2})$')
+PATRON_FICHERO = re.compile(r'^parking_log_(\d{4})(\d{2})\.csv\.gz$')
+CAMPOS = ('id', 'matricula', 'tiempo_entrada', 'tiempo_salida')
+
+
+def inicio_mes(momento):
+    return momento.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def mes_siguiente(momento):
+    return inicio_mes(inicio_mes(momento) + timedelta(days=32))
+
+
+def tabla_archivo(anio, mes):
+    """Tabla parking_log_AAAAMM con las sesiones cerradas que entraron ese mes."""
+    nombre = f'parking_log_{anio:04d}{mes:02d}'
+    if nombre not in _tablas_archivo:
+        _tablas_archivo[nombre] = Table(
+            nombre, metadata_archivo,
+            Column('id', Integer, primary_key=True, autoincrement=False),
+            Column('matricula', String(255), nullable=False),
+            Column('tiempo_entrada', DateTime, nullable=False),
+            Column('tiempo_salida', DateTime),
+            Index(f'ix_{nombre}_matricula', 'matricula'),
+            Index(f'ix_{nombre}_tiempo_entrada', 'tiempo_entrada'),
+        )
+    return _tablas_archivo[nombre]
+
+
+def _carpeta(app=None):
+    from flask import current_app
+    return (app or current_app).config.get('CARPETA_ARCHIVO_LOG', 'archivo_parking_log')
+
+
+def meses_archivados():
+    """Meses (anio, mes) con tabla de archivo en la base de datos."""
+    meses = []
+    for nombre in inspect(db.engine).get_table_names():
+        coincidencia = PATRON_TABLA.match(nombre)
+        if coincidencia:
+            meses.append((int(coincidencia.group(1)), int(coincidencia.group(2))))
+    return sorted(meses)
+
+
+def meses_exportados(carpeta):
+    """Meses (anio, mes) exportados a ficheros CSV comprimidos en `carpeta`."""
+    if not os.path.isdir(carpeta):
+        return []
+    meses = []
+    for nombre in os.listdir(carpeta):
+        coincidencia = PATRON_FICHERO.match(nombre)
+        if coincidencia:
+            meses.append((int(coincidencia.group(1)), int(coincidencia.group(2))))
+    return sorted(meses)
+
+
+def archivar(dias_retencion=90):
+    """Mueve a las tablas mensuales las sesiones cerradas hace más de `dias_retencion` días.
+
+    Cada mes se copia con un INSERT ... SELECT y se borra de parking_log con un único
+    DELETE, en la misma transacción. Las sesiones abiertas nunca se mueven, y la
+    tabla de un mes solo se crea si ese mes tiene sesiones que mover.
+    Devuelve {(anio, mes): filas movidas}.
+    """
+    tabla = ParkingLog.__table__
+    corte = datetime.now() - timedelta(days=dias_retencion)
+    cerradas = tabla.c.tiempo_salida.isnot(None) & (tabla.c.tiempo_salida < corte)
+
+    primera = db.session.execute(select(db.func.min(tabla.c.tiempo_entrada)).where(cerradas)).scalar()
+    movidas = {}
+    if primera is None:
+        return movidas
+
+    mes = inicio_mes(primera)
+    while mes < corte:
+        siguiente = mes_siguiente(mes)
+        condicion = cerradas & (tabla.c.tiempo_entrada >= mes) & (tabla.c.tiempo_entrada < siguiente)
+        if not db.session.execute(select(tabla.c.id).where(condicion).limit(1)).first():
+            mes = siguiente
+            continue
+        destino = tabla_archivo(mes.year, mes.month)
+        destino.create(db.engine, checkfirst=True)
+
+        columnas = [tabla.c[campo] for campo in CAMPOS]
+        copiadas = db.session.execute(destino.insert().from_select(CAMPOS, select(*columnas).where(condicion))).rowcount
+        if copiadas:
+            db.session.execute(tabla.delete().where(condicion))
+            movidas[(mes.year, mes.month)] = copiadas
+        db.session.commit()
+        mes = siguiente
+    return movidas
+
+
+def exportar(carpeta, meses_en_base=12):
+    """Pasa a CSV comprimido (almacenamiento en frío) las tablas de archivo más antiguas.
+
+    Se conservan en la base de datos los últimos `meses_en_base` meses archivados;
+    el resto se escribe en `carpeta`/parking_log_AAAAMM.csv.gz y se borra la tabla.
+    Si el fichero del mes ya existe (p. ej. una salida tardía archivada después) se
+    conservan sus filas y se le añaden las de la tabla; una sesión que está en los dos
+    (mismo id, matrícula y entrada) queda con la versión de la tabla.
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    limite = inicio_mes(datetime.now())
+    for _ in range(meses_en_base):
+        limite = inicio_mes(limite - timedelta(days=1))
+
+    exportados = []
+    for anio, mes in meses_archivados():
+        if datetime(anio, mes, 1) >= limite:
+            continue
+        tabla = tabla_archivo(anio, mes)
+        ruta = os.path.join(carpeta, f'{tabla.name}.csv.gz')
+        temporal = ruta + '.tmp'
+        with gzip.open(temporal, 'wt', newline='') as fichero:
+            escritor = csv.writer(fichero)
+            escritor.writerow(CAMPOS)
+            if os.path.exists(ruta):
+                # SQLite puede reutilizar los id de parking_log, así que el id solo no basta
+                en_tabla = {
+                    (str(id_fila), matricula, entrada.isoformat())
+                    for id_fila, matricula, entrada in db.session.execute(
+                        select(tabla.c.id, tabla.c.matricula, tabla.c.tiempo_entrada))
+                }
+                with gzip.open(ruta, 'rt', newline='') as anterior:
+                    for fila in csv.DictReader(anterior):
+                        if (fila['id'], fila['matricula'], fila['tiempo_entrada']) not in en_tabla:
+                            escritor.writerow([fila[campo] for campo in CAMPOS])
+            for fila in db.session.execute(select(tabla).order_by(tabla.c.id)).yield_per(5000):
+                escritor.writerow([valor.isoformat() if isinstance(valor, datetime) else valor for valor in fila])
+        os.replace(temporal, ruta)
+        db.session.commit()
+        tabla.drop(db.engine)
+        exportados.append((anio, mes))
+    return exportados
+
+
+def _coincide(fila, matriculas, desde, hasta):
+    if matriculas is not None and fila['matricula'] not in matriculas:
+        return False
+    if desde and fila['tiempo_entrada'] < desde:
+        return False
+    if hasta and fila['tiempo_entrada'] > hasta:
+        return False
+    return True
+
+
+def consultar_historial(matricula=None, desde=None, hasta=None, carpeta=None, matriculas=None):
+    """Sesiones de parking en un rango, buscando en parking_log, las tablas mensuales y los CSV.
+
+    Se filtra por `matricula` o por una lista de `matriculas` (p. ej. las de un usuario).
+    Solo se abren las particiones cuyo mes se solapa con [desde, hasta].
+    """
+    if matricula:
+        matriculas = [matricula]
+    if matriculas is not None:
+        matriculas = set(matriculas)
+        if not matriculas:
+            return []
+
+    def en_rango(anio, mes):
+        inicio = datetime(anio, mes, 1)
+        return (not hasta or inicio <= hasta) and (not desde or mes_siguiente(inicio) > desde)
+
+    filas = []
+    fuentes = [ParkingLog.__table__]
+    fuentes += [tabla_archivo(anio, mes) for anio, mes in meses_archivados() if en_rango(anio, mes)]
+    for tabla in fuentes:
+        consulta = select(*[tabla.c[campo] for campo in CAMPOS])
+        if matriculas is not None:
+            consulta = consulta.where(tabla.c.matricula.in_(matriculas))
+        if desde:
+            consulta = consulta.where(tabla.c.tiempo_entrada >= desde)
+        if hasta:
+            consulta = consulta.where(tabla.c.tiempo_entrada <= hasta)
+        filas += [dict(fila._mapping) for fila in db.session.execute(consulta)]
+
+    carpeta = carpeta or _carpeta()
+    for anio, mes in meses_exportados(carpeta):
+        if not en_rango(anio, mes):
+            continue
+        with gzip.open(os.path.join(carpeta, f'parking_log_{anio:04d}{mes:02d}.csv.gz'), 'rt', newline='') as fichero:
+            for fila in csv.DictReader(fichero):
+                fila['id'] = int(fila['id'])
+                fila['tiempo_entrada'] = datetime.fromisoformat(fila['tiempo_entrada'])
+                fila['tiempo_salida'] = datetime.fromisoformat(fila['tiempo_salida']) if fila['tiempo_salida'] else None
+                if _coincide(fila, matriculas, desde, hasta):
+                    filas.append(fila)
+
+    return sorted(filas, key=lambda fila: fila['tiempo_entrada'])
+
+
+def init_app(app):
+    @app.cli.command('archivar-log')
+    @click.option('--dias', default=None, type=int, help='Días de historial que se quedan en parking_log.')
+    @click.option('--exportar-meses', default=None, type=int,
+                  help='Exportar a CSV las tablas de archivo anteriores a estos meses.')
+    def archivar_log(dias, exportar_meses):
+        """Mueve el historial antiguo de parking_log a tablas mensuales y, opcionalmente, a CSV."""
+        dias = dias if dias is not None else app.config.get('DIAS_RETENCION_LOG', 90)
+        for (anio, mes), filas in archivar(dias).items():
+            click.echo(f"📦 {filas} sesiones movidas a parking_log_{anio:04d}{mes:02d}")
+        if exportar_meses is not None:
+            for anio, mes in exportar(_carpeta(app), exportar_meses):
+                click.echo(f"🧊 parking_log_{anio:04d}{mes:02d} exportada a {_carpeta(app)}")
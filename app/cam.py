@@ -1,15 +1,69 @@
+import argparse
+import csv
+import json
+import os
+import queue
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 import cv2
 import numpy as np
 import pytesseract
 import requests
 import time
 
+try:
+    import tesserocr
+except ImportError:  # Motor OCR opcional, ver MotorOCRTesserocr
+    tesserocr = None
 
-# Configura la ruta de Tesseract si es necesario (Windows)
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+try:
+    from .metricas import RegistroMetricas, servir_metricas
+except ImportError:  # cam.py se ejecuta como script desde app/
+    from metricas import RegistroMetricas, servir_metricas
+
+
+# Configura la ruta de Tesseract si es necesario (Windows); en Linux se usa el del PATH
+if os.name == 'nt':
+    pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 
 # IP de la cámara
 esp32_url = "http://172.16.0.59/capture"
+# Stream MJPEG del firmware CameraWebServer (servidor de stream en el puerto 81)
+esp32_stream_url = "http://172.16.0.59:81/stream"
+# Último estado del sensor de proximidad de la entrada (ver /sensorpuerta en routes.py)
+url_puerta = "http://127.0.0.1:81/sensorpuerta"
+
+# Rutas del servidor para registrar entradas y salidas
+url_entrada = "http://127.0.0.1:81/api/entrada"
+url_salida = "http://127.0.0.1:81/api/salida"
+
+config_ocr = '--oem 3 --psm 7 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 -c classify_bln_numeric_mode=1'
+caracteres_ocr = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+
+# Candidatos que pasan al OCR en cada frame (los de mejor puntuación geométrica)
+max_candidatos = 3
+
+# Ventanas de depuración de procesar_imagen (--sin-ventanas para usarlo sin entorno gráfico)
+mostrar_ventanas = True
+
+# Etapas medidas en el modo de reproducción (--replay)
+ETAPAS = ("decodificacion", "canny_contornos", "enderezado", "umbral", "ocr")
+
+# Métricas de la cámara en formato Prometheus (--metricas-puerto)
+metricas = RegistroMetricas()
+duracion_etapa = metricas.histograma(
+    "parkease_camara_etapa_segundos", "Segundos por frame de cada etapa del reconocimiento", ("camara", "etapa"))
+latencia_frame = metricas.histograma(
+    "parkease_camara_latencia_segundos", "Tiempo desde que llega un frame hasta que se empieza a procesar", ("camara",))
+frames_camara = metricas.contador(
+    "parkease_camara_frames_total", "Frames recibidos de la cámara por resultado", ("camara", "resultado"))
+
+
+def observar_etapas(tiempos, camara="entrada"):
+    for etapa, segundos in tiempos.items():
+        duracion_etapa.observar(segundos, camara=camara, etapa=etapa)
+
 
 def ordenar_puntos(puntos):
     puntos = puntos.reshape(4, 2)
@@ -32,18 +86,25 @@ def enderezar_imagen(imagen, puntos):
     return cv2.warpPerspective(imagen, matriz, (int(ancho), int(alto)))
 
 def enviar_matricula_a_entrada(matricula):
+    return enviar_matricula(matricula, url_entrada)
+
+def enviar_matricula_a_salida(matricula):
+    return enviar_matricula(matricula, url_salida)
+
+def enviar_matricula(matricula, url):
     try:
-        # URL de la ruta en routes.py
-        url = "http://127.0.0.1:81/api/entrada"
         data = {"matricula": matricula}
         response = requests.post(url, json=data)
         
         if response.status_code == 200:
-            print("Entrada registrada exitosamente.")
+            print("Entrada registrada exitosamente." if url == url_entrada else "Salida registrada exitosamente.")
             return True
         elif response.status_code == 403:
             print("Matrícula no registrada.")
             return False
+        elif response.status_code == 404:
+            print("No hay registro de entrada para esta matrícula.")
+            return False
         elif response.status_code == 409:
             print("Parking completo.")
             return False
@@ -54,68 +115,1028 @@ def enviar_matricula_a_entrada(matricula):
         print(f"Error en la solicitud HTTP: {e}")
         return False
 
-while True:
-    time.sleep(1.0)
-    try:
-        response = requests.get(esp32_url, stream=True)
-        if response.status_code == 200:
-            data = np.frombuffer(response.content, np.uint8)
-            image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+def partes_mjpeg(trozos):
+    """Extrae los JPEG de un stream multipart/x-mixed-replace a medida que llegan los datos.
+
+    `trozos` es un iterable de bytes (p. ej. response.iter_content()). Se usa la
+    cabecera Content-Length de cada parte y, si no viene, los marcadores SOI/EOI del JPEG.
+    """
+    buffer = bytearray()
+    for trozo in trozos:
+        buffer += trozo
+        while True:
+            fin_cabecera = buffer.find(b"\r\n\r\n")
+            if fin_cabecera == -1:
+                break
+
+            longitud = None
+            for linea in bytes(buffer[:fin_cabecera]).split(b"\r\n"):
+                nombre, _, valor = linea.partition(b":")
+                if nombre.strip().lower() == b"content-length":
+                    longitud = int(valor.strip())
+
+            inicio = fin_cabecera + 4
+            if longitud is not None:
+                if len(buffer) < inicio + longitud:
+                    break
+                jpeg = bytes(buffer[inicio:inicio + longitud])
+                del buffer[:inicio + longitud]
+            else:
+                fin = buffer.find(b"\xff\xd9", inicio)
+                if fin == -1:
+                    break
+                jpeg = bytes(buffer[buffer.find(b"\xff\xd8", inicio):fin + 2])
+                del buffer[:fin + 2]
+            yield jpeg
+
+
+class LectorMJPEG:
+    """Lee el stream MJPEG de la cámara en un hilo propio con una conexión persistente.
+
+    Solo se guarda el frame más reciente: si el OCR va más lento que la cámara,
+    los frames intermedios se descartan sin llegar a decodificarse.
+    """
+
+    def __init__(self, url, timeout=5, tam_trozo=4096, nombre="entrada"):
+        self.url = url
+        self.nombre = nombre
+        self.timeout = timeout
+        self.tam_trozo = tam_trozo
+        self._condicion = threading.Condition()
+        self._frame = None
+        self._t_frame = 0.0
+        self._activo = False
+        self._hilo = None
+
+        self.recibidos = 0
+        self.descartados = 0
+        self.procesados = 0
+        self.t_decodificacion = 0.0
+        self.t_latencia = 0.0
+        self._t_inicio = time.monotonic()
+
+    def iniciar(self):
+        self._activo = True
+        self._hilo = threading.Thread(target=self._bucle, daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self._activo = False
+        with self._condicion:
+            self._condicion.notify_all()
+
+    def _bucle(self):
+        session = requests.Session()
+        espera = 0.5
+        while self._activo:
+            try:
+                with session.get(self.url, stream=True, timeout=self.timeout) as response:
+                    response.raise_for_status()
+                    espera = 0.5
+                    for jpeg in partes_mjpeg(response.iter_content(self.tam_trozo)):
+                        self._guardar(jpeg)
+                        if not self._activo:
+                            break
+            except Exception as e:
+                print(f"Error en el stream de la cámara: {e}")
+                time.sleep(espera)
+                espera = min(espera * 2, 5.0)
+
+    def _guardar(self, jpeg):
+        with self._condicion:
+            if self._frame is not None:
+                self.descartados += 1
+                frames_camara.inc(camara=self.nombre, resultado="descartado")
+            self._frame = jpeg
+            self._t_frame = time.monotonic()
+            self.recibidos += 1
+            self._condicion.notify()
+
+    def leer(self, timeout=None):
+        """Devuelve el frame más reciente ya decodificado, o None si no llega ninguno a tiempo."""
+        with self._condicion:
+            if self._frame is None:
+                self._condicion.wait(timeout)
+            jpeg, self._frame = self._frame, None
+            t_frame = self._t_frame
+        if jpeg is None:
+            return None
+
+        t0 = time.perf_counter()
+        image = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+        t_decodificacion = time.perf_counter() - t0
+        self.t_decodificacion += t_decodificacion
+        # Tiempo desde que llegó el frame hasta que está listo para procesar
+        latencia = time.monotonic() - t_frame
+        self.t_latencia += latencia
+        self.procesados += 1
+        duracion_etapa.observar(t_decodificacion, camara=self.nombre, etapa="decodificacion")
+        latencia_frame.observar(latencia, camara=self.nombre)
+        frames_camara.inc(camara=self.nombre, resultado="procesado")
+        return image
+
+    def estadisticas(self):
+        transcurrido = max(time.monotonic() - self._t_inicio, 1e-6)
+        return {
+            "fps_camara": self.recibidos / transcurrido,
+            "fps_efectivos": self.procesados / transcurrido,
+            "descartados": self.descartados,
+            "decodificacion_ms": 1000 * self.t_decodificacion / max(self.procesados, 1),
+            "latencia_ms": 1000 * self.t_latencia / max(self.procesados, 1),
+        }
+
+    def reiniciar_estadisticas(self):
+        with self._condicion:
+            self.recibidos = self.descartados = self.procesados = 0
+            self.t_decodificacion = self.t_latencia = 0.0
+            self._t_inicio = time.monotonic()
+
+
+def capturar_imagen():
+    """Pide una sola imagen a /capture (modo antiguo, una conexión por imagen)."""
+    response = requests.get(esp32_url, stream=True)
+    if response.status_code != 200:
+        print("Error al obtener la imagen.")
+        return None
+    data = np.frombuffer(response.content, np.uint8)
+    return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+
+class DetectorPresencia:
+    """Filtro barato que decide si merece la pena buscar matrículas en un frame.
+
+    Trabaja sobre la región de interés reducida a `ancho` píxeles: compara con un
+    fondo aprendido (asfalto vacío) para saber si hay un objeto y con el frame
+    anterior para saber si la escena está quieta. Solo devuelve True cuando hay
+    un objeto y la imagen lleva `frames_estables` frames sin moverse.
+    """
+
+    def __init__(self, roi=(0.0, 0.0, 1.0, 1.0), ancho=160, umbral_pixel=25,
+                 umbral_presencia=0.08, umbral_movimiento=0.01, frames_estables=3,
+                 aprendizaje=0.05):
+        self.roi = roi
+        self.ancho = ancho
+        self.umbral_pixel = umbral_pixel
+        self.umbral_presencia = umbral_presencia
+        self.umbral_movimiento = umbral_movimiento
+        self.frames_estables = frames_estables
+        self.aprendizaje = aprendizaje
+        self._fondo = None
+        self._anterior = None
+        self._estables = 0
+        self._forzado_hasta = 0.0
+
+    def recortar_roi(self, image):
+        alto_img, ancho_img = image.shape[:2]
+        x, y, w, h = self.roi
+        x0, y0 = int(x * ancho_img), int(y * alto_img)
+        x1, y1 = int((x + w) * ancho_img), int((y + h) * alto_img)
+        return image[y0:y1, x0:x1]
+
+    def _preparar(self, image):
+        roi = self.recortar_roi(image)
+        escala = self.ancho / roi.shape[1]
+        pequena = cv2.resize(roi, (self.ancho, max(1, int(roi.shape[0] * escala))), interpolation=cv2.INTER_AREA)
+        if pequena.ndim == 3:
+            pequena = cv2.cvtColor(pequena, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(pequena, (5, 5), 0)
+
+    def forzar(self, segundos):
+        """Considera que hay un vehículo durante unos segundos (p. ej. aviso del sensor de la entrada)."""
+        self._forzado_hasta = max(self._forzado_hasta, time.monotonic() + segundos)
+
+    def evaluar(self, image):
+        pequena = self._preparar(image)
+        if self._fondo is None:
+            self._fondo = pequena.astype(np.float32)
+            self._anterior = pequena
+            return False
+
+        fondo = cv2.convertScaleAbs(self._fondo)
+        primer_plano = np.count_nonzero(cv2.absdiff(pequena, fondo) > self.umbral_pixel) / pequena.size
+        movimiento = np.count_nonzero(cv2.absdiff(pequena, self._anterior) > self.umbral_pixel) / pequena.size
+        self._anterior = pequena
+
+        presente = primer_plano >= self.umbral_presencia or time.monotonic() < self._forzado_hasta
+        if not presente:
+            cv2.accumulateWeighted(pequena, self._fondo, self.aprendizaje)
+            self._estables = 0
+            return False
+
+        # Un objeto que se queda mucho tiempo acaba formando parte del fondo
+        cv2.accumulateWeighted(pequena, self._fondo, self.aprendizaje / 20)
+
+        if movimiento < self.umbral_movimiento:
+            self._estables += 1
+        else:
+            self._estables = 0
+        return self._estables >= self.frames_estables
+
+
+class VigilantePuerta:
+    """Consulta periódicamente el sensor de proximidad de la entrada y activa el detector."""
+
+    def __init__(self, detector, url, intervalo=0.5, duracion=3.0):
+        self.detector = detector
+        self.url = url
+        self.intervalo = intervalo
+        self.duracion = duracion
+
+    def iniciar(self):
+        threading.Thread(target=self._bucle, daemon=True).start()
+        return self
+
+    def _bucle(self):
+        session = requests.Session()
+        while True:
+            try:
+                data = session.get(self.url, timeout=2).json()
+                if data.get("estado") == "detecto" and (data.get("segundos") or 0) < self.duracion:
+                    self.detector.forzar(self.duracion)
+            except Exception as e:
+                print(f"Error al consultar el sensor de la entrada: {e}")
+            time.sleep(self.intervalo)
+
+
+def solapamiento(caja_a, caja_b):
+    """Intersección sobre unión de dos rectángulos (x, y, w, h)."""
+    ax, ay, aw, ah = caja_a
+    bx, by, bw, bh = caja_b
+    ancho = min(ax + aw, bx + bw) - max(ax, bx)
+    alto = min(ay + ah, by + bh) - max(ay, by)
+    if ancho <= 0 or alto <= 0:
+        return 0.0
+    interseccion = ancho * alto
+    return interseccion / (aw * ah + bw * bh - interseccion)
+
+
+def votar_caracteres(lecturas):
+    """Consenso carácter a carácter entre varias lecturas OCR de la misma matrícula.
+
+    Se vota entre las lecturas de la longitud más frecuente. Devuelve el texto y el
+    acuerdo mínimo por posición (votos del carácter ganador / total de lecturas).
+    """
+    longitud = Counter(len(l) for l in lecturas).most_common(1)[0][0]
+    candidatas = [l for l in lecturas if len(l) == longitud]
+    texto = ""
+    acuerdo = 1.0
+    for posicion in range(longitud):
+        caracter, votos = Counter(l[posicion] for l in candidatas).most_common(1)[0]
+        texto += caracter
+        acuerdo = min(acuerdo, votos / len(lecturas))
+    return texto, acuerdo
+
+
+class VotacionMatriculas:
+    """Agrupa las lecturas OCR por pista (misma zona de la imagen en frames seguidos).
+
+    Una pista solo produce su matrícula una vez, cuando acumula `lecturas_necesarias`
+    lecturas con suficiente acuerdo. Mientras el vehículo siga delante de la cámara
+    la pista se mantiene viva y no se vuelve a enviar.
+    """
+
+    def __init__(self, lecturas_necesarias=5, acuerdo_minimo=0.6, caducidad=3.0, iou_minimo=0.3):
+        self.lecturas_necesarias = lecturas_necesarias
+        self.acuerdo_minimo = acuerdo_minimo
+        self.caducidad = caducidad
+        self.iou_minimo = iou_minimo
+        self._pistas = []
+
+    def _buscar_pista(self, caja, ahora):
+        self._pistas = [p for p in self._pistas if ahora - p["t_ultimo"] <= self.caducidad]
+        mejor, mejor_iou = None, self.iou_minimo
+        for pista in self._pistas:
+            iou = solapamiento(pista["caja"], caja)
+            if iou >= mejor_iou:
+                mejor, mejor_iou = pista, iou
+        return mejor
+
+    def decidida(self, caja, ahora=None):
+        """True si la zona ya pertenece a una pista resuelta (no hace falta más OCR)."""
+        ahora = time.monotonic() if ahora is None else ahora
+        pista = self._buscar_pista(caja, ahora)
+        if pista and pista["matricula"]:
+            pista["caja"] = caja
+            pista["t_ultimo"] = ahora
+            return True
+        return False
+
+    def agregar(self, texto, caja, ahora=None):
+        """Añade una lectura. Devuelve la matrícula de consenso la primera vez que se alcanza."""
+        ahora = time.monotonic() if ahora is None else ahora
+        pista = self._buscar_pista(caja, ahora)
+        if pista is None:
+            pista = {"caja": caja, "lecturas": [], "t_ultimo": ahora, "matricula": None}
+            self._pistas.append(pista)
+
+        pista["caja"] = caja
+        pista["t_ultimo"] = ahora
+        if pista["matricula"]:
+            return None
+
+        pista["lecturas"].append(texto)
+        if len(pista["lecturas"]) < self.lecturas_necesarias:
+            return None
+
+        matricula, acuerdo = votar_caracteres(pista["lecturas"][-2 * self.lecturas_necesarias:])
+        if acuerdo >= self.acuerdo_minimo:
+            pista["matricula"] = matricula
+            return matricula
+        return None
+
+
+class CacheEnviadas:
+    """Matrículas enviadas recientemente a /api/entrada, con caducidad."""
+
+    def __init__(self, ttl=120.0):
+        self.ttl = ttl
+        self._enviadas = {}
+
+    def reciente(self, matricula, ahora=None):
+        ahora = time.monotonic() if ahora is None else ahora
+        self._enviadas = {m: t for m, t in self._enviadas.items() if ahora - t < self.ttl}
+        return matricula in self._enviadas
+
+    def registrar(self, matricula, ahora=None):
+        self._enviadas[matricula] = time.monotonic() if ahora is None else ahora
+
+
+votacion = VotacionMatriculas()
+enviadas = CacheEnviadas()
+
+
+def puntuar_candidatos(cuadrilateros, edges, area_roi, proporcion=4.7):
+    """Puntúa todos los cuadriláteros a la vez según lo que se parecen a una matrícula.
+
+    `cuadrilateros` es un array (N, 4, 2). Se combinan la proporción ancho/alto
+    (las europeas miden unas 4.7:1), la rectangularidad, la densidad de bordes
+    dentro del rectángulo (los caracteres dan muchos bordes) y el tamaño relativo
+    a la región de interés. Devuelve un array de N puntuaciones entre 0 y 1.
+    """
+    puntos = cuadrilateros.astype(np.float64)
+    lados = np.linalg.norm(np.roll(puntos, -1, axis=1) - puntos, axis=2)
+    ancho = np.maximum(lados[:, 0], lados[:, 2])
+    alto = np.maximum(lados[:, 1], lados[:, 3])
+    relacion = np.maximum(ancho, alto) / np.maximum(np.minimum(ancho, alto), 1.0)
+    p_proporcion = np.exp(-((relacion - proporcion) / 1.5) ** 2)
+
+    # Área del polígono (fórmula del área de Gauss) frente a la del rectángulo que forman sus lados
+    x, y = puntos[:, :, 0], puntos[:, :, 1]
+    area = 0.5 * np.abs(np.sum(x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y, axis=1))
+    p_rectangularidad = np.clip(area / np.maximum(ancho * alto, 1.0), 0.0, 1.0)
+
+    # Densidad de bordes en el rectángulo envolvente con la imagen integral (O(1) por candidato)
+    integral = cv2.integral((edges > 0).astype(np.uint8))
+    x0 = np.clip(x.min(axis=1).astype(int), 0, edges.shape[1])
+    x1 = np.clip(x.max(axis=1).astype(int) + 1, 0, edges.shape[1])
+    y0 = np.clip(y.min(axis=1).astype(int), 0, edges.shape[0])
+    y1 = np.clip(y.max(axis=1).astype(int) + 1, 0, edges.shape[0])
+    bordes = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+    densidad = bordes / np.maximum((x1 - x0) * (y1 - y0), 1)
+    p_bordes = np.clip(densidad / 0.15, 0.0, 1.0)
+
+    # Tamaño: entre el 0.2 % y el 10 % de la región de interés
+    fraccion = area / max(area_roi, 1.0)
+    p_tamano = np.exp(-(np.log(np.maximum(fraccion, 1e-9) / 0.015) / 1.5) ** 2)
+
+    return p_proporcion * p_rectangularidad * p_bordes * p_tamano
+
+def buscar_candidatos(gray_image, roi=None, top_k=None):
+    """Contornos de cuatro lados que pueden ser una matrícula.
+
+    Se descartan los que puntuar_candidatos() ve sin parecido (<= 0.01) y, de los
+    demás, se devuelven como mucho `top_k`, de mejor a peor puntuación.
+    """
+    edges = cv2.Canny(gray_image, 100, 200)
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contornos_candidatos = []
 
+    for contour in contours:
+        if cv2.contourArea(contour) > 150:
+            epsilon = 0.025 * cv2.arcLength(contour, True)
+            aproximacion = cv2.approxPolyDP(contour, epsilon, True)
+            if len(aproximacion) == 4:
+                contornos_candidatos.append(aproximacion)
+
+    top_k = max_candidatos if top_k is None else top_k
+    if contornos_candidatos:
+        area_roi = gray_image.shape[0] * gray_image.shape[1]
+        if roi:
+            area_roi *= roi[2] * roi[3]
+        puntuaciones = puntuar_candidatos(np.stack(contornos_candidatos).reshape(-1, 4, 2), edges, area_roi)
+        mejores = [i for i in np.argsort(-puntuaciones) if puntuaciones[i] > 0.01][:top_k]
+        contornos_candidatos = [contornos_candidatos[i] for i in mejores]
+    return contornos_candidatos, edges
+
+def binarizar_candidato(image, rect, tiempos=None):
+    """Endereza el candidato y lo binariza (Otsu) para el OCR.
+
+    Si se pasa `tiempos` (un Counter) se le suman los segundos de cada etapa.
+    """
+    t0 = time.perf_counter()
+    rectangulo_enderezado = enderezar_imagen(image, rect)
+    t1 = time.perf_counter()
+    gray_rect = cv2.cvtColor(rectangulo_enderezado, cv2.COLOR_BGR2GRAY)
+    _, thresh = cv2.threshold(gray_rect, 128, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    if tiempos is not None:
+        tiempos["enderezado"] += t1 - t0
+        tiempos["umbral"] += time.perf_counter() - t1
+    return rectangulo_enderezado, thresh
+
+class MotorOCRSubproceso:
+    """OCR con pytesseract: lanza el ejecutable de tesseract en cada llamada."""
+
+    nombre = "pytesseract"
+
+    def leer(self, thresh):
+        return pytesseract.image_to_string(thresh, config=config_ocr)
+
+
+class MotorOCRTesserocr:
+    """OCR con la API de tesseract en el mismo proceso (tesserocr).
+
+    El modelo se carga una sola vez al crear el motor; cada lectura solo pasa la
+    imagen en memoria. La API no es segura entre hilos: un motor por hilo o proceso.
+    """
+
+    nombre = "tesserocr"
+
+    def __init__(self, ruta_tessdata=None):
+        if tesserocr is None:
+            raise RuntimeError("El motor OCR 'tesserocr' requiere el paquete tesserocr")
+        opciones = {"lang": "eng", "psm": tesserocr.PSM.SINGLE_LINE, "oem": tesserocr.OEM.DEFAULT}
+        if ruta_tessdata:
+            opciones["path"] = ruta_tessdata
+        self._api = tesserocr.PyTessBaseAPI(**opciones)
+        self._api.SetVariable("tessedit_char_whitelist", caracteres_ocr)
+        self._api.SetVariable("classify_bln_numeric_mode", "1")
+
+    def leer(self, thresh):
+        thresh = np.ascontiguousarray(thresh, dtype=np.uint8)
+        alto, ancho = thresh.shape[:2]
+        self._api.SetImageBytes(thresh.tobytes(), ancho, alto, 1, ancho)
+        return self._api.GetUTF8Text()
+
+    def cerrar(self):
+        self._api.End()
+
+
+MOTORES_OCR = {
+    MotorOCRSubproceso.nombre: MotorOCRSubproceso,
+    MotorOCRTesserocr.nombre: MotorOCRTesserocr,
+}
+
+# Motor OCR del proceso actual; los procesos del pipeline crean el suyo con configurar_ocr()
+motor_ocr_nombre = MotorOCRSubproceso.nombre
+_motor_ocr = None
+
+def configurar_ocr(nombre):
+    global motor_ocr_nombre, _motor_ocr
+    if nombre not in MOTORES_OCR:
+        raise ValueError(f"Motor OCR desconocido: {nombre}")
+    motor_ocr_nombre = nombre
+    _motor_ocr = None
+
+def obtener_motor_ocr():
+    global _motor_ocr
+    if _motor_ocr is None:
+        _motor_ocr = MOTORES_OCR[motor_ocr_nombre]()
+    return _motor_ocr
+
+def leer_texto(thresh):
+    """OCR de un candidato binarizado. Se ejecuta también en los procesos del pipeline."""
+    texto = obtener_motor_ocr().leer(thresh)
+    return ''.join(e for e in texto if e.isalnum() or e in [' ', '.', ','])
+
+def leer_texto_cronometrado(thresh):
+    """leer_texto() para el pool de procesos: devuelve (texto, segundos de OCR)."""
+    t0 = time.perf_counter()
+    texto = leer_texto(thresh)
+    return texto, time.perf_counter() - t0
+
+def comparar_motores_ocr(carpeta, repeticiones=3, motores=None):
+    """Mide la latencia por matrícula de cada motor OCR sobre recortes binarizados de una carpeta."""
+    rutas = sorted(os.path.join(carpeta, f) for f in os.listdir(carpeta)
+                   if f.lower().endswith((".png", ".jpg", ".jpeg", ".bmp")))
+    imagenes = [cv2.imread(ruta, cv2.IMREAD_GRAYSCALE) for ruta in rutas]
+    if not imagenes:
+        print(f"No hay imágenes en {carpeta}")
+        return {}
+
+    resultados = {}
+    for nombre in motores or MOTORES_OCR:
+        try:
+            t0 = time.perf_counter()
+            motor = MOTORES_OCR[nombre]()
+            t_carga = time.perf_counter() - t0
+        except Exception as e:
+            print(f"{nombre}: no disponible ({e})")
+            continue
+
+        tiempos = []
+        textos = []
+        try:
+            for _ in range(repeticiones):
+                textos = []
+                for imagen in imagenes:
+                    t0 = time.perf_counter()
+                    textos.append(motor.leer(imagen).strip())
+                    tiempos.append(time.perf_counter() - t0)
+        except Exception as e:
+            print(f"{nombre}: error al leer ({e})")
+            continue
+        finally:
+            if hasattr(motor, "cerrar"):
+                motor.cerrar()
+
+        tiempos_ms = np.array(tiempos) * 1000
+        resultados[nombre] = {"textos": textos, "media_ms": float(tiempos_ms.mean()),
+                              "p95_ms": float(np.percentile(tiempos_ms, 95)), "carga_ms": t_carga * 1000}
+        print(f"{nombre}: media {tiempos_ms.mean():.1f} ms | p95 {np.percentile(tiempos_ms, 95):.1f} ms | "
+              f"carga {t_carga * 1000:.0f} ms | {len(imagenes)} matrículas x {repeticiones}")
+
+    if len(resultados) > 1:
+        nombres = list(resultados)
+        referencia = resultados[nombres[0]]["textos"]
+        for nombre in nombres[1:]:
+            iguales = sum(a == b for a, b in zip(referencia, resultados[nombre]["textos"]))
+            print(f"{nombre} coincide con {nombres[0]} en {iguales}/{len(referencia)} matrículas")
+    return resultados
+
+def registrar_lectura(texto_limpio, caja, votacion, enviadas, enviar):
+    """Pasa una lectura por la votación y envía la matrícula cuando hay consenso."""
+    print(f"Texto detectado: {texto_limpio}")
+    lectura = ''.join(e for e in texto_limpio if e.isalnum()).upper()
+    if len(lectura) < 4:
+        return
+
+    # Solo se envía una vez por vehículo, cuando varias lecturas coinciden
+    matricula = votacion.agregar(lectura, caja)
+    if matricula and not enviadas.reciente(matricula):
+        print(f"Matrícula reconocida: {matricula}")
+        enviadas.registrar(matricula)
+        enviar(matricula)
+
+
+def mostrar(titulo, imagen):
+    if mostrar_ventanas:
+        cv2.imshow(titulo, imagen)
+
+
+def procesar_imagen(image, roi=None):
+    tiempos = Counter()
+    # Mostrar imagen original
+    mostrar("Imagen Original", image)
+
+    t0 = time.perf_counter()
+    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    mostrar("Escala de Grises", gray_image)
+
+    contornos_candidatos, edges = buscar_candidatos(gray_image, roi)
+    tiempos["canny_contornos"] += time.perf_counter() - t0
+    mostrar("Bordes Detectados (Canny)", edges)
+
+    # Dibuja los contornos encontrados
+    if mostrar_ventanas:
+        debug_contours = image.copy()
+        cv2.drawContours(debug_contours, contornos_candidatos, -1, (0, 255, 0), 2)
+        mostrar("Contornos Detectados", debug_contours)
+
+    for rect in contornos_candidatos:
+        x, y, w, h = cv2.boundingRect(rect)
+        # Esta matrícula ya se ha reconocido en frames anteriores
+        if votacion.decidida((x, y, w, h)):
+            continue
+
+        if mostrar_ventanas:
+            mostrar("Recorte ROI", gray_image[y:y+h, x:x+w])
+
+        # Preprocesamiento para mejorar OCR
+        rectangulo_enderezado, thresh = binarizar_candidato(image, rect, tiempos)
+        mostrar("Rectángulo Enderezado", rectangulo_enderezado)
+        mostrar("Binarización para OCR", thresh)
+
+        # Aplicar OCR y mostrar en terminal
+        t0 = time.perf_counter()
+        texto_limpio = leer_texto(thresh)
+        tiempos["ocr"] += time.perf_counter() - t0
+
+        if texto_limpio:
+            registrar_lectura(texto_limpio, (x, y, w, h), votacion, enviadas, enviar_matricula_a_entrada)
+
+    observar_etapas(tiempos)
+
+
+def reconocer_frame(image, roi=None, tiempos=None):
+    """Busca y lee las matrículas de un frame, sin ventanas ni votación. Devuelve [(texto, caja)].
+
+    Si se pasa `tiempos` (un Counter) se le suman los segundos de cada etapa.
+    """
+    tiempos = Counter() if tiempos is None else tiempos
+    t0 = time.perf_counter()
+    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    contornos_candidatos, _ = buscar_candidatos(gray_image, roi)
+    tiempos["canny_contornos"] += time.perf_counter() - t0
+
+    lecturas = []
+    for rect in contornos_candidatos:
+        _, thresh = binarizar_candidato(image, rect, tiempos)
+        t0 = time.perf_counter()
+        texto_limpio = leer_texto(thresh)
+        tiempos["ocr"] += time.perf_counter() - t0
+        if texto_limpio:
+            lecturas.append((texto_limpio, cv2.boundingRect(rect)))
+    return lecturas
+
+
+def frames_de_origen(origen):
+    """Genera (nombre, imagen, segundos de decodificación) desde una carpeta de imágenes o un vídeo.
+
+    En una carpeta el nombre es el del fichero; en un vídeo, el número de frame.
+    """
+    if os.path.isdir(origen):
+        for nombre in sorted(f for f in os.listdir(origen) if f.lower().endswith((".jpg", ".jpeg", ".png"))):
+            with open(os.path.join(origen, nombre), "rb") as fichero:
+                datos = fichero.read()
+            t0 = time.perf_counter()
+            image = cv2.imdecode(np.frombuffer(datos, np.uint8), cv2.IMREAD_COLOR)
+            yield nombre, image, time.perf_counter() - t0
+        return
+
+    captura = cv2.VideoCapture(origen)
+    numero = 0
+    while True:
+        t0 = time.perf_counter()
+        ok, image = captura.read()
+        if not ok:
+            break
+        yield str(numero), image, time.perf_counter() - t0
+        numero += 1
+    captura.release()
+
+
+def leer_etiquetas(ruta):
+    """Lee el fichero de etiquetas del conjunto de datos.
+
+    Es un CSV con cabecera `imagen,matricula`: `imagen` es el nombre del fichero
+    (o el número de frame en un vídeo) y `matricula` la que se ve en él, vacía si
+    en ese frame no hay ninguna. Los frames que no aparecen no cuentan para la precisión.
+    """
+    with open(ruta, newline="", encoding="utf-8") as fichero:
+        return {
+            fila["imagen"].strip(): ''.join(c for c in fila.get("matricula") or "" if c.isalnum()).upper()
+            for fila in csv.DictReader(fichero)
+        }
+
+
+def resumen_tiempos(segundos):
+    if not segundos:
+        return {"media_ms": 0.0, "p95_ms": 0.0}
+    ms = np.array(segundos) * 1000
+    return {"media_ms": round(float(ms.mean()), 2), "p95_ms": round(float(np.percentile(ms, 95)), 2)}
+
+
+def reproducir(origen, etiquetas=None, roi=None, limite=None, fps_origen=10.0):
+    """Ejecuta el reconocimiento sobre frames grabados, tan rápido como se pueda, y mide cada etapa.
+
+    Con etiquetas calcula la precisión por frame (la matrícula esperada está entre
+    las leídas), las lecturas en frames sin matrícula y las matrículas que la
+    votación habría enviado. `fps_origen` fija el reloj de la votación.
+    """
+    votacion_replay = VotacionMatriculas()
+    por_etapa = {etapa: [] for etapa in ETAPAS}
+    por_frame = []
+    decididas = []
+    frames = con_matricula = aciertos = sin_matricula = falsos = errores = 0
+
+    inicio = time.perf_counter()
+    for nombre, image, t_decodificacion in frames_de_origen(origen):
+        if limite and frames >= limite:
+            break
+        if image is None:
+            errores += 1
+            continue
+        tiempos = Counter(decodificacion=t_decodificacion)
+        try:
+            lecturas = reconocer_frame(image, roi, tiempos)
+        except Exception as e:
+            if not errores:
+                print(f"Error en el frame {nombre}: {e}")
+            errores += 1
+            lecturas = []
+        frames += 1
+        for etapa in ETAPAS:
+            por_etapa[etapa].append(tiempos[etapa])
+        por_frame.append(sum(tiempos.values()))
+
+        textos = set()
+        for texto, caja in lecturas:
+            lectura = ''.join(c for c in texto if c.isalnum()).upper()
+            textos.add(lectura)
+            if len(lectura) >= 4:
+                matricula = votacion_replay.agregar(lectura, caja, ahora=frames / fps_origen)
+                if matricula:
+                    decididas.append(matricula)
+
+        esperada = etiquetas.get(nombre) if etiquetas else None
+        if esperada:
+            con_matricula += 1
+            aciertos += esperada in textos
+        elif esperada is not None:
+            sin_matricula += 1
+            falsos += bool(textos)
+    transcurrido = time.perf_counter() - inicio
+
+    informe = {
+        "frames": frames,
+        "errores": errores,
+        "fps": round(frames / transcurrido, 2) if transcurrido else 0.0,
+        "frame": resumen_tiempos(por_frame),
+        "etapas": {etapa: resumen_tiempos(tiempos) for etapa, tiempos in por_etapa.items()},
+        "decididas": decididas,
+    }
+    if etiquetas:
+        esperadas = {m for m in etiquetas.values() if m}
+        informe["precision"] = {
+            "frames_con_matricula": con_matricula,
+            "aciertos_frame": aciertos,
+            "tasa_acierto_frame": round(aciertos / con_matricula, 3) if con_matricula else None,
+            "frames_sin_matricula": sin_matricula,
+            "falsos_positivos": falsos,
+            "matriculas_esperadas": len(esperadas),
+            "matriculas_correctas": len(esperadas & set(decididas)),
+            "matriculas_erroneas": len(set(decididas) - esperadas),
+        }
+    return informe
+
+
+def mostrar_informe_reproduccion(informe):
+    print(f"Frames: {informe['frames']} | errores: {informe['errores']} | FPS: {informe['fps']} | "
+          f"por frame: media {informe['frame']['media_ms']} ms, p95 {informe['frame']['p95_ms']} ms")
+    for etapa, datos in informe["etapas"].items():
+        print(f"  {etapa:16} media {datos['media_ms']:8.2f} ms | p95 {datos['p95_ms']:8.2f} ms")
+    precision = informe.get("precision")
+    if precision:
+        print(f"Acierto por frame: {precision['aciertos_frame']}/{precision['frames_con_matricula']} "
+              f"({precision['tasa_acierto_frame']}) | falsos positivos: "
+              f"{precision['falsos_positivos']}/{precision['frames_sin_matricula']}")
+        print(f"Matrículas enviadas: {precision['matriculas_correctas']}/{precision['matriculas_esperadas']} "
+              f"correctas, {precision['matriculas_erroneas']} erróneas")
+
+
+def poner_descartando(cola, elemento):
+    """Mete un elemento en una cola acotada; si está llena descarta el más antiguo. Devuelve True si descartó."""
+    descartado = False
+    while True:
+        try:
+            cola.put_nowait(elemento)
+            return descartado
+        except queue.Full:
+            try:
+                cola.get_nowait()
+                descartado = True
+            except queue.Empty:
+                pass
+
+
+class CamaraPipeline:
+    """Una cámara del modo pipeline: su lector, su filtro de presencia y su votación."""
+
+    def __init__(self, nombre, url, enviar, roi=(0.0, 0.0, 1.0, 1.0), filtro=True):
+        self.nombre = nombre
+        self.lector = LectorMJPEG(url, nombre=nombre)
+        self.detector = DetectorPresencia(roi=roi) if filtro else None
+        self.votacion = VotacionMatriculas()
+        self.enviadas = CacheEnviadas()
+        self.enviar = enviar
+        self.lock = threading.Lock()
+        self.candidatos_descartados = 0
+
+
+class Pipeline:
+    """Captura, preprocesado y OCR en etapas separadas unidas por colas acotadas.
+
+    Cada cámara tiene un hilo de preprocesado (filtro, contornos, enderezado y
+    binarización). El OCR se reparte entre un pool de procesos; si no da abasto,
+    las colas descartan el trabajo más antiguo en lugar de acumular retraso.
+    """
+
+    def __init__(self, camaras, workers=None, tam_cola=None):
+        self.camaras = camaras
+        self.workers = workers or os.cpu_count() or 1
+        self.cola_ocr = queue.Queue(maxsize=tam_cola or self.workers * 2)
+        self.resultados = queue.Queue()
+        self._en_vuelo = threading.BoundedSemaphore(self.workers * 2)
+        self._ocr_en_vuelo = 0
+        self._lock_en_vuelo = threading.Lock()
+        self.ocr_realizados = 0
+        self.candidatos_descartados = metricas.contador(
+            "parkease_camara_candidatos_descartados_total", "Candidatos descartados por la cola de OCR llena", ("camara",))
+        metricas.indicador("parkease_camara_cola_ocr", "Candidatos esperando un proceso de OCR", self.cola_ocr.qsize)
+        metricas.indicador("parkease_camara_ocr_en_vuelo", "Candidatos en los procesos de OCR",
+                           lambda: self._ocr_en_vuelo)
+        metricas.indicador("parkease_camara_resultados_pendientes", "Lecturas de OCR pendientes de votar",
+                           self.resultados.qsize)
+
+    def _preprocesar(self, camara):
+        while True:
+            image = camara.lector.leer(timeout=5)
             if image is None:
-                print("Error: No se pudo decodificar la imagen.")
+                continue
+            if camara.detector and not camara.detector.evaluar(image):
                 continue
 
-            # Mostrar imagen original
-            cv2.imshow("Imagen Original", image)
-
+            tiempos = Counter()
+            t0 = time.perf_counter()
             gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            cv2.imshow("Escala de Grises", gray_image)
+            contornos_candidatos, _ = buscar_candidatos(gray_image, camara.detector.roi if camara.detector else None)
+            tiempos["canny_contornos"] += time.perf_counter() - t0
+            for rect in contornos_candidatos:
+                caja = cv2.boundingRect(rect)
+                with camara.lock:
+                    if camara.votacion.decidida(caja):
+                        continue
+                _, thresh = binarizar_candidato(image, rect, tiempos)
+                if poner_descartando(self.cola_ocr, (camara, caja, thresh, time.perf_counter())):
+                    camara.candidatos_descartados += 1
+                    self.candidatos_descartados.inc(camara=camara.nombre)
+            observar_etapas(tiempos, camara.nombre)
 
-            edges = cv2.Canny(gray_image, 100, 200)
-            cv2.imshow("Bordes Detectados (Canny)", edges)
+    def _repartir(self, pool):
+        while True:
+            camara, caja, thresh, t_encolado = self.cola_ocr.get()
+            self._en_vuelo.acquire()
+            with self._lock_en_vuelo:
+                self._ocr_en_vuelo += 1
+            duracion_etapa.observar(time.perf_counter() - t_encolado, camara=camara.nombre, etapa="espera_ocr")
+            futuro = pool.submit(leer_texto_cronometrado, thresh)
+            futuro.add_done_callback(lambda f, camara=camara, caja=caja: self._terminado(camara, caja, f))
 
-            contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            contornos_candidatos = []
+    def _terminado(self, camara, caja, futuro):
+        with self._lock_en_vuelo:
+            self._ocr_en_vuelo -= 1
+        self._en_vuelo.release()
+        self.resultados.put((camara, caja, futuro))
 
-            for contour in contours:
-                if cv2.contourArea(contour) > 150:
-                    epsilon = 0.025 * cv2.arcLength(contour, True)
-                    aproximacion = cv2.approxPolyDP(contour, epsilon, True)
-                    if len(aproximacion) == 4:
-                        contornos_candidatos.append(aproximacion)
+    def ejecutar(self):
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=configurar_ocr,
+                                 initargs=(motor_ocr_nombre,)) as pool:
+            for camara in self.camaras:
+                camara.lector.iniciar()
+                threading.Thread(target=self._preprocesar, args=(camara,), daemon=True).start()
+            threading.Thread(target=self._repartir, args=(pool,), daemon=True).start()
+            print(f"Pipeline iniciado: {len(self.camaras)} cámara(s), {self.workers} procesos de OCR")
 
-            # Dibuja los contornos encontrados
-            debug_contours = image.copy()
-            cv2.drawContours(debug_contours, contornos_candidatos, -1, (0, 255, 0), 2)
-            cv2.imshow("Contornos Detectados", debug_contours)
+            ultimo_informe = time.monotonic()
+            while True:
+                try:
+                    camara, caja, futuro = self.resultados.get(timeout=1)
+                    self.ocr_realizados += 1
+                    texto_limpio, segundos = futuro.result()
+                    duracion_etapa.observar(segundos, camara=camara.nombre, etapa="ocr")
+                    if texto_limpio:
+                        with camara.lock:
+                            registrar_lectura(texto_limpio, caja, camara.votacion, camara.enviadas, camara.enviar)
+                except queue.Empty:
+                    pass
+                except Exception as e:
+                    print(f"Error: {e}")
 
-            for rect in contornos_candidatos:
-                x, y, w, h = cv2.boundingRect(rect)
-                cropped_rect = gray_image[y:y+h, x:x+w]
-                cv2.imshow("Recorte ROI", cropped_rect)
+                if time.monotonic() - ultimo_informe >= 10:
+                    self.informe(time.monotonic() - ultimo_informe)
+                    ultimo_informe = time.monotonic()
+
+    def informe(self, transcurrido):
+        print(f"OCR/s: {self.ocr_realizados / transcurrido:.1f} | cola OCR: {self.cola_ocr.qsize()} | "
+              f"pendientes: {self.resultados.qsize()}")
+        self.ocr_realizados = 0
+        for camara in self.camaras:
+            stats = camara.lector.estadisticas()
+            print(f"  [{camara.nombre}] FPS procesados: {stats['fps_efectivos']:.1f} | "
+                  f"frames descartados: {stats['descartados']} | candidatos descartados: {camara.candidatos_descartados}")
+            camara.lector.reiniciar_estadisticas()
+            camara.candidatos_descartados = 0
 
-                rectangulo_enderezado = enderezar_imagen(image, rect)
-                cv2.imshow("Rectángulo Enderezado", rectangulo_enderezado)
 
-                # Preprocesamiento para mejorar OCR
-                gray_rect = cv2.cvtColor(rectangulo_enderezado, cv2.COLOR_BGR2GRAY)
-                _, thresh = cv2.threshold(gray_rect, 128, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
-                cv2.imshow("Binarización para OCR", thresh)
+def main():
+    global max_candidatos, mostrar_ventanas
+    parser = argparse.ArgumentParser(description="Reconocimiento de matrículas desde la cámara ESP32")
+    parser.add_argument("--capture", action="store_true",
+                        help="usar /capture (una petición por imagen) en lugar del stream MJPEG")
+    parser.add_argument("--roi", default="0,0,1,1",
+                        help="región de interés x,y,ancho,alto en fracciones de la imagen")
+    parser.add_argument("--sin-filtro", action="store_true",
+                        help="buscar matrículas en todos los frames, haya o no un vehículo")
+    parser.add_argument("--puerta", action="store_true",
+                        help="usar también el sensor de proximidad de la entrada (/sensorpuerta)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="separar captura, preprocesado y OCR en etapas con un pool de procesos (sin ventanas)")
+    parser.add_argument("--camara", action="append", default=[], metavar="entrada|salida=URL",
+                        help="cámara del modo pipeline; se puede repetir (por defecto la de la entrada)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="procesos de OCR del modo pipeline (por defecto, uno por núcleo)")
+    parser.add_argument("--max-candidatos", type=int, default=max_candidatos,
+                        help="candidatos por frame que pasan al OCR, ordenados por su geometría")
+    parser.add_argument("--ocr", choices=sorted(MOTORES_OCR), default=motor_ocr_nombre,
+                        help="motor OCR (tesserocr carga el modelo una sola vez por proceso)")
+    parser.add_argument("--benchmark-ocr", metavar="CARPETA",
+                        help="comparar la latencia de los motores OCR con los recortes de CARPETA y salir")
+    parser.add_argument("--sin-ventanas", action="store_true",
+                        help="no abrir las ventanas de depuración de OpenCV")
+    parser.add_argument("--replay", metavar="CARPETA|VIDEO",
+                        help="procesar frames grabados sin cámara ni ventanas y medir tiempos y precisión")
+    parser.add_argument("--etiquetas", metavar="CSV",
+                        help="etiquetas del --replay (imagen,matricula); por defecto CARPETA/etiquetas.csv")
+    parser.add_argument("--limite", type=int, default=None, help="frames máximos del --replay")
+    parser.add_argument("--fps-origen", type=float, default=10.0,
+                        help="frames por segundo con que se grabó el --replay (reloj de la votación)")
+    parser.add_argument("--informe-json", metavar="FICHERO", help="guardar el informe del --replay en JSON")
+    parser.add_argument("--metricas-puerto", type=int, default=None, metavar="PUERTO",
+                        help="servir los tiempos por etapa y el tamaño de las colas en http://0.0.0.0:PUERTO/metrics")
+    args = parser.parse_args()
+    roi = tuple(float(v) for v in args.roi.split(","))
 
-                # Aplicar OCR y mostrar en terminal
-                texto = pytesseract.image_to_string(thresh, config='--oem 3 --psm 7 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 -c classify_bln_numeric_mode=1')
-                texto_limpio = ''.join(e for e in texto if e.isalnum() or e in [' ', '.', ','])
+    if args.benchmark_ocr:
+        comparar_motores_ocr(args.benchmark_ocr)
+        return
 
-                if texto_limpio:
-                    print(f"Texto detectado: {texto_limpio}")
-                    enviar_matricula_a_entrada(texto_limpio)
+    configurar_ocr(args.ocr)
+    max_candidatos = args.max_candidatos
 
-            if cv2.waitKey(1) & 0xFF == ord('q'):
+    if args.replay:
+        ruta_etiquetas = args.etiquetas
+        if not ruta_etiquetas and os.path.isdir(args.replay):
+            ruta_etiquetas = os.path.join(args.replay, "etiquetas.csv")
+        etiquetas = leer_etiquetas(ruta_etiquetas) if ruta_etiquetas and os.path.exists(ruta_etiquetas) else None
+        informe = reproducir(args.replay, etiquetas, roi, args.limite, args.fps_origen)
+        mostrar_informe_reproduccion(informe)
+        if args.informe_json:
+            with open(args.informe_json, "w") as fichero:
+                json.dump(informe, fichero, indent=2)
+        return
+
+    mostrar_ventanas = not args.sin_ventanas
+    if args.metricas_puerto:
+        servir_metricas(metricas, args.metricas_puerto)
+
+    if args.pipeline:
+        destinos = {"entrada": enviar_matricula_a_entrada, "salida": enviar_matricula_a_salida}
+        camaras = []
+        for definicion in args.camara or [f"entrada={esp32_stream_url}"]:
+            nombre, _, url = definicion.partition("=")
+            if nombre not in destinos or not url:
+                parser.error(f"cámara inválida: {definicion}")
+            camara = CamaraPipeline(nombre, url, destinos[nombre], roi=roi, filtro=not args.sin_filtro)
+            if args.puerta and nombre == "entrada" and camara.detector:
+                VigilantePuerta(camara.detector, url_puerta).iniciar()
+            camaras.append(camara)
+        Pipeline(camaras, workers=args.workers).ejecutar()
+        return
+
+    lector = None if args.capture else LectorMJPEG(esp32_stream_url).iniciar()
+    detector = None
+    if not args.sin_filtro:
+        detector = DetectorPresencia(roi=roi)
+        if args.puerta:
+            VigilantePuerta(detector, url_puerta).iniciar()
+    ultimo_informe = time.monotonic()
+
+    while True:
+        try:
+            if lector:
+                image = lector.leer(timeout=5)
+                if image is None:
+                    print("Error: No se recibió ningún frame de la cámara.")
+                    continue
+            else:
+                time.sleep(1.0)
+                image = capturar_imagen()
+                if image is None:
+                    print("Error: No se pudo decodificar la imagen.")
+                    continue
+
+            if detector is None or detector.evaluar(image):
+                procesar_imagen(image, roi)
+
+            if lector and time.monotonic() - ultimo_informe >= 10:
+                stats = lector.estadisticas()
+                print(f"FPS cámara: {stats['fps_camara']:.1f} | FPS procesados: {stats['fps_efectivos']:.1f} | "
+                      f"descartados: {stats['descartados']} | decodificación: {stats['decodificacion_ms']:.1f} ms | "
+                      f"latencia: {stats['latencia_ms']:.1f} ms")
+                lector.reiniciar_estadisticas()
+                ultimo_informe = time.monotonic()
+
+            if mostrar_ventanas and cv2.waitKey(1) & 0xFF == ord('q'):
                 break
-        else:
-            print("Error al obtener la imagen.")
-    except Exception as e:
-        print(f"Error: {e}")
+        except Exception as e:
+            print(f"Error: {e}")
+
+    if lector:
+        lector.detener()
+    if mostrar_ventanas:
+        cv2.destroyAllWindows()
+
 
-cv2.destroyAllWindows()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,96 @@
+import os
+
+
+def _entero(nombre, defecto):
+    return int(os.environ.get(nombre, defecto))
+
+
 class Config:
-    SQLALCHEMY_DATABASE_URI = 'mysql+pymysql://root@localhost:3306/python'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'mysql+pymysql://root@localhost:3306/python')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SECRET_KEY = "CLAVE SEGURA"
-    
\ No newline at end of file
+    SECRET_KEY = os.environ.get('SECRET_KEY', "CLAVE SEGURA")
+    # Parking que atiende esta instalación por defecto (entradas sin 'sitio', migración de plazas)
+    SITIO = os.environ.get('PARKEASE_SITIO', 'principal')
+    # Historial de parking_log: días que se quedan en la tabla y carpeta de los CSV archivados
+    DIAS_RETENCION_LOG = 90
+    CARPETA_ARCHIVO_LOG = 'archivo_parking_log'
+
+    # Pool de conexiones. pool_recycle por debajo del wait_timeout de MySQL y
+    # pool_pre_ping para no usar conexiones que el servidor ya ha cerrado
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': _entero('DB_POOL_SIZE', 5),
+        'max_overflow': _entero('DB_MAX_OVERFLOW', 10),
+        'pool_recycle': _entero('DB_POOL_RECYCLE', 1800),
+        'pool_timeout': _entero('DB_POOL_TIMEOUT', 30),
+        'pool_pre_ping': True,
+    }
+    # Conexiones que se abren al arrancar para que las primeras peticiones no esperen
+    DB_POOL_CALENTAR = _entero('DB_POOL_CALENTAR', 0)
+
+    # Servidor WSGI de producción (wsgi.py)
+    SERVIDOR_HOST = os.environ.get('SERVIDOR_HOST', '0.0.0.0')
+    SERVIDOR_PUERTO = _entero('SERVIDOR_PUERTO', 81)
+    # Hilos para las peticiones normales (barrera, páginas, API). Los streams SSE van
+    # aparte: wsgi.py arranca SERVIDOR_HILOS + SSE_MAX_CLIENTES hilos, de modo que los
+    # paneles abiertos nunca dejan sin hilo a /api/entrada
+    SERVIDOR_HILOS = _entero('SERVIDOR_HILOS', 16)
+    # Los paneles reciben los cambios por SSE desde el servidor asyncio de la ingesta
+    # (INGESTA_PUERTO), donde un stream no ocupa ningún hilo. Máximo de streams allí:
+    SSE_MAX_CLIENTES_INGESTA = _entero('SSE_MAX_CLIENTES_INGESTA', 500)
+    # URL del stream para los navegadores si no llegan directamente a INGESTA_PUERTO
+    # (p. ej. detrás de un proxy con HTTPS); por defecto, ese puerto en el mismo host
+    SSE_URL = os.environ.get('PARKEASE_SSE_URL')
+    # Streams servidos por Flask cuando la ingesta no está activa. Cada uno ocupa un hilo
+    # de waitress mientras está abierto; por encima de este número se responde 503
+    SSE_MAX_CLIENTES = _entero('SSE_MAX_CLIENTES', 8)
+    # Servidor asyncio que recibe las lecturas de los ESP32 (app/ingesta.py). Lo arranca
+    # create_app() solo si PARKEASE_INGESTA=1: wsgi.py y main.py lo activan, y así los
+    # comandos de flask (archivar-log...) y las pruebas no abren los puertos 8081/8082
+    INGESTA_ACTIVA = os.environ.get('PARKEASE_INGESTA', '0') == '1'
+    INGESTA_PUERTO = _entero('INGESTA_PUERTO', 8081)
+    # Tramas binarias de los sensores por UDP (0 para desactivarlo)
+    INGESTA_PUERTO_UDP = _entero('INGESTA_PUERTO_UDP', 8082)
+    # Segundos sin lecturas tras los que un sensor se marca como inactivo (3 latidos)
+    SENSOR_INACTIVO_SEGUNDOS = _entero('SENSOR_INACTIVO_SEGUNDOS', 90)
+    # Reserva de plaza en las entradas: 'skip_locked', 'condicional' (UPDATE ... AND ocupada = false)
+    # o 'auto' (SKIP LOCKED si la base de datos lo admite)
+    ASIGNACION_PLAZAS = os.environ.get('PARKEASE_ASIGNACION_PLAZAS', 'auto')
+    # Cada cuántos segundos se recogen los cambios de plazas de otros procesos (0 = nunca).
+    # Hace falta con varios workers para que /api/ocupacion coincida en todos
+    OCUPACION_RESINCRONIZAR_SEGUNDOS = _entero('OCUPACION_RESINCRONIZAR_SEGUNDOS', 0)
+    # Distancia OCR máxima para aceptar una matrícula leída con errores (ver app/matriculas.py).
+    # 0.5 = un carácter confundido con otro de su grupo (0/O/D, 8/B...); subirlo admite errores cualquiera
+    MATRICULA_UMBRAL_OCR = float(os.environ.get('MATRICULA_UMBRAL_OCR', 0.5))
+    # Cada cuántos segundos se recargan en segundo plano las matrículas registradas (0 = nunca)
+    MATRICULAS_RECARGA_SEGUNDOS = _entero('MATRICULAS_RECARGA_SEGUNDOS', 60)
+    # Perfil de las sentencias SQL por petición (/api/perfil-sql); solo en desarrollo o canary
+    PERFIL_SQL = os.environ.get('PARKEASE_PERFIL_SQL') == '1'
+    # Sentencias iguales desde la misma línea a partir de las que se avisa de un N+1
+    PERFIL_SQL_UMBRAL = _entero('PERFIL_SQL_UMBRAL', 3)
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+
+class ProductionConfig(Config):
+    # Cada hilo del servidor puede tener su conexión sin pasar al overflow
+    SQLALCHEMY_ENGINE_OPTIONS = dict(
+        Config.SQLALCHEMY_ENGINE_OPTIONS,
+        pool_size=_entero('DB_POOL_SIZE', Config.SERVIDOR_HILOS),
+        max_overflow=_entero('DB_MAX_OVERFLOW', 8),
+    )
+    DB_POOL_CALENTAR = _entero('DB_POOL_CALENTAR', 4)
+    OCUPACION_RESINCRONIZAR_SEGUNDOS = _entero('OCUPACION_RESINCRONIZAR_SEGUNDOS', 5)
+
+
+CONFIGURACIONES = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+}
+
+
+def obtener_config(entorno=None):
+    """Clase de configuración para el entorno indicado o el de PARKEASE_ENV (development por defecto)."""
+    entorno = entorno or os.environ.get('PARKEASE_ENV', 'development')
+    return CONFIGURACIONES.get(entorno, Config)
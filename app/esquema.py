@@ -0,0 +1,102 @@
+from sqlalchemy import inspect, text
+
+from . import db
+from .matriculas import normalizar_matricula
+from .models import EstadisticaParking, Nivel, Plaza
+
+
+def _columnas(inspector, tabla):
+    return {columna['name'] for columna in inspector.get_columns(tabla)}
+
+
+def _indices(inspector, tabla):
+    return {indice['name'] for indice in inspector.get_indexes(tabla)}
+
+
+# Tablas por planta anteriores a la tabla plazas: (tabla, código, nombre, orden)
+TABLAS_ANTIGUAS = (
+    ('parking_inferior', 'PI', 'Parking inferior', 1),
+    ('parking_superior', 'PS', 'Parking superior', 2),
+)
+
+
+def actualizar_esquema(app):
+    """Añade a una base de datos existente las columnas e índices que faltan.
+
+    La aplicación no usa migraciones: las tablas se crean a mano en MySQL, así que
+    al arrancar se comprueba el esquema y se completa lo que haga falta.
+    """
+    with app.app_context():
+        try:
+            inspector = inspect(db.engine)
+            if not inspector.has_table('parking_estadisticas'):
+                print("🔧 Creando la tabla parking_estadisticas")
+                EstadisticaParking.__table__.create(db.engine)
+
+            if not inspector.has_table('plazas'):
+                migrar_plazas(inspector, app.config.get('SITIO', 'principal'))
+
+            if inspector.has_table('plazas') and 'matricula' not in _columnas(inspector, 'plazas'):
+                print("🔧 Añadiendo la columna plazas.matricula")
+                with db.engine.begin() as conexion:
+                    conexion.execute(text("ALTER TABLE plazas ADD COLUMN matricula VARCHAR(255)"))
+
+            if inspector.has_table('vehiculos') and 'matricula_normalizada' not in _columnas(inspector, 'vehiculos'):
+                print("🔧 Añadiendo la columna vehiculos.matricula_normalizada")
+                with db.engine.begin() as conexion:
+                    conexion.execute(text("ALTER TABLE vehiculos ADD COLUMN matricula_normalizada VARCHAR(255)"))
+                    filas = conexion.execute(text("SELECT id, matricula FROM vehiculos")).all()
+                    valores = [
+                        {"id": id_vehiculo, "normalizada": normalizar_matricula(matricula) or None}
+                        for id_vehiculo, matricula in filas
+                    ]
+                    if valores:
+                        conexion.execute(
+                            text("UPDATE vehiculos SET matricula_normalizada = :normalizada WHERE id = :id"),
+                            valores
+                        )
+
+            crear_indices()
+        except Exception as e:
+            print(f"❌ Error al actualizar el esquema de la base de datos: {e}")
+
+
+def crear_indices():
+    """Crea los índices declarados en los modelos que todavía no existan en la base de datos."""
+    inspector = inspect(db.engine)
+    for tabla in db.metadata.sorted_tables:
+        if not inspector.has_table(tabla.name):
+            continue
+        existentes = _indices(inspector, tabla.name)
+        for indice in tabla.indexes:
+            if indice.name not in existentes:
+                print(f"🔧 Creando el índice {indice.name}")
+                indice.create(db.engine)
+
+
+def migrar_plazas(inspector, sitio):
+    """Crea niveles y plazas y copia en ellas las plazas de parking_inferior y parking_superior.
+
+    Los niveles antiguos conservan los códigos PI y PS (id 1 y 2, los códigos de las
+    tramas UDP). Las tablas antiguas no se borran.
+    """
+    print("🔧 Creando las tablas niveles y plazas")
+    Nivel.__table__.create(db.engine, checkfirst=True)
+    Plaza.__table__.create(db.engine)
+
+    with db.engine.begin() as conexion:
+        for id_nivel, (tabla, codigo, nombre, orden) in enumerate(TABLAS_ANTIGUAS, 1):
+            if not inspector.has_table(tabla):
+                continue
+            print(f"🔧 Copiando las plazas de {tabla} al nivel {codigo}")
+            existe = conexion.execute(
+                Nivel.__table__.select().where(Nivel.__table__.c.codigo == codigo)
+            ).first()
+            if not existe:
+                conexion.execute(Nivel.__table__.insert().values(
+                    id=id_nivel, sitio=sitio, codigo=codigo, nombre=nombre, orden=orden
+                ))
+            conexion.execute(text(
+                f"INSERT INTO plazas (sitio, nivel, numero, ocupada) "
+                f"SELECT :sitio, :nivel, numero, COALESCE(ocupada, 0) FROM {tabla}"
+            ), {"sitio": sitio, "nivel": codigo})
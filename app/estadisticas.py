@@ -0,0 +1,212 @@
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .models import EstadisticaParking, ParkingLog
+from .ocupacion import ocupacion
+
+
+PERIODOS = ('minuto', 'hora')
+
+# Límite superior (en segundos) de cada barra del histograma de estancias
+HISTOGRAMA_ESTANCIAS = (
+    (15 * 60, 'estancia_15m'),
+    (60 * 60, 'estancia_1h'),
+    (3 * 60 * 60, 'estancia_3h'),
+    (8 * 60 * 60, 'estancia_8h'),
+    (24 * 60 * 60, 'estancia_24h'),
+    (None, 'estancia_mas'),
+)
+
+
+def inicio_periodo(momento, periodo):
+    if periodo == 'minuto':
+        return momento.replace(second=0, microsecond=0)
+    return momento.replace(minute=0, second=0, microsecond=0)
+
+
+def barra_estancia(segundos):
+    for limite, campo in HISTOGRAMA_ESTANCIAS:
+        if limite is None or segundos < limite:
+            return campo
+
+
+class AgregadorEstadisticas:
+    """Mantiene los acumulados por minuto y por hora de la tabla parking_estadisticas.
+
+    Las entradas y salidas se cuentan en memoria al producirse y un hilo las suma a
+    la tabla cada `intervalo` segundos (UPDATE ... SET n = n + :n, así varios
+    procesos pueden acumular sobre las mismas filas). En cada volcado se guarda
+    también la ocupación actual de cada nivel, y con cada entrada el pico de
+    ocupación. Así las consultas de estadísticas nunca recorren parking_log.
+    """
+
+    def __init__(self, intervalo=10):
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._lock_volcado = threading.Lock()
+        self._pendientes = {}
+        self._maximos = {}
+
+    def init_app(self, app):
+        def bucle():
+            with app.app_context():
+                try:
+                    self.reconstruir_si_vacia()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"❌ Error al reconstruir las estadísticas: {e}")
+            while True:
+                time.sleep(self.intervalo)
+                with app.app_context():
+                    try:
+                        self.volcar()
+                    except Exception as e:
+                        db.session.rollback()
+                        print(f"❌ Error al guardar las estadísticas: {e}")
+
+        threading.Thread(target=bucle, daemon=True).start()
+
+    def _sumar(self, nivel, momento, campo):
+        with self._lock:
+            for periodo in PERIODOS:
+                for n in (nivel, 'TOTAL'):
+                    if n:
+                        clave = (periodo, inicio_periodo(momento, periodo), n)
+                        self._pendientes.setdefault(clave, Counter())[campo] += 1
+
+    def registrar_entrada(self, nivel, momento):
+        self._sumar(nivel, momento, 'entradas')
+        self._observar_ocupacion(momento)
+
+    def _observar_ocupacion(self, momento):
+        # Los picos de ocupación entre dos volcados se guardan aparte
+        resumen = ocupacion.resumen()
+        resumen['TOTAL'] = {"ocupadas": sum(r["ocupadas"] for r in resumen.values())}
+        with self._lock:
+            for nivel, datos in resumen.items():
+                for periodo in PERIODOS:
+                    clave = (periodo, inicio_periodo(momento, periodo), nivel)
+                    self._maximos[clave] = max(self._maximos.get(clave, 0), datos["ocupadas"])
+
+    def registrar_salida(self, nivel, tiempo_entrada, tiempo_salida):
+        self._sumar(nivel, tiempo_salida, 'salidas')
+        if tiempo_entrada:
+            segundos = (tiempo_salida - tiempo_entrada).total_seconds()
+            self._sumar(nivel, tiempo_salida, barra_estancia(segundos))
+
+    def volcar(self, con_ocupacion=True):
+        """Suma a la tabla lo acumulado en memoria y guarda la ocupación actual."""
+        with self._lock_volcado:
+            with self._lock:
+                pendientes, self._pendientes = self._pendientes, {}
+                maximos, self._maximos = self._maximos, {}
+
+            ocupadas = {}
+            if con_ocupacion:
+                ahora = datetime.now()
+                resumen = ocupacion.resumen()
+                resumen['TOTAL'] = {"ocupadas": sum(r["ocupadas"] for r in resumen.values())}
+                for nivel, datos in resumen.items():
+                    for periodo in PERIODOS:
+                        clave = (periodo, inicio_periodo(ahora, periodo), nivel)
+                        ocupadas[clave] = datos["ocupadas"]
+                        pendientes.setdefault(clave, Counter())
+            for clave in maximos:
+                pendientes.setdefault(clave, Counter())
+
+            for clave, contadores in pendientes.items():
+                self._acumular(clave, contadores, ocupadas.get(clave), maximos.get(clave))
+            db.session.commit()
+
+    def _acumular(self, clave, contadores, ocupadas, maximo=None):
+        tabla = EstadisticaParking.__table__
+        periodo, inicio, nivel = clave
+        valores = {campo: tabla.c[campo] + n for campo, n in contadores.items()}
+        if ocupadas is not None:
+            valores['ocupadas'] = ocupadas
+        maximo = max(m for m in (ocupadas, maximo, 0) if m is not None)
+        if ocupadas is not None or maximo:
+            valores['ocupadas_max'] = db.case(
+                (tabla.c.ocupadas_max < maximo, maximo), else_=tabla.c.ocupadas_max
+            )
+        if not valores:
+            return
+
+        condicion = (tabla.c.periodo == periodo) & (tabla.c.inicio == inicio) & (tabla.c.nivel == nivel)
+        for _ in range(2):
+            if db.session.execute(tabla.update().where(condicion).values(**valores)).rowcount:
+                return
+            fila = {columna.name: 0 for columna in tabla.columns if columna.name not in ('periodo', 'inicio', 'nivel')}
+            fila.update(contadores)
+            if ocupadas is not None:
+                fila['ocupadas'] = ocupadas
+            fila['ocupadas_max'] = maximo
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(tabla.insert().values(periodo=periodo, inicio=inicio, nivel=nivel, **fila))
+                return
+            except IntegrityError:
+                # Otro proceso ha creado la fila a la vez: se vuelve a intentar el UPDATE
+                continue
+
+    def reconstruir_si_vacia(self):
+        """Calcula los acumulados a partir de parking_log si la tabla está vacía (primer arranque)."""
+        if db.session.query(EstadisticaParking.periodo).first() is not None:
+            return
+        print("🔧 Calculando las estadísticas a partir del historial de parking_log")
+        consulta = db.session.query(ParkingLog.tiempo_entrada, ParkingLog.tiempo_salida)
+        for tiempo_entrada, tiempo_salida in consulta.yield_per(1000):
+            if tiempo_entrada:
+                self._sumar(None, tiempo_entrada, 'entradas')
+            if tiempo_salida:
+                self.registrar_salida(None, tiempo_entrada, tiempo_salida)
+        self.volcar(con_ocupacion=False)
+
+    def consultar(self, periodo, desde, hasta, nivel=None):
+        """Acumulados del periodo en [desde, hasta] como diccionarios (ver EstadisticaParking.to_dict).
+
+        No escribe nada: a las filas de la tabla se les suma lo que este proceso aún no
+        ha volcado. Se lee con el lock del volcado para que un volcado a medias no
+        cuente dos veces (o ninguna) lo que está guardando.
+        """
+        inicio = inicio_periodo(desde, periodo)
+
+        def en_rango(clave):
+            return clave[0] == periodo and inicio <= clave[1] <= hasta and (not nivel or clave[2] == nivel)
+
+        consulta = EstadisticaParking.query.filter(
+            EstadisticaParking.periodo == periodo,
+            EstadisticaParking.inicio >= inicio,
+            EstadisticaParking.inicio <= hasta
+        )
+        if nivel:
+            consulta = consulta.filter(EstadisticaParking.nivel == nivel)
+
+        with self._lock_volcado:
+            filas = {(fila.periodo, fila.inicio, fila.nivel): fila.to_dict() for fila in consulta}
+            with self._lock:
+                pendientes = {clave: Counter(c) for clave, c in self._pendientes.items() if en_rango(clave)}
+                maximos = {clave: m for clave, m in self._maximos.items() if en_rango(clave)}
+
+        for clave in set(pendientes) | set(maximos):
+            if clave not in filas:
+                vacia = {columna.name: 0 for columna in EstadisticaParking.__table__.columns}
+                vacia.update(periodo=clave[0], inicio=clave[1], nivel=clave[2])
+                filas[clave] = EstadisticaParking(**vacia).to_dict()
+            datos = filas[clave]
+            for campo, n in pendientes.get(clave, {}).items():
+                if campo.startswith('estancia_'):
+                    datos["estancias"][campo[len('estancia_'):]] += n
+                else:
+                    datos[campo] += n
+            datos["ocupadas_max"] = max(datos["ocupadas_max"], maximos.get(clave, 0))
+
+        return [filas[clave] for clave in sorted(filas, key=lambda clave: (clave[1], clave[2]))]
+
+
+estadisticas = AgregadorEstadisticas()
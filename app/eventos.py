@@ -0,0 +1,99 @@
+import asyncio
+import json
+import queue
+import threading
+
+
+class CanalEventos:
+    """Difunde los cambios de estado de las plazas a los clientes conectados por SSE.
+
+    Cada cliente tiene su propia cola acotada; si un cliente no consume a tiempo
+    se descartan sus eventos en lugar de bloquear a quien publica.
+
+    Los paneles se conectan normalmente al servidor asyncio de la ingesta
+    (suscribir_asincrono): allí un stream es una corrutina y no un hilo, así que
+    se admiten `max_clientes_asincronos` a la vez. La ruta de Flask queda para
+    cuando la ingesta no está activa; cada stream ocupa un hilo del servidor WSGI
+    durante toda la conexión, así que ahí se admiten como mucho `max_clientes` y
+    wsgi.py reserva esos hilos aparte de los que atienden la barrera y las páginas.
+    """
+
+    def __init__(self, max_pendientes=100, max_clientes=8, max_clientes_asincronos=500):
+        self._lock = threading.Lock()
+        self._suscriptores = set()
+        self._asincronos = {}
+        self._max_pendientes = max_pendientes
+        self.max_clientes = max_clientes
+        self.max_clientes_asincronos = max_clientes_asincronos
+
+    def init_app(self, app):
+        self.max_clientes = app.config.get('SSE_MAX_CLIENTES', self.max_clientes)
+        self.max_clientes_asincronos = app.config.get('SSE_MAX_CLIENTES_INGESTA', self.max_clientes_asincronos)
+
+    def suscribir(self):
+        """Nueva cola de eventos, o None si ya hay `max_clientes` streams abiertos."""
+        cola = queue.Queue(maxsize=self._max_pendientes)
+        with self._lock:
+            if self.max_clientes and len(self._suscriptores) >= self.max_clientes:
+                return None
+            self._suscriptores.add(cola)
+        return cola
+
+    def suscribir_asincrono(self):
+        """Cola asyncio para un stream servido desde el bucle de eventos actual, o None si está lleno."""
+        cola = asyncio.Queue(maxsize=self._max_pendientes)
+        with self._lock:
+            if self.max_clientes_asincronos and len(self._asincronos) >= self.max_clientes_asincronos:
+                return None
+            self._asincronos[cola] = asyncio.get_running_loop()
+        return cola
+
+    def cancelar(self, cola):
+        with self._lock:
+            self._suscriptores.discard(cola)
+            self._asincronos.pop(cola, None)
+
+    def suscriptores(self):
+        with self._lock:
+            return len(self._suscriptores) + len(self._asincronos)
+
+    def publicar(self, nivel, numero, ocupada):
+        mensaje = json.dumps({"nivel": nivel, "numero": numero, "ocupada": bool(ocupada)})
+        with self._lock:
+            suscriptores = list(self._suscriptores)
+            asincronos = list(self._asincronos.items())
+        for cola in suscriptores:
+            try:
+                cola.put_nowait(mensaje)
+            except queue.Full:
+                pass
+        # Se publica desde hilos de Flask o del escritor de sensores: la cola se llena en su bucle
+        for cola, bucle in asincronos:
+            try:
+                bucle.call_soon_threadsafe(self._entregar, cola, mensaje)
+            except RuntimeError:
+                self.cancelar(cola)
+
+    @staticmethod
+    def _entregar(cola, mensaje):
+        try:
+            cola.put_nowait(mensaje)
+        except asyncio.QueueFull:
+            pass
+
+    def escuchar(self, cola, latido=15):
+        """Generador de mensajes SSE para la cola de un cliente; envía un latido si no hay cambios."""
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    mensaje = cola.get(timeout=latido)
+                except queue.Empty:
+                    yield ": latido\n\n"
+                    continue
+                yield f"event: plaza\ndata: {mensaje}\n\n"
+        finally:
+            self.cancelar(cola)
+
+
+eventos = CanalEventos()
@@ -0,0 +1,433 @@
+import asyncio
+import json
+import queue
+import struct
+import threading
+import time
+from datetime import datetime
+
+from . import db
+from .eventos import eventos
+from .metricas import metricas
+from .ocupacion import ocupacion
+from .sensores import sensores
+
+
+# Protocolo UDP binario de los sensores (el cliente está en sensorPlaza/protocolo_udp.py).
+# Una trama lleva una cabecera de 5 bytes y 3 bytes por lectura:
+#   magia 'P', versión, secuencia (uint16), número de lecturas (uint8)
+#   por lectura: código de nivel (uint8), número de plaza (uint16, bit 15 = ocupada)
+# El código de nivel es el id del registro de niveles; el 0 es el sensor de proximidad de la entrada.
+MAGIA_TRAMA = 0x50
+VERSION_TRAMA = 1
+CABECERA_TRAMA = struct.Struct('>BBHB')
+LECTURA_TRAMA = struct.Struct('>BH')
+BIT_OCUPADA = 0x8000
+NIVEL_PUERTA = 'PUERTA'
+
+duracion_lote = metricas.histograma(
+    'parkease_ingesta_lote_segundos', 'Tiempo en guardar un lote de lecturas de sensores')
+
+
+def codigos_nivel():
+    """{código de trama: nivel} según el registro de niveles."""
+    codigos = {datos["id"]: datos["codigo"] for datos in ocupacion.niveles()}
+    codigos[0] = NIVEL_PUERTA
+    return codigos
+
+
+def codificar_trama(secuencia, lecturas, codigos=None):
+    """Trama binaria con las lecturas (nivel, numero, ocupada)."""
+    codigos = {nivel: codigo for codigo, nivel in (codigos or codigos_nivel()).items()}
+    trama = bytearray(CABECERA_TRAMA.pack(MAGIA_TRAMA, VERSION_TRAMA, secuencia & 0xFFFF, len(lecturas)))
+    for nivel, numero, ocupada in lecturas:
+        trama += LECTURA_TRAMA.pack(codigos[nivel], numero | (BIT_OCUPADA if ocupada else 0))
+    return bytes(trama)
+
+
+def decodificar_trama(datos, codigos=None):
+    """Devuelve (secuencia, [(nivel, numero, ocupada)]); lanza ValueError si la trama no es válida.
+
+    `codigos` es {código de trama: nivel}; por defecto, el registro de niveles actual.
+    """
+    if len(datos) < CABECERA_TRAMA.size:
+        raise ValueError("Trama demasiado corta")
+    magia, version, secuencia, cantidad = CABECERA_TRAMA.unpack_from(datos)
+    if magia != MAGIA_TRAMA or version != VERSION_TRAMA:
+        raise ValueError("Trama de otro protocolo o versión")
+    if len(datos) != CABECERA_TRAMA.size + cantidad * LECTURA_TRAMA.size:
+        raise ValueError("Longitud de trama incorrecta")
+
+    codigos = codigos or codigos_nivel()
+    lecturas = []
+    for i in range(cantidad):
+        codigo, valor = LECTURA_TRAMA.unpack_from(datos, CABECERA_TRAMA.size + i * LECTURA_TRAMA.size)
+        if codigo not in codigos:
+            raise ValueError(f"Código de nivel desconocido: {codigo}")
+        lecturas.append((codigos[codigo], valor & ~BIT_OCUPADA, bool(valor & BIT_OCUPADA)))
+    return secuencia, lecturas
+
+
+def secuencia_posterior(anterior, actual):
+    """Indica si `actual` es posterior a `anterior` teniendo en cuenta que la secuencia da la vuelta."""
+    return 0 < (actual - anterior) & 0xFFFF < 0x8000
+
+
+class EscritorSensores:
+    """Único escritor de las lecturas de los sensores de plaza.
+
+    Las lecturas llegan a una cola acotada y un hilo las aplica por lotes: espera
+    la primera, recoge las que lleguen durante `espera` segundos (hasta `max_lote`)
+    y las escribe con ocupacion.marcar_lote y un solo commit. Así miles de
+    lecturas por segundo se convierten en unos pocos UPDATE.
+    """
+
+    def __init__(self, max_lote=1000, espera=0.05, max_pendientes=20000):
+        self.max_lote = max_lote
+        self.espera = espera
+        self._cola = queue.Queue(maxsize=max_pendientes)
+        self._iniciado = False
+        self.contadores = {"recibidas": 0, "rechazadas": 0, "lotes": 0, "actualizadas": 0}
+
+    def init_app(self, app):
+        if self._iniciado:
+            return
+        self._iniciado = True
+        threading.Thread(target=self._bucle, args=(app,), daemon=True).start()
+
+    def encolar(self, lecturas):
+        """Añade lecturas (nivel, numero, ocupada); devuelve False si la cola está llena."""
+        sensores.visto_lote(lecturas)
+        try:
+            for lectura in lecturas:
+                self._cola.put_nowait(lectura)
+        except queue.Full:
+            self.contadores["rechazadas"] += 1
+            return False
+        self.contadores["recibidas"] += len(lecturas)
+        return True
+
+    def pendientes(self):
+        return self._cola.qsize()
+
+    def _recoger_lote(self):
+        lote = [self._cola.get()]
+        limite = time.monotonic() + self.espera
+        while len(lote) < self.max_lote:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(self._cola.get(timeout=restante))
+            except queue.Empty:
+                break
+        return lote
+
+    def _bucle(self, app):
+        while True:
+            lote = self._recoger_lote()
+            inicio = time.perf_counter()
+            with app.app_context():
+                try:
+                    cambios = ocupacion.marcar_lote(lote)
+                    if cambios:
+                        db.session.commit()
+                    for cambio in cambios:
+                        eventos.publicar(*cambio)
+                    self.contadores["lotes"] += 1
+                    self.contadores["actualizadas"] += len(cambios)
+                    duracion_lote.observar(time.perf_counter() - inicio)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"❌ Error al guardar un lote de {len(lote)} lecturas de sensores: {e}")
+
+
+class ServidorIngesta:
+    """Servidor HTTP asyncio para los ESP32, separado de los hilos que sirven la web.
+
+    Acepta las mismas peticiones que la aplicación (/sensor, /api/sensores/batch y
+    POST /sensorpuerta), valida contra el estado en memoria, encola las lecturas y
+    responde 202 sin tocar la base de datos. Corre en su propio hilo con su propio
+    bucle de eventos, así una ráfaga de sensores no compite con las páginas.
+
+    Las lecturas se validan contra una foto de los niveles y sus plazas que se toma
+    en el contexto de la aplicación antes de abrir los puertos (cargar_niveles):
+    en el bucle de eventos no hay contexto de Flask ni se puede esperar a la base
+    de datos. Los niveles solo se cargan al arrancar, así que la foto no caduca.
+
+    También sirve GET /api/plazas/stream (SSE) a los paneles: cada stream es una
+    corrutina esperando en su cola, no un hilo de waitress, así que decenas de
+    pantallas y móviles no quitan hilos a la barrera.
+    """
+
+    RUTAS = ('/sensor', '/api/sensores/batch', '/sensorpuerta')
+    RUTA_STREAM = '/api/plazas/stream'
+
+    def __init__(self, escritor, app=None, host='0.0.0.0', puerto=8081, puerto_udp=None, max_cuerpo=256 * 1024,
+                 latido_sse=15):
+        self.escritor = escritor
+        self.app = app
+        self.host = host
+        self.puerto = puerto
+        self.puerto_udp = puerto_udp
+        self.max_cuerpo = max_cuerpo
+        self.latido_sse = latido_sse
+        self.codigos = {}
+        self._plazas = {}
+
+    def cargar_niveles(self):
+        """Toma la foto de los niveles (códigos de trama y plazas existentes) en el contexto de la app."""
+        with self.app.app_context():
+            self._plazas = ocupacion.mapa_plazas()
+            self.codigos = codigos_nivel()
+
+    def existe(self, nivel, numero):
+        plazas = self._plazas.get(nivel)
+        return plazas is not None and numero >= 0 and bool(plazas >> numero & 1)
+
+    def iniciar(self):
+        hilo = threading.Thread(target=asyncio.run, args=(self._servir(),), daemon=True)
+        hilo.start()
+        return hilo
+
+    async def _servir(self):
+        # Sin la foto de los niveles no se puede validar nada: se reintenta hasta que haya base de datos
+        while True:
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.cargar_niveles)
+                break
+            except Exception as e:
+                print(f"❌ La ingesta de sensores no ha podido cargar los niveles, se reintenta: {e}")
+                await asyncio.sleep(5)
+        try:
+            servidor = await asyncio.start_server(self._atender, self.host, self.puerto)
+            print(f"📡 Ingesta de sensores escuchando en {self.host}:{self.puerto}")
+            if self.puerto_udp:
+                await asyncio.get_running_loop().create_datagram_endpoint(
+                    lambda: ReceptorUDP(self), local_addr=(self.host, self.puerto_udp)
+                )
+                print(f"📡 Ingesta UDP de sensores escuchando en {self.host}:{self.puerto_udp}")
+        except OSError as e:
+            # Con varios workers solo uno consigue el puerto; en los demás es normal
+            print(f"❌ La ingesta de sensores no ha podido abrir el puerto {self.puerto}/{self.puerto_udp}: {e}")
+            return
+        async with servidor:
+            await servidor.serve_forever()
+
+    async def _atender(self, lector, escritor):
+        try:
+            while True:
+                try:
+                    cabecera = await lector.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+
+                lineas = cabecera.decode('latin-1').split('\r\n')
+                try:
+                    metodo, ruta, version = lineas[0].split(' ', 2)
+                except ValueError:
+                    await self._responder(escritor, 400, {"error": "Petición inválida"}, False)
+                    break
+                cabeceras = {}
+                for linea in lineas[1:]:
+                    if ':' in linea:
+                        nombre, valor = linea.split(':', 1)
+                        cabeceras[nombre.strip().lower()] = valor.strip()
+
+                mantener = cabeceras.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                try:
+                    longitud = int(cabeceras.get('content-length') or 0)
+                except ValueError:
+                    longitud = -1
+                if longitud < 0:
+                    await self._responder(escritor, 400, {"error": "Content-Length inválido"}, False)
+                    break
+                if longitud > self.max_cuerpo:
+                    await self._responder(escritor, 413, {"error": "Petición demasiado grande"}, False)
+                    break
+                cuerpo = await lector.readexactly(longitud) if longitud else b''
+
+                if metodo == 'GET' and ruta.split('?', 1)[0] == self.RUTA_STREAM:
+                    await self._stream(lector, escritor)
+                    break
+                estado, respuesta = self.procesar(metodo, ruta.split('?', 1)[0], cuerpo)
+                await self._responder(escritor, estado, respuesta, mantener)
+                if not mantener:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            escritor.close()
+
+    async def _responder(self, escritor, estado, datos, mantener, cabeceras=None):
+        cuerpo = json.dumps(datos).encode()
+        extra = ''.join(f"{nombre}: {valor}\r\n" for nombre, valor in (cabeceras or {}).items())
+        escritor.write(
+            f"HTTP/1.1 {estado} {self._razon(estado)}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(cuerpo)}\r\n"
+            f"{extra}"
+            f"Connection: {'keep-alive' if mantener else 'close'}\r\n\r\n".encode() + cuerpo
+        )
+        await escritor.drain()
+
+    async def _stream(self, lector, escritor):
+        """Server-Sent Events con los cambios de plaza hasta que el cliente se desconecta."""
+        # Los paneles se cargan desde el puerto de la web: el stream es de otro origen
+        cola = eventos.suscribir_asincrono()
+        if cola is None:
+            await self._responder(escritor, 503, {"error": "Demasiados clientes conectados"}, False,
+                                  {'Access-Control-Allow-Origin': '*', 'Retry-After': '30'})
+            return
+        # El cliente no envía nada más: la lectura termina cuando cierra la conexión
+        cierre = asyncio.ensure_future(lector.read())
+        siguiente = None
+        try:
+            escritor.write(
+                "HTTP/1.1 200 OK\r\n"
+                "Content-Type: text/event-stream\r\n"
+                "Cache-Control: no-cache\r\n"
+                "X-Accel-Buffering: no\r\n"
+                "Access-Control-Allow-Origin: *\r\n"
+                "Connection: close\r\n\r\n"
+                "retry: 3000\n\n".encode()
+            )
+            await escritor.drain()
+            while not cierre.done():
+                siguiente = siguiente or asyncio.ensure_future(cola.get())
+                await asyncio.wait({siguiente, cierre}, timeout=self.latido_sse,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if cierre.done():
+                    break
+                if siguiente.done():
+                    escritor.write(f"event: plaza\ndata: {siguiente.result()}\n\n".encode())
+                    siguiente = None
+                else:
+                    escritor.write(b": latido\n\n")
+                await escritor.drain()
+        finally:
+            eventos.cancelar(cola)
+            cierre.cancel()
+            if siguiente:
+                siguiente.cancel()
+
+    @staticmethod
+    def _razon(estado):
+        return {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found',
+                413: 'Payload Too Large', 503: 'Service Unavailable'}.get(estado, '')
+
+    def procesar(self, metodo, ruta, cuerpo):
+        """Devuelve (código HTTP, respuesta) para una petición de un sensor."""
+        if metodo != 'POST' or ruta not in self.RUTAS:
+            return 404, {"error": "Ruta no encontrada"}
+        try:
+            data = json.loads(cuerpo or b'null')
+        except ValueError:
+            return 400, {"error": "JSON inválido"}
+
+        if ruta == '/sensorpuerta':
+            return self._puerta(data)
+
+        lecturas_recibidas = data if ruta == '/api/sensores/batch' else [data]
+        if not isinstance(lecturas_recibidas, list):
+            return 400, {"error": "Se esperaba una lista de lecturas"}
+
+        from .routes import estado_ocupada, ids_lectura
+
+        lecturas = []
+        desconocidas = []
+        for lectura in lecturas_recibidas:
+            if not isinstance(lectura, dict) or not {"sensorID", "plazaID", "estado"} <= lectura.keys():
+                return 400, {"error": "Datos inválidos"}
+            try:
+                sensor_id, plaza_id = ids_lectura(lectura)
+            except ValueError as e:
+                return 400, {"error": "Formato de datos inválido", "detalle": str(e)}
+            if not self.existe(sensor_id, plaza_id):
+                desconocidas.append({"sensorID": sensor_id, "plazaID": plaza_id})
+                continue
+            lecturas.append((sensor_id, plaza_id, estado_ocupada(lectura["estado"])))
+
+        if ruta == '/sensor' and desconocidas:
+            return 404, {"error": "Plaza no encontrada"}
+        if not self.escritor.encolar(lecturas):
+            return 503, {"error": "Cola de lecturas llena, reintentar"}
+        return 202, {"success": "Lecturas encoladas", "encoladas": len(lecturas), "desconocidas": desconocidas}
+
+    def _puerta(self, data):
+        if not isinstance(data, dict) or data.get("sensorID") is None or data.get("estado") is None:
+            return 400, {"error": "Datos inválidos"}
+        self.actualizar_puerta(data["estado"])
+        return 200, {"mensaje": "Datos recibidos correctamente"}
+
+    @staticmethod
+    def actualizar_puerta(estado):
+        from .routes import puerta_status
+
+        puerta_status["estado"] = estado
+        puerta_status["tiempo"] = datetime.now()
+        sensores.visto(NIVEL_PUERTA, 0)
+
+
+class ReceptorUDP(asyncio.DatagramProtocol):
+    """Recibe las tramas binarias de los sensores y las pasa al escritor por lotes.
+
+    Se descartan las tramas repetidas o que llegan desordenadas según la secuencia
+    de cada emisor; si un emisor lleva `reinicio` segundos callado (p. ej. se ha
+    reiniciado y su secuencia vuelve a 0) se acepta su siguiente trama sin comparar.
+    """
+
+    def __init__(self, servidor, reinicio=30):
+        self.servidor = servidor
+        self.reinicio = reinicio
+        self._ultima = {}
+        self.contadores = {"tramas": 0, "invalidas": 0, "descartadas": 0}
+
+    def datagram_received(self, datos, direccion):
+        try:
+            secuencia, lecturas = decodificar_trama(datos, self.servidor.codigos)
+        except ValueError:
+            self.contadores["invalidas"] += 1
+            return
+
+        emisor = direccion[0]
+        ahora = time.monotonic()
+        anterior = self._ultima.get(emisor)
+        if anterior and ahora - anterior[1] < self.reinicio and not secuencia_posterior(anterior[0], secuencia):
+            self.contadores["descartadas"] += 1
+            return
+        self._ultima[emisor] = (secuencia, ahora)
+        self.contadores["tramas"] += 1
+
+        plazas = []
+        for nivel, numero, ocupada in lecturas:
+            if nivel == NIVEL_PUERTA:
+                self.servidor.actualizar_puerta("detecto" if ocupada else "no_deteccion")
+            elif self.servidor.existe(nivel, numero):
+                plazas.append((nivel, numero, ocupada))
+        if plazas:
+            self.servidor.escritor.encolar(plazas)
+
+
+escritor_sensores = EscritorSensores()
+_hilo_servidor = None
+
+
+def init_app(app):
+    """Arranca el escritor por lotes y el servidor de ingesta (HTTP en INGESTA_PUERTO, UDP en INGESTA_PUERTO_UDP).
+
+    Lo llama create_app() si INGESTA_ACTIVA está activado; solo se arranca una vez por proceso.
+    """
+    global _hilo_servidor
+    if _hilo_servidor is not None:
+        return _hilo_servidor
+    escritor_sensores.init_app(app)
+    servidor = ServidorIngesta(
+        escritor_sensores,
+        app,
+        host=app.config.get('SERVIDOR_HOST', '0.0.0.0'),
+        puerto=app.config.get('INGESTA_PUERTO', 8081),
+        puerto_udp=app.config.get('INGESTA_PUERTO_UDP')
+    )
+    _hilo_servidor = servidor.iniciar()
+    return _hilo_servidor
@@ -0,0 +1,215 @@
+import threading
+import time
+
+from . import db
+
+
+def normalizar_matricula(matricula):
+    """Forma canónica de una matrícula: solo letras y números, en mayúsculas.
+
+    Así "1234 abc", "1234-ABC" y la lectura OCR "1234ABC." se comparan igual.
+    """
+    if not matricula:
+        return ''
+    return ''.join(c for c in str(matricula) if c.isalnum()).upper()
+
+
+# Caracteres que el OCR confunde entre sí; sustituir uno por otro del mismo grupo cuesta la mitad
+GRUPOS_CONFUSION = ("0ODQ", "1IL", "2Z", "4A", "5S", "6G", "7T", "8B")
+COSTE_CONFUSION = 0.5
+
+_grupo_de = {c: grupo[0] for grupo in GRUPOS_CONFUSION for c in grupo}
+
+
+def esqueleto_matricula(canonica):
+    """Sustituye cada carácter por el representante de su grupo de confusión."""
+    return ''.join(_grupo_de.get(c, c) for c in canonica)
+
+
+def distancia_ocr(a, b, limite=None):
+    """Distancia de edición ponderada según las confusiones típicas del OCR.
+
+    Insertar o borrar cuesta 1; sustituir cuesta 1, o COSTE_CONFUSION si los dos
+    caracteres son del mismo grupo. Si se pasa `limite`, deja de calcular en cuanto
+    la distancia lo supera.
+    """
+    if a == b:
+        return 0.0
+    if limite is not None and abs(len(a) - len(b)) > limite:
+        return abs(len(a) - len(b))
+
+    anterior = [float(j) for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, 1):
+        actual = [float(i)]
+        grupo_a = _grupo_de.get(ca, ca)
+        for j, cb in enumerate(b, 1):
+            if ca == cb:
+                sustitucion = 0.0
+            elif grupo_a == _grupo_de.get(cb, cb):
+                sustitucion = COSTE_CONFUSION
+            else:
+                sustitucion = 1.0
+            actual.append(min(anterior[j] + 1, actual[j - 1] + 1, anterior[j - 1] + sustitucion))
+        if limite is not None and min(actual) > limite:
+            return min(actual)
+        anterior = actual
+    return anterior[-1]
+
+
+def borrados(palabra):
+    """La palabra y todas las variantes que resultan de borrarle un carácter."""
+    return {palabra} | {palabra[:i] + palabra[i + 1:] for i in range(len(palabra))}
+
+
+class IndiceBorrados:
+    """Índice de borrados simétricos sobre el esqueleto de confusión de las matrículas.
+
+    Cada matrícula se indexa por su esqueleto y por los esqueletos con un carácter
+    borrado. Una lectura con una inserción, un borrado o una sustitución cualquiera
+    (además de las confusiones, que el esqueleto ya absorbe) comparte al menos una
+    clave con la matrícula registrada, así que una búsqueda son len(lectura) + 1
+    consultas a un diccionario, sin recorrer todas las matrículas.
+    """
+
+    def __init__(self):
+        self._claves = {}
+
+    def agregar(self, canonica):
+        for clave in borrados(esqueleto_matricula(canonica)):
+            self._claves.setdefault(clave, set()).add(canonica)
+
+    def eliminar(self, canonica):
+        for clave in borrados(esqueleto_matricula(canonica)):
+            grupo = self._claves.get(clave)
+            if grupo:
+                grupo.discard(canonica)
+                if not grupo:
+                    del self._claves[clave]
+
+    def candidatas(self, canonica):
+        encontradas = set()
+        for clave in borrados(esqueleto_matricula(canonica)):
+            encontradas |= self._claves.get(clave, set())
+        return encontradas
+
+    def buscar(self, canonica, umbral):
+        """Devuelve [(distancia, matricula)] con las matrículas a distancia <= umbral."""
+        resultados = []
+        for candidata in self.candidatas(canonica):
+            distancia = distancia_ocr(canonica, candidata, limite=umbral)
+            if distancia <= umbral:
+                resultados.append((distancia, candidata))
+        return resultados
+
+
+class RegistroMatriculas:
+    """Matrículas registradas en memoria, para que la barrera no consulte la base de datos.
+
+    Guarda la forma canónica -> matrícula tal como está en la tabla vehiculos.
+    Las rutas que crean, editan o borran vehículos lo actualizan al momento; además
+    un hilo lo recarga cada `recarga` segundos para recoger cambios hechos por otros
+    procesos, fuera de las peticiones: buscar() solo consulta la base de datos si
+    todavía no se ha cargado nunca.
+
+    Las lecturas OCR con errores se resuelven con IndiceBorrados y distancia_ocr:
+    se acepta la matrícula más cercana a distancia <= `umbral`, y nunca si hay empate.
+    El umbral por defecto (COSTE_CONFUSION) solo admite cambiar un carácter por otro
+    de su grupo de confusión: con 1.0 bastaría cualquier error de un carácter, y una
+    matrícula sin registrar podría entrar (o cerrar la sesión de otro) con la de otro.
+    """
+
+    def __init__(self, recarga=60, umbral=COSTE_CONFUSION):
+        self._lock = threading.Lock()
+        self._matriculas = {}
+        self._indice = IndiceBorrados()
+        self._cargado_en = None
+        self.recarga = recarga
+        self.umbral = umbral
+
+    def init_app(self, app):
+        self.umbral = app.config.get('MATRICULA_UMBRAL_OCR', self.umbral)
+        self.recarga = app.config.get('MATRICULAS_RECARGA_SEGUNDOS', self.recarga)
+        with app.app_context():
+            try:
+                self.cargar()
+            except Exception as e:
+                print(f"❌ Error al cargar las matrículas registradas: {e}")
+
+        if self.recarga > 0:
+            threading.Thread(target=self._bucle_recargar, args=(app,), daemon=True).start()
+
+    def _bucle_recargar(self, app):
+        while True:
+            time.sleep(self.recarga)
+            with app.app_context():
+                try:
+                    self.cargar()
+                except Exception as e:
+                    print(f"❌ Error al recargar las matrículas registradas: {e}")
+
+    def cargar(self):
+        from .models import Vehiculo
+
+        matriculas = {}
+        for (matricula,) in db.session.query(Vehiculo.matricula).filter(Vehiculo.matricula.isnot(None)):
+            canonica = normalizar_matricula(matricula)
+            if canonica:
+                matriculas[canonica] = matricula
+
+        # Aplicar solo las diferencias para no reconstruir los índices aproximados
+        with self._lock:
+            for canonica in set(self._matriculas) - set(matriculas):
+                self._quitar(canonica)
+            for canonica, matricula in matriculas.items():
+                if self._matriculas.get(canonica) != matricula:
+                    self._poner(canonica, matricula)
+            self._cargado_en = time.monotonic()
+
+    def _asegurar_cargado(self):
+        # Solo si falló la carga de init_app; las recargas periódicas las hace _bucle_recargar
+        if self._cargado_en is None:
+            self.cargar()
+
+    def _poner(self, canonica, matricula):
+        self._matriculas[canonica] = matricula
+        self._indice.agregar(canonica)
+
+    def _quitar(self, canonica):
+        if self._matriculas.pop(canonica, None) is not None:
+            self._indice.eliminar(canonica)
+
+    def buscar(self, matricula, aproximada=True):
+        """Devuelve la matrícula registrada que corresponde al texto recibido, o None.
+
+        Con `aproximada`, si no hay coincidencia exacta se acepta la matrícula más
+        cercana dentro del umbral, siempre que no haya empate con otra.
+        """
+        self._asegurar_cargado()
+        canonica = normalizar_matricula(matricula)
+        encontrada = self._matriculas.get(canonica)
+        if encontrada or not aproximada or not canonica:
+            return encontrada
+
+        with self._lock:
+            resultados = self._indice.buscar(canonica, self.umbral)
+            if not resultados:
+                return None
+
+            resultados.sort()
+            if len(resultados) > 1 and resultados[0][0] == resultados[1][0]:
+                return None
+            return self._matriculas.get(resultados[0][1])
+
+    def agregar(self, matricula):
+        canonica = normalizar_matricula(matricula)
+        if canonica:
+            with self._lock:
+                self._poner(canonica, matricula)
+
+    def eliminar(self, matricula):
+        canonica = normalizar_matricula(matricula)
+        with self._lock:
+            self._quitar(canonica)
+
+
+registro_matriculas = RegistroMatriculas()
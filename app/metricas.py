@@ -0,0 +1,252 @@
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Límites (en segundos) de los histogramas de latencia
+BUCKETS_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _etiquetas(nombres, valores, extra=None):
+    pares = list(zip(nombres, valores)) + (extra or [])
+    if not pares:
+        return ''
+    texto = ','.join(
+        f'{nombre}="{str(valor).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for nombre, valor in pares
+    )
+    return '{' + texto + '}'
+
+
+def _numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+        self._valores = {}
+
+    def inc(self, cantidad=1, **etiquetas):
+        clave = tuple(etiquetas.get(nombre, '') for nombre in self.etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def exponer(self):
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} counter']
+        with self._lock:
+            valores = sorted(self._valores.items())
+        for clave, valor in valores:
+            lineas.append(f'{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(valor)}')
+        return lineas
+
+
+class Histograma:
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_LATENCIA):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observar(self, valor, **etiquetas):
+        clave = tuple(etiquetas.get(nombre, '') for nombre in self.etiquetas)
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exponer(self):
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} histogram']
+        with self._lock:
+            series = sorted((clave, [list(s[0]), s[1], s[2]]) for clave, s in self._series.items())
+        for clave, (cuentas, suma, total) in series:
+            acumulado = 0
+            for limite, cuenta in zip(self.buckets + (float('inf'),), cuentas):
+                acumulado += cuenta
+                etiquetas = _etiquetas(self.etiquetas, clave, [('le', _numero(limite))])
+                lineas.append(f'{self.nombre}_bucket{etiquetas} {acumulado}')
+            lineas.append(f'{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {_numero(suma)}')
+            lineas.append(f'{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {total}')
+        return lineas
+
+
+class Indicador:
+    """Valor que se calcula al exponer las métricas (tamaño de una cola, plazas libres...).
+
+    `funcion` devuelve un número o un diccionario {valores de las etiquetas: número}.
+    """
+
+    def __init__(self, nombre, ayuda, funcion, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.funcion = funcion
+        self.etiquetas = tuple(etiquetas)
+
+    def exponer(self):
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} gauge']
+        try:
+            valor = self.funcion()
+        except Exception:
+            return lineas
+        if isinstance(valor, dict):
+            for clave, numero in sorted(valor.items()):
+                clave = clave if isinstance(clave, tuple) else (clave,)
+                lineas.append(f'{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(numero)}')
+        elif valor is not None:
+            lineas.append(f'{self.nombre} {_numero(valor)}')
+        return lineas
+
+
+class RegistroMetricas:
+    """Métricas del proceso en formato de texto de Prometheus, sin dependencias externas.
+
+    No importa Flask: cam.py lo usa también para exponer las métricas de la cámara.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metricas = {}
+
+    def _registrar(self, metrica):
+        with self._lock:
+            return self._metricas.setdefault(metrica.nombre, metrica)
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        return self._registrar(Contador(nombre, ayuda, etiquetas))
+
+    def histograma(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_LATENCIA):
+        return self._registrar(Histograma(nombre, ayuda, etiquetas, buckets))
+
+    def indicador(self, nombre, ayuda, funcion, etiquetas=()):
+        with self._lock:
+            self._metricas[nombre] = Indicador(nombre, ayuda, funcion, etiquetas)
+            return self._metricas[nombre]
+
+    def exponer(self):
+        with self._lock:
+            metricas = list(self._metricas.values())
+        lineas = []
+        for metrica in metricas:
+            lineas.extend(metrica.exponer())
+        return '\n'.join(lineas) + '\n'
+
+
+def servir_metricas(registro, puerto, host='0.0.0.0'):
+    """Sirve /metrics en un hilo aparte (para procesos sin Flask, como cam.py)."""
+    class Manejador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            cuerpo = registro.exponer().encode()
+            self.send_response(200 if self.path.startswith('/metrics') else 404)
+            self.send_header('Content-Type', TIPO_CONTENIDO)
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer((host, puerto), Manejador)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+metricas = RegistroMetricas()
+
+
+def _tipo_sentencia(sentencia):
+    palabra = sentencia.lstrip().split(None, 1)[0].upper() if sentencia.strip() else ''
+    return palabra if palabra in ('SELECT', 'INSERT', 'UPDATE', 'DELETE') else 'OTRA'
+
+
+def init_app(app):
+    """Mide las peticiones de Flask y las consultas SQL, y añade la ruta /metrics."""
+    from flask import Response, g, has_request_context, request
+    from sqlalchemy import event
+
+    from . import db
+
+    peticiones = metricas.histograma(
+        'parkease_peticion_segundos', 'Latencia de las peticiones HTTP por endpoint',
+        ('endpoint', 'metodo', 'estado'))
+    consultas_peticion = metricas.histograma(
+        'parkease_peticion_consultas', 'Consultas SQL por petición', ('endpoint',), BUCKETS_CONSULTAS)
+    consultas = metricas.histograma(
+        'parkease_sql_segundos', 'Duración de las consultas SQL por endpoint y tipo', ('endpoint', 'tipo'))
+
+    @app.before_request
+    def empezar_medida():
+        g.metricas_inicio = time.perf_counter()
+        g.metricas_consultas = 0
+
+    @app.after_request
+    def terminar_medida(respuesta):
+        inicio = g.pop('metricas_inicio', None)
+        if inicio is not None:
+            endpoint = request.endpoint or 'desconocido'
+            peticiones.observar(time.perf_counter() - inicio, endpoint=endpoint,
+                                metodo=request.method, estado=respuesta.status_code)
+            consultas_peticion.observar(g.get('metricas_consultas', 0), endpoint=endpoint)
+        return respuesta
+
+    @app.teardown_request
+    def medir_error(error):
+        # Las excepciones no pasan por after_request
+        inicio = g.pop('metricas_inicio', None)
+        if inicio is not None and error is not None:
+            peticiones.observar(time.perf_counter() - inicio, endpoint=request.endpoint or 'desconocido',
+                                metodo=request.method, estado=500)
+
+    with app.app_context():
+        motor = db.engine
+
+    @event.listens_for(motor, 'before_cursor_execute')
+    def antes_de_consulta(conexion, cursor, sentencia, parametros, contexto, multiples):
+        conexion.info.setdefault('metricas_inicio', []).append(time.perf_counter())
+
+    @event.listens_for(motor, 'after_cursor_execute')
+    def despues_de_consulta(conexion, cursor, sentencia, parametros, contexto, multiples):
+        inicios = conexion.info.get('metricas_inicio')
+        if not inicios:
+            return
+        duracion = time.perf_counter() - inicios.pop()
+        if has_request_context():
+            endpoint = request.endpoint or 'desconocido'
+            g.metricas_consultas = g.get('metricas_consultas', 0) + 1
+        else:
+            endpoint = 'segundo_plano'
+        consultas.observar(duracion, endpoint=endpoint, tipo=_tipo_sentencia(sentencia))
+
+    # Estado de la ingesta y de la ocupación, calculado al consultar /metrics
+    from .eventos import eventos
+    from .ingesta import escritor_sensores
+    from .ocupacion import ocupacion
+    from .sensores import sensores
+
+    metricas.indicador('parkease_ingesta_cola', 'Lecturas de sensores pendientes de guardar',
+                       escritor_sensores.pendientes)
+    metricas.indicador('parkease_ingesta_contadores', 'Lecturas, lotes y rechazos del escritor de sensores desde el arranque',
+                       lambda: dict(escritor_sensores.contadores), ('tipo',))
+    metricas.indicador('parkease_sse_clientes', 'Clientes conectados a /api/plazas/stream', eventos.suscriptores)
+    metricas.indicador('parkease_sensores_inactivos', 'Sensores que han dejado de informar',
+                       lambda: len(sensores.inactivos()))
+    metricas.indicador('parkease_plazas_libres', 'Plazas libres por nivel',
+                       lambda: {nivel: datos["total"] - datos["ocupadas"]
+                                for nivel, datos in ocupacion.resumen().items()}, ('nivel',))
+
+    @app.route('/metrics')
+    def exponer_metricas():
+        return Response(metricas.exponer(), content_type=TIPO_CONTENIDO)
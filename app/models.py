@@ -1,5 +1,7 @@
 from . import db
+from .matriculas import normalizar_matricula
 from datetime import datetime, timezone
+from sqlalchemy.orm import validates
 
 
 
@@ -38,8 +40,15 @@ class Vehiculo(db.Model):
     marca = db.Column(db.String(255))
     modelo = db.Column(db.String(255))
     matricula = db.Column(db.String(255), unique=True)
+    # Forma canónica de la matrícula (ver normalizar_matricula), para las búsquedas
+    matricula_normalizada = db.Column(db.String(255), index=True)
     color = db.Column(db.String(255))
 
+    @validates('matricula')
+    def validar_matricula(self, key, matricula):
+        self.matricula_normalizada = normalizar_matricula(matricula) or None
+        return matricula
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -50,30 +59,62 @@ class Vehiculo(db.Model):
         }
 
 
-# Modelo de Parking Inferior
-class ParkingInferior(db.Model):
-    __tablename__ = 'parking_inferior'
+# Registro de niveles: cada nivel pertenece a un parking (sitio) y las plazas
+# se asignan recorriendo los niveles de un sitio por `orden`
+class Nivel(db.Model):
+    __tablename__ = 'niveles'
 
-    numero = db.Column(db.Integer, primary_key=True)
-    ocupada = db.Column(db.Boolean, default=False)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)  # También es el código del nivel en las tramas UDP
+    sitio = db.Column(db.String(50), nullable=False, default='principal', index=True)
+    codigo = db.Column(db.String(10), nullable=False, unique=True)    # 'PI', 'PS'...
+    nombre = db.Column(db.String(255))
+    orden = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "sitio": self.sitio,
+            "codigo": self.codigo,
+            "nombre": self.nombre,
+            "orden": self.orden
+        }
 
     def __repr__(self):
-        return f'<Vehiculo {self.matricula}>'
-# Modelo de Parking Inferior
-class ParkingSuperior(db.Model):
-    __tablename__ = 'parking_superior'
+        return f'<Nivel {self.sitio}/{self.codigo}>'
 
-    numero = db.Column(db.Integer, primary_key=True)
-    ocupada = db.Column(db.Boolean, default=False)
 
+# Modelo de plaza de cualquier nivel y sitio
+class Plaza(db.Model):
+    __tablename__ = 'plazas'
+    __table_args__ = (
+        # Resumen de ocupación con un solo GROUP BY sitio, nivel
+        db.Index('ix_plazas_sitio_nivel_ocupada', 'sitio', 'nivel', 'ocupada'),
+        # Plaza de un vehículo en la salida (liberar por matrícula desde cualquier proceso)
+        db.Index('ix_plazas_matricula', 'matricula'),
+    )
+
+    sitio = db.Column(db.String(50), primary_key=True)
+    nivel = db.Column(db.String(10), primary_key=True)
+    numero = db.Column(db.Integer, primary_key=True)
+    ocupada = db.Column(db.Boolean, default=False, nullable=False)
+    # Vehículo al que se asignó la plaza en la entrada (NULL si está libre o la ocupó sin pasar por la entrada)
+    matricula = db.Column(db.String(255), nullable=True)
 
     def __repr__(self):
-        return f'<Vehiculo {self.matricula}>'
-    
+        return f'<Plaza {self.sitio}/{self.nivel}/{self.numero}>'
+
 # Modelo Entradas del Parking 
 
 class ParkingLog(db.Model):
     __tablename__ = 'parking_log'
+    __table_args__ = (
+        # Sesión abierta de una matrícula: matricula = X AND tiempo_salida IS NULL
+        db.Index('ix_parking_log_matricula_salida', 'matricula', 'tiempo_salida'),
+        # Cambios recientes (verificar_cambio) y consultas por rango de fechas
+        db.Index('ix_parking_log_tiempo_entrada', 'tiempo_entrada'),
+        db.Index('ix_parking_log_tiempo_salida', 'tiempo_salida'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     matricula = db.Column(db.String(255), nullable=False)
     tiempo_entrada = db.Column(db.DateTime, default=datetime.now(timezone.utc), nullable=False)
@@ -82,3 +123,44 @@ class ParkingLog(db.Model):
     def __repr__(self):
         return f'<ParkingLog {self.matricula}>'
 
+
+# Modelo de estadísticas agregadas del parking (por minuto y por hora)
+class EstadisticaParking(db.Model):
+    __tablename__ = 'parking_estadisticas'
+
+    periodo = db.Column(db.String(10), primary_key=True)   # 'minuto' o 'hora'
+    inicio = db.Column(db.DateTime, primary_key=True)
+    nivel = db.Column(db.String(10), primary_key=True)     # 'PI', 'PS' o 'TOTAL'
+    entradas = db.Column(db.Integer, nullable=False, default=0)
+    salidas = db.Column(db.Integer, nullable=False, default=0)
+    ocupadas = db.Column(db.Integer, nullable=False, default=0)
+    ocupadas_max = db.Column(db.Integer, nullable=False, default=0)
+    # Histograma del tiempo de estancia de las salidas del periodo
+    estancia_15m = db.Column(db.Integer, nullable=False, default=0)
+    estancia_1h = db.Column(db.Integer, nullable=False, default=0)
+    estancia_3h = db.Column(db.Integer, nullable=False, default=0)
+    estancia_8h = db.Column(db.Integer, nullable=False, default=0)
+    estancia_24h = db.Column(db.Integer, nullable=False, default=0)
+    estancia_mas = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            "periodo": self.periodo,
+            "inicio": self.inicio.isoformat(),
+            "nivel": self.nivel,
+            "entradas": self.entradas,
+            "salidas": self.salidas,
+            "ocupadas": self.ocupadas,
+            "ocupadas_max": self.ocupadas_max,
+            "estancias": {
+                "15m": self.estancia_15m,
+                "1h": self.estancia_1h,
+                "3h": self.estancia_3h,
+                "8h": self.estancia_8h,
+                "24h": self.estancia_24h,
+                "mas": self.estancia_mas
+            }
+        }
+
+    def __repr__(self):
+        return f'<EstadisticaParking {self.periodo} {self.inicio} {self.nivel}>'
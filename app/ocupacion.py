@@ -0,0 +1,465 @@
+import json
+import threading
+import time
+
+from . import db
+from .models import Nivel, Plaza
+
+
+class MotorOcupacion:
+    """Estado de ocupación de las plazas en memoria, compartido por todo el proceso.
+
+    Cada nivel guarda sus plazas libres como un bitmap (bit n = plaza n libre),
+    de modo que asignar y liberar una plaza no requiere consultar la base de datos.
+    Los niveles salen del registro de la tabla niveles (código único en toda la
+    instalación, sitio al que pertenecen y orden de asignación).
+    Los cambios se escriben también en MySQL (write-through) dentro de la sesión
+    actual; el commit lo hace quien llama.
+
+    Además mantiene contadores de plazas ocupadas por nivel y un número de versión
+    que se actualizan en cada cambio de plaza, bajo el mismo lock que los bitmaps.
+
+    Con varios procesos cada uno tiene su propia copia en memoria, así que la base
+    de datos es la referencia: la plaza de cada vehículo se guarda en plazas.matricula,
+    al asignar plaza decide un UPDATE condicional (ver asignar()), la salida libera la
+    plaza por matrícula aunque la entrada la atendiera otro proceso, y las lecturas
+    de los sensores se comparan con la tabla, no con la memoria (UPDATE ... AND
+    ocupada <> nuevo estado). La copia en memoria solo propone candidatas y se pone
+    al día con resincronizar().
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._niveles = {}
+        self._libres = {}
+        self._plazas = {}
+        self._ocupadas = {}
+        self._totales = {}
+        self._plaza_por_matricula = {}
+        self._matricula_por_plaza = {}
+        self._cargado = False
+        self._version = 0
+        self._contadores_json = None
+        self.skip_locked = False
+
+    def init_app(self, app):
+        with app.app_context():
+            try:
+                self.cargar()
+                modo = app.config.get('ASIGNACION_PLAZAS', 'auto')
+                self.skip_locked = modo == 'skip_locked' or (modo == 'auto' and admite_skip_locked(db.engine))
+            except Exception as e:
+                # Si la base de datos no está disponible se cargará en el primer uso
+                print(f"❌ Error al cargar la ocupación del parking: {e}")
+
+        intervalo = app.config.get('OCUPACION_RESINCRONIZAR_SEGUNDOS', 0)
+        if intervalo > 0:
+            threading.Thread(target=self._bucle_resincronizar, args=(app, intervalo), daemon=True).start()
+
+    def _bucle_resincronizar(self, app, intervalo):
+        """Con varios procesos, recoge cada `intervalo` segundos lo que han cambiado los demás."""
+        while True:
+            time.sleep(intervalo)
+            with app.app_context():
+                try:
+                    self.resincronizar()
+                except Exception as e:
+                    print(f"❌ Error al resincronizar la ocupación del parking: {e}")
+
+    def cargar(self):
+        """Reconstruye el registro de niveles y los bitmaps a partir de las tablas niveles y plazas."""
+        niveles = {}
+        for nivel in Nivel.query.order_by(Nivel.sitio, Nivel.orden, Nivel.codigo):
+            niveles[nivel.codigo] = nivel.to_dict()
+
+        libres = {codigo: 0 for codigo in niveles}
+        plazas = {codigo: 0 for codigo in niveles}
+        plaza_por_matricula = {}
+        consulta = db.session.query(Plaza.nivel, Plaza.numero, Plaza.ocupada, Plaza.matricula)
+        for nivel, numero, ocupada, matricula in consulta:
+            if nivel not in niveles:
+                continue
+            plazas[nivel] |= 1 << numero
+            if not ocupada:
+                libres[nivel] |= 1 << numero
+            elif matricula:
+                plaza_por_matricula[matricula] = (nivel, numero)
+
+        with self._lock:
+            self._niveles = niveles
+            self._libres = libres
+            self._plazas = plazas
+            self._totales = {nivel: bin(bits).count("1") for nivel, bits in plazas.items()}
+            self._ocupadas = {
+                nivel: self._totales[nivel] - bin(libres[nivel]).count("1") for nivel in plazas
+            }
+            self._version += 1
+            self._plaza_por_matricula = plaza_por_matricula
+            self._matricula_por_plaza = {plaza: matricula for matricula, plaza in plaza_por_matricula.items()}
+            self._cargado = True
+
+    def _asegurar_cargado(self):
+        if not self._cargado:
+            self.cargar()
+
+    def niveles(self, sitio=None):
+        """Niveles registrados ({"id", "sitio", "codigo", "nombre", "orden"}) en orden de asignación."""
+        self._asegurar_cargado()
+        return [datos for datos in self._niveles.values() if sitio is None or datos["sitio"] == sitio]
+
+    def nivel(self, codigo):
+        self._asegurar_cargado()
+        return self._niveles.get(codigo)
+
+    def existe(self, nivel, numero):
+        self._asegurar_cargado()
+        return nivel in self._plazas and numero >= 0 and bool(self._plazas[nivel] >> numero & 1)
+
+    def mapa_plazas(self):
+        """Copia de {nivel: bitmap de plazas existentes} (bit n = existe la plaza n)."""
+        self._asegurar_cargado()
+        with self._lock:
+            return dict(self._plazas)
+
+    def esta_ocupada(self, nivel, numero):
+        self._asegurar_cargado()
+        return not self._libres.get(nivel, 0) >> numero & 1
+
+    def resumen(self):
+        """Plazas ocupadas y totales por nivel: {nivel: {"ocupadas": n, "total": m}}."""
+        self._asegurar_cargado()
+        with self._lock:
+            return {
+                nivel: {"ocupadas": self._ocupadas[nivel], "total": self._totales[nivel]}
+                for nivel in self._plazas
+            }
+
+    @property
+    def version(self):
+        return self._version
+
+    def contadores(self):
+        """(versión, JSON con las plazas libres/ocupadas/totales por nivel).
+
+        El JSON se genera una vez por versión; mientras no cambie ninguna plaza se
+        devuelve el mismo texto sin recorrer nada.
+        """
+        self._asegurar_cargado()
+        with self._lock:
+            if self._contadores_json is None or self._contadores_json[0] != self._version:
+                niveles = {
+                    nivel: {
+                        "sitio": self._niveles[nivel]["sitio"],
+                        "libres": self._totales[nivel] - self._ocupadas[nivel],
+                        "ocupadas": self._ocupadas[nivel],
+                        "total": self._totales[nivel]
+                    }
+                    for nivel in self._plazas
+                }
+                self._contadores_json = (self._version, json.dumps({
+                    "version": self._version,
+                    "libres": sum(datos["libres"] for datos in niveles.values()),
+                    "niveles": niveles
+                }))
+            return self._contadores_json
+
+    def _poner(self, nivel, numero, libre):
+        """Cambia el bit de la plaza y actualiza los contadores. Devuelve True si ha cambiado."""
+        libres = self._libres.get(nivel, 0)
+        if bool(libres >> numero & 1) == libre:
+            return False
+        if libre:
+            self._libres[nivel] = libres | (1 << numero)
+            self._ocupadas[nivel] -= 1
+        else:
+            self._libres[nivel] = libres & ~(1 << numero)
+            self._ocupadas[nivel] += 1
+        self._version += 1
+        return True
+
+    def plaza_de(self, matricula):
+        """Devuelve la plaza (nivel, numero) asignada a una matrícula en memoria, o None."""
+        return self._plaza_por_matricula.get(matricula)
+
+    def plaza_asignada(self, matricula):
+        """Plaza asignada a la matrícula en memoria, confirmada en plazas.matricula.
+
+        Sin plaza en memoria no se consulta nada. Si la tabla ya no tiene esa plaza a
+        nombre de la matrícula (otro proceso la ha liberado), se olvida la relación.
+        """
+        self._asegurar_cargado()
+        plaza = self.plaza_de(matricula)
+        if plaza is None:
+            return None
+
+        nivel, numero = plaza
+        confirmada = db.session.query(Plaza.numero).filter_by(
+            sitio=self._niveles[nivel]["sitio"], nivel=nivel, numero=numero, matricula=matricula, ocupada=True
+        ).first() is not None
+        if not confirmada:
+            with self._lock:
+                if self._plaza_por_matricula.get(matricula) == plaza:
+                    del self._plaza_por_matricula[matricula]
+                    self._matricula_por_plaza.pop(plaza, None)
+        return plaza if confirmada else None
+
+    def asignar(self, matricula, sitio=None):
+        """Reserva la primera plaza libre para la matrícula y la marca como ocupada.
+
+        Recorre los niveles del sitio (o de todos si no se indica) en su orden.
+        Devuelve (nivel, numero) o None si el parking está completo.
+
+        La reserva se hace en la sesión actual y queda en la misma transacción que
+        el registro de parking_log de la entrada (el commit lo hace quien llama):
+          - con SKIP LOCKED (MySQL 8, MariaDB 10.6, PostgreSQL) se bloquea la primera
+            plaza libre que no esté bloqueando otra entrada, sin esperar a las demás;
+          - si no, la plaza propuesta por el bitmap se reserva con un UPDATE
+            condicional (... AND ocupada = false); si otro proceso ya la ha ocupado
+            no se actualiza ninguna fila, se marca en memoria y se prueba la siguiente.
+        En los dos casos la matrícula queda guardada en plazas.matricula.
+        """
+        self._asegurar_cargado()
+        with self._lock:
+            plaza = self._plaza_por_matricula.get(matricula)
+            if plaza:
+                return plaza
+
+        if self.skip_locked:
+            plaza = self._reservar_skip_locked(matricula, sitio)
+        else:
+            plaza = self._reservar_condicional(matricula, sitio)
+        if not plaza:
+            return None
+
+        with self._lock:
+            self._poner(*plaza, False)
+            self._asociar(matricula, plaza)
+        return plaza
+
+    def _niveles_de(self, sitio):
+        return [nivel for nivel, datos in self._niveles.items() if sitio is None or datos["sitio"] == sitio]
+
+    def _reservar_skip_locked(self, matricula, sitio):
+        for nivel in self._niveles_de(sitio):
+            numero = db.session.query(Plaza.numero).filter_by(
+                sitio=self._niveles[nivel]["sitio"], nivel=nivel, ocupada=False
+            ).order_by(Plaza.numero).limit(1).with_for_update(skip_locked=True).scalar()
+            if numero is not None and self._reservar_en_bd(nivel, numero, matricula):
+                return (nivel, numero)
+        return None
+
+    def _reservar_condicional(self, matricula, sitio):
+        resincronizado = False
+        while True:
+            with self._lock:
+                plaza = self._primera_libre(sitio)
+                if plaza:
+                    # Ocupada en memoria mientras se reserva, para que otro hilo no la elija
+                    self._poner(*plaza, False)
+            if plaza is None:
+                if resincronizado:
+                    return None
+                # El bitmap puede no saber que otro proceso ha liberado plazas
+                self.resincronizar(sitio)
+                resincronizado = True
+                continue
+            try:
+                if self._reservar_en_bd(*plaza, matricula):
+                    return plaza
+            except Exception:
+                with self._lock:
+                    self._poner(*plaza, True)
+                raise
+            # Otro proceso se ha quedado con ella: sigue ocupada en memoria
+
+    def _primera_libre(self, sitio):
+        for nivel in self._niveles_de(sitio):
+            libres = self._libres.get(nivel, 0)
+            if libres:
+                # Bit libre más bajo del nivel
+                return (nivel, (libres & -libres).bit_length() - 1)
+        return None
+
+    def _reservar_en_bd(self, nivel, numero, matricula):
+        """UPDATE condicional de la plaza; True si estaba libre en la base de datos."""
+        return db.session.query(Plaza).filter_by(
+            sitio=self._niveles[nivel]["sitio"], nivel=nivel, numero=numero, ocupada=False
+        ).update({'ocupada': True, 'matricula': matricula}, synchronize_session=False) == 1
+
+    def resincronizar(self, sitio=None):
+        """Pone la memoria de los niveles del sitio al día con la tabla plazas (cambios de otros procesos)."""
+        self._asegurar_cargado()
+        niveles = self._niveles_de(sitio)
+        filas = db.session.query(Plaza.nivel, Plaza.numero, Plaza.ocupada, Plaza.matricula).filter(
+            Plaza.nivel.in_(niveles)
+        ).all()
+        with self._lock:
+            for nivel, numero, ocupada, matricula in filas:
+                if nivel not in self._plazas:
+                    continue
+                self._marcar_en_memoria(nivel, numero, ocupada)
+                if ocupada and matricula:
+                    self._asociar(matricula, (nivel, numero))
+
+    def _asociar(self, matricula, plaza):
+        """Relaciona matrícula y plaza en memoria, quitando las relaciones anteriores de ambas."""
+        anterior = self._matricula_por_plaza.pop(plaza, None)
+        if anterior is not None:
+            self._plaza_por_matricula.pop(anterior, None)
+        antigua = self._plaza_por_matricula.pop(matricula, None)
+        if antigua is not None:
+            self._matricula_por_plaza.pop(antigua, None)
+        self._plaza_por_matricula[matricula] = plaza
+        self._matricula_por_plaza[plaza] = matricula
+
+    def liberar(self, matricula):
+        """Libera la plaza asignada a la matrícula. Devuelve (nivel, numero) o None.
+
+        La plaza se busca en plazas.matricula, así que se libera aunque la entrada la
+        haya atendido otro proceso. La escritura queda en la sesión actual.
+        """
+        self._asegurar_cargado()
+        fila = db.session.query(Plaza.sitio, Plaza.nivel, Plaza.numero).filter_by(matricula=matricula).first()
+        if fila is None:
+            # Sin plaza en la base de datos: como mucho queda la copia en memoria
+            with self._lock:
+                plaza = self._plaza_por_matricula.pop(matricula, None)
+                if plaza:
+                    self._matricula_por_plaza.pop(plaza, None)
+            return None
+
+        liberadas = db.session.query(Plaza).filter_by(
+            sitio=fila.sitio, nivel=fila.nivel, numero=fila.numero, matricula=matricula
+        ).update({'ocupada': False, 'matricula': None}, synchronize_session=False)
+        if not liberadas:
+            return None
+
+        plaza = (fila.nivel, fila.numero)
+        with self._lock:
+            self._plaza_por_matricula.pop(matricula, None)
+            self._matricula_por_plaza.pop(plaza, None)
+            self._poner(*plaza, True)
+        return plaza
+
+    def deshacer_asignacion(self, matricula):
+        """Revierte en memoria una asignación cuyo commit ha fallado."""
+        with self._lock:
+            plaza = self._plaza_por_matricula.pop(matricula, None)
+            if plaza:
+                self._matricula_por_plaza.pop(plaza, None)
+                nivel, numero = plaza
+                self._poner(nivel, numero, True)
+
+    def marcar(self, nivel, numero, ocupada):
+        """Actualiza una plaza según su sensor. Devuelve True si ha cambiado en la base de datos.
+
+        Una lectura que no cambia nada (p. ej. el latido del sensor) no escribe: el
+        UPDATE solo toca la fila si su estado es distinto, así que sirve aunque la
+        copia en memoria de este proceso esté atrasada. Solo hace falta commit (y
+        evento) si devuelve True; el commit lo hace quien llama.
+        """
+        self._asegurar_cargado()
+        with self._lock:
+            self._marcar_en_memoria(nivel, numero, ocupada)
+
+        return self._escribir(nivel, numero, ocupada)
+
+    def marcar_lote(self, lecturas):
+        """Aplica varias lecturas (nivel, numero, ocupada) de una sola vez.
+
+        Por cada nivel se lee el estado de esas plazas en la tabla y solo se escriben
+        las que cambian, con un único UPDATE. Devuelve la lista de cambios respecto a
+        la base de datos (vacía si no hay nada que guardar ni publicar).
+        """
+        self._asegurar_cargado()
+
+        # Si una plaza aparece varias veces en el lote, manda la última lectura
+        finales = {}
+        for nivel, numero, ocupada in lecturas:
+            finales[(nivel, numero)] = ocupada
+
+        with self._lock:
+            for (nivel, numero), ocupada in finales.items():
+                self._marcar_en_memoria(nivel, numero, ocupada)
+
+        return self._escribir_lote([(nivel, numero, ocupada) for (nivel, numero), ocupada in finales.items()])
+
+    def _marcar_en_memoria(self, nivel, numero, ocupada):
+        if not ocupada:
+            # La plaza está vacía: ya no pertenece a ningún vehículo
+            matricula = self._matricula_por_plaza.pop((nivel, numero), None)
+            if matricula:
+                self._plaza_por_matricula.pop(matricula, None)
+        return self._poner(nivel, numero, not ocupada)
+
+    def _escribir(self, nivel, numero, ocupada):
+        """UPDATE de la plaza solo si su estado en la tabla es distinto. True si ha cambiado."""
+        sitio = self._niveles[nivel]["sitio"]
+        valores = {'ocupada': ocupada} if ocupada else {'ocupada': False, 'matricula': None}
+        return db.session.query(Plaza).filter(
+            Plaza.sitio == sitio, Plaza.nivel == nivel, Plaza.numero == numero, Plaza.ocupada != ocupada
+        ).update(valores, synchronize_session=False) > 0
+
+    def _escribir_lote(self, lecturas):
+        por_nivel = {}
+        for nivel, numero, ocupada in lecturas:
+            por_nivel.setdefault(nivel, {})[numero] = ocupada
+
+        cambios = []
+        for nivel, estados in por_nivel.items():
+            filtro = (Plaza.sitio == self._niveles[nivel]["sitio"], Plaza.nivel == nivel)
+            actuales = db.session.query(Plaza.numero, Plaza.ocupada).filter(*filtro, Plaza.numero.in_(list(estados)))
+            distintos = {numero: estados[numero] for numero, ocupada in actuales if ocupada != estados[numero]}
+            if not distintos:
+                continue
+
+            nuevo = db.case(distintos, value=Plaza.numero)
+            db.session.query(Plaza).filter(*filtro, Plaza.numero.in_(list(distintos)), Plaza.ocupada != nuevo).update(
+                {
+                    'ocupada': nuevo,
+                    # Una plaza vacía ya no pertenece a ningún vehículo
+                    'matricula': db.case(
+                        (Plaza.numero.in_([numero for numero, ocupada in distintos.items() if not ocupada]), None),
+                        else_=Plaza.matricula
+                    )
+                },
+                synchronize_session=False
+            )
+            cambios += [(nivel, numero, ocupada) for numero, ocupada in distintos.items()]
+        return cambios
+
+
+def admite_skip_locked(motor):
+    """True si la base de datos admite SELECT ... FOR UPDATE SKIP LOCKED."""
+    dialecto = motor.dialect
+    version = dialecto.server_version_info or ()
+    if dialecto.name == 'postgresql':
+        return True
+    if dialecto.name in ('mysql', 'mariadb'):
+        if getattr(dialecto, 'is_mariadb', False):
+            return version >= (10, 6)
+        return version >= (8, 0, 1)
+    return False
+
+
+def resumen_bd(sitio=None):
+    """Plazas ocupadas y totales por sitio y nivel con un único GROUP BY sobre la tabla plazas.
+
+    Devuelve {(sitio, nivel): {"ocupadas": n, "total": m}}. Lee la base de datos,
+    así que incluye los cambios hechos por otros procesos.
+    """
+    consulta = db.session.query(
+        Plaza.sitio,
+        Plaza.nivel,
+        db.func.count(),
+        db.func.sum(db.case((Plaza.ocupada, 1), else_=0))
+    )
+    if sitio is not None:
+        consulta = consulta.filter(Plaza.sitio == sitio)
+    return {
+        (sitio_plaza, nivel): {"ocupadas": int(ocupadas or 0), "total": total}
+        for sitio_plaza, nivel, total, ocupadas in consulta.group_by(Plaza.sitio, Plaza.nivel)
+    }
+
+
+ocupacion = MotorOcupacion()
@@ -0,0 +1,260 @@
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+
+from flask import g, has_request_context, jsonify, request
+from sqlalchemy import event
+
+from . import db
+
+CARPETA_APP = os.path.dirname(os.path.abspath(__file__))
+ESTE_FICHERO = os.path.abspath(__file__)
+CARGAS_ANSIOSAS = ('joined', 'selectin', 'subquery')
+
+
+def forma_sentencia(sentencia):
+    """Sentencia sin espacios repetidos y con las listas IN (...) contraídas, para agrupar."""
+    forma = ' '.join(sentencia.split())
+    return re.sub(r'\bIN \([^()]*\)', 'IN (...)', forma, flags=re.IGNORECASE)
+
+
+def linea_origen():
+    """Primera línea del código de la aplicación en la pila (fichero:línea función)."""
+    marco = sys._getframe(1)
+    while marco is not None:
+        fichero = os.path.abspath(marco.f_code.co_filename)
+        if fichero.startswith(CARPETA_APP) and fichero != ESTE_FICHERO:
+            return f"{os.path.relpath(fichero, os.path.dirname(CARPETA_APP))}:{marco.f_lineno} {marco.f_code.co_name}"
+        marco = marco.f_back
+    return 'desconocido'
+
+
+class PerfiladorSQL:
+    """Registra las sentencias SQL de cada petición y avisa de los patrones de carga caros.
+
+    Solo se activa con PERFIL_SQL (PARKEASE_PERFIL_SQL=1), en desarrollo o en una
+    instancia canary: guardar la pila de cada sentencia cuesta demasiado para
+    dejarlo siempre encendido. Por cada petición agrupa las sentencias por su forma
+    y detecta:
+      - n+1: la misma forma ejecutada `umbral` veces o más desde la misma línea;
+      - carga_ansiosa_duplicada: un joinedload/selectinload explícito sobre una
+        relación que el modelo ya carga de forma ansiosa;
+      - carga_ansiosa_implicita: una consulta que arrastra una relación con
+        lazy='joined' (u otra carga ansiosa) declarada en el modelo.
+    """
+
+    def __init__(self, umbral=3, max_informes=200):
+        self.umbral = umbral
+        self.activo = False
+        self._lock = threading.Lock()
+        self._informes = deque(maxlen=max_informes)
+        self._siguiente_id = 1
+        self._resumen = {}
+
+    def init_app(self, app):
+        self.activo = app.config.get('PERFIL_SQL', False)
+        if not self.activo:
+            return
+        self.umbral = app.config.get('PERFIL_SQL_UMBRAL', self.umbral)
+
+        with app.app_context():
+            motor = db.engine
+        event.listen(motor, 'before_cursor_execute', self._antes_de_sentencia)
+        event.listen(motor, 'after_cursor_execute', self._despues_de_sentencia)
+        event.listen(db.session, 'do_orm_execute', self._consulta_orm)
+        app.before_request(self._empezar)
+        app.after_request(self._terminar)
+
+        @app.route('/api/perfil-sql', methods=['GET', 'DELETE'])
+        def perfil_sql_resumen():
+            if request.method == 'DELETE':
+                self.reiniciar()
+                return jsonify({"ok": True})
+            ultimas = request.args.get('ultimas', 20, type=int)
+            return jsonify({"resumen": self.resumen(), "peticiones": self.informes(ultimas)})
+
+        @app.route('/api/perfil-sql/<int:id_informe>', methods=['GET'])
+        def perfil_sql_peticion(id_informe):
+            informe = self.informe(id_informe)
+            if informe is None:
+                return jsonify({"error": "Informe no encontrado"}), 404
+            return jsonify(informe)
+
+        print(f"🔧 Perfil SQL activado (n+1 a partir de {self.umbral} sentencias iguales)")
+
+    def _empezar(self):
+        g.perfil_sql = {"sentencias": [], "avisos": [], "orm": None}
+
+    def _consulta_orm(self, estado):
+        perfil = g.get('perfil_sql') if has_request_context() else None
+        if perfil is None or not estado.is_select:
+            return
+        linea = linea_origen()
+        perfil["orm"] = "carga perezosa" if estado.is_relationship_load else None
+
+        explicitas = set()
+        for opcion in estado.statement._with_options:
+            for elemento in getattr(opcion, 'context', ()):
+                ruta = elemento.path.path
+                estrategia = dict(elemento.strategy or ()).get('lazy')
+                if len(ruta) < 2 or estrategia not in CARGAS_ANSIOSAS:
+                    continue
+                relacion = ruta[1]
+                explicitas.add(relacion)
+                if getattr(relacion, 'lazy', None) in CARGAS_ANSIOSAS:
+                    perfil["avisos"].append({
+                        "tipo": "carga_ansiosa_duplicada", "relacion": str(relacion), "linea": linea,
+                        "detalle": f"{estrategia}load explícito y lazy='{relacion.lazy}' en el modelo"
+                    })
+
+        if estado.is_relationship_load:
+            return
+        for mapper in estado.all_mappers:
+            for relacion in mapper.relationships:
+                if relacion.lazy in CARGAS_ANSIOSAS and relacion not in explicitas:
+                    perfil["avisos"].append({
+                        "tipo": "carga_ansiosa_implicita", "relacion": str(relacion), "linea": linea,
+                        "detalle": f"lazy='{relacion.lazy}' en el modelo"
+                    })
+
+    def _antes_de_sentencia(self, conexion, cursor, sentencia, parametros, contexto, multiples):
+        if has_request_context() and g.get('perfil_sql') is not None:
+            conexion.info.setdefault('perfil_sql_inicio', []).append(time.perf_counter())
+
+    def _despues_de_sentencia(self, conexion, cursor, sentencia, parametros, contexto, multiples):
+        perfil = g.get('perfil_sql') if has_request_context() else None
+        inicios = conexion.info.get('perfil_sql_inicio')
+        if perfil is None or not inicios:
+            return
+        perfil["sentencias"].append({
+            "forma": forma_sentencia(sentencia),
+            "ms": (time.perf_counter() - inicios.pop()) * 1000,
+            "linea": linea_origen(),
+            "origen": perfil.pop("orm", None) or "consulta"
+        })
+
+    def _terminar(self, respuesta):
+        perfil = g.pop('perfil_sql', None)
+        if perfil is None:
+            return respuesta
+        informe = self._informe_peticion(perfil, respuesta.status_code)
+        with self._lock:
+            informe["id"] = self._siguiente_id
+            self._siguiente_id += 1
+            self._informes.append(informe)
+            self._acumular(informe)
+        respuesta.headers['X-Perfil-SQL'] = (f"id={informe['id']}; consultas={informe['consultas']}; "
+                                             f"avisos={len(informe['avisos'])}")
+        for aviso in informe["avisos"]:
+            if aviso["tipo"] == "n+1":
+                print(f"⚠ N+1 en {informe['endpoint']}: {aviso['veces']} veces desde {aviso['linea']}: "
+                      f"{aviso['forma'][:120]}")
+        return respuesta
+
+    def _informe_peticion(self, perfil, estado):
+        formas = {}
+        for sentencia in perfil["sentencias"]:
+            grupo = formas.setdefault(sentencia["forma"], {
+                "forma": sentencia["forma"], "veces": 0, "ms": 0.0, "lineas": {}, "origen": sentencia["origen"]
+            })
+            grupo["veces"] += 1
+            grupo["ms"] += sentencia["ms"]
+            grupo["lineas"][sentencia["linea"]] = grupo["lineas"].get(sentencia["linea"], 0) + 1
+
+        avisos = []
+        vistos = set()
+        for aviso in perfil["avisos"]:
+            clave = (aviso["tipo"], aviso["relacion"], aviso["linea"])
+            if clave not in vistos:
+                vistos.add(clave)
+                avisos.append(aviso)
+        for grupo in formas.values():
+            for linea, veces in grupo["lineas"].items():
+                if veces >= self.umbral:
+                    avisos.append({
+                        "tipo": "n+1", "forma": grupo["forma"], "veces": veces, "linea": linea,
+                        "detalle": grupo["origen"]
+                    })
+            grupo["ms"] = round(grupo["ms"], 3)
+
+        return {
+            "endpoint": request.endpoint or 'desconocido',
+            "metodo": request.method,
+            "ruta": request.path,
+            "estado": estado,
+            "consultas": len(perfil["sentencias"]),
+            "tiempo_sql_ms": round(sum(s["ms"] for s in perfil["sentencias"]), 3),
+            "sentencias": sorted(formas.values(), key=lambda grupo: -grupo["veces"]),
+            "avisos": avisos
+        }
+
+    def _acumular(self, informe):
+        datos = self._resumen.setdefault(informe["endpoint"], {
+            "peticiones": 0, "consultas": 0, "max_consultas": 0, "tiempo_sql_ms": 0.0, "formas": {}, "avisos": {}
+        })
+        datos["peticiones"] += 1
+        datos["consultas"] += informe["consultas"]
+        datos["max_consultas"] = max(datos["max_consultas"], informe["consultas"])
+        datos["tiempo_sql_ms"] += informe["tiempo_sql_ms"]
+        for grupo in informe["sentencias"]:
+            forma = datos["formas"].setdefault(grupo["forma"], {"veces": 0, "ms": 0.0})
+            forma["veces"] += grupo["veces"]
+            forma["ms"] += grupo["ms"]
+        for aviso in informe["avisos"]:
+            clave = (aviso["tipo"], aviso.get("relacion") or aviso.get("forma"), aviso["linea"])
+            datos["avisos"][clave] = datos["avisos"].get(clave, 0) + 1
+
+    def informes(self, ultimas=20):
+        with self._lock:
+            return list(self._informes)[-ultimas:] if ultimas > 0 else []
+
+    def informe(self, id_informe):
+        with self._lock:
+            return next((informe for informe in self._informes if informe["id"] == id_informe), None)
+
+    def resumen(self):
+        """Acumulado por endpoint desde el arranque (o desde el último reinicio)."""
+        with self._lock:
+            return {
+                endpoint: {
+                    "peticiones": datos["peticiones"],
+                    "consultas_por_peticion": round(datos["consultas"] / datos["peticiones"], 2),
+                    "max_consultas": datos["max_consultas"],
+                    "tiempo_sql_ms_por_peticion": round(datos["tiempo_sql_ms"] / datos["peticiones"], 3),
+                    "formas": sorted(
+                        ({"forma": forma, "veces": valores["veces"], "ms": round(valores["ms"], 3)}
+                         for forma, valores in datos["formas"].items()),
+                        key=lambda forma: -forma["ms"]
+                    ),
+                    "avisos": [
+                        {"tipo": tipo, "objeto": objeto, "linea": linea, "peticiones": veces}
+                        for (tipo, objeto, linea), veces in sorted(datos["avisos"].items(), key=lambda a: -a[1])
+                    ]
+                }
+                for endpoint, datos in sorted(self._resumen.items())
+            }
+
+    def texto_resumen(self, max_formas=3):
+        """Resumen legible para imprimir al final de una prueba de carga."""
+        lineas = []
+        for endpoint, datos in self.resumen().items():
+            lineas.append(f"{endpoint}: {datos['peticiones']} peticiones | "
+                          f"{datos['consultas_por_peticion']} consultas/petición (máx. {datos['max_consultas']}) | "
+                          f"{datos['tiempo_sql_ms_por_peticion']} ms de SQL/petición")
+            for forma in datos["formas"][:max_formas]:
+                lineas.append(f"    {forma['veces']:>6}x {forma['ms']:>10.1f} ms  {forma['forma'][:100]}")
+            for aviso in datos["avisos"]:
+                lineas.append(f"    ⚠ {aviso['tipo']} en {aviso['peticiones']} peticiones: "
+                              f"{str(aviso['objeto'])[:80]} ({aviso['linea']})")
+        return '\n'.join(lineas)
+
+    def reiniciar(self):
+        with self._lock:
+            self._informes.clear()
+            self._resumen = {}
+
+
+perfil_sql = PerfiladorSQL()
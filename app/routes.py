@@ -1,12 +1,49 @@
-from flask import Flask, request, make_response, redirect, render_template, session, g, flash, jsonify, url_for
+from flask import Flask, Response, abort, request, make_response, redirect, render_template, session, g, flash, jsonify, url_for
 from app.forms import LoginForm
 from werkzeug.security import generate_password_hash, check_password_hash
-from .models import User, Vehiculo, ParkingInferior, ParkingSuperior, ParkingLog
+from .models import User, Vehiculo, Plaza, ParkingLog
 from . import db
+from .ocupacion import ocupacion, resumen_bd
+from .eventos import eventos
+from .matriculas import registro_matriculas, normalizar_matricula
+from .estadisticas import estadisticas, PERIODOS
+from .sesiones import sesiones_abiertas
+from .archivo import consultar_historial
+from .sensores import sensores
+from .ingesta import NIVEL_PUERTA
 from datetime import datetime, timedelta
+import os
+import time
+from urllib.parse import urlsplit
 # from django.utils import timezone
 
 sensor_status = {}
+# Última lectura del sensor de proximidad de la entrada (la consulta la cámara)
+puerta_status = {"estado": None, "tiempo": None}
+# Prefijo de los ETag de /api/ocupacion: distinto en cada arranque del proceso
+generacion_etag = f"{os.getpid():x}-{int(time.time()):x}"
+
+def estado_ocupada(estado):
+    """Interpreta el estado enviado por un sensor ("ocupado"/"libre", 1/0, true/false)."""
+    if isinstance(estado, str):
+        return estado.strip().lower() in ('ocupado', 'ocupada', '1', 'true')
+    return bool(estado)
+
+def ids_lectura(lectura):
+    """(sensorID, plazaID) de la lectura de un sensor; ValueError si no son un texto y un entero.
+
+    Se comprueba antes de buscar la plaza: una lista o un diccionario como sensorID
+    no se pueden usar como clave del registro de niveles.
+    """
+    sensor_id = lectura.get("sensorID")
+    plaza_id = lectura.get("plazaID")
+    if not isinstance(sensor_id, str):
+        raise ValueError("sensorID debe ser un texto")
+    if isinstance(plaza_id, str) and plaza_id.strip().isdigit():
+        plaza_id = int(plaza_id)
+    if not isinstance(plaza_id, int) or isinstance(plaza_id, bool):
+        raise ValueError("plazaID debe ser un número entero")
+    return sensor_id, plaza_id
 
 def register_routes(app):
     # Antes de cada request, definir si hay sesión activa
@@ -48,7 +85,7 @@ def register_routes(app):
 
             return redirect('/main')
 
-        return render_template('home.html', **context)
+        return render_template('home.html', niveles=ocupacion.niveles(), **context)
 
     # Ruta de inicio de sesión
     @app.route('/login', methods=['GET', 'POST'])
@@ -81,6 +118,11 @@ def register_routes(app):
             matricula = request.form.get('matricula', None)
             color = request.form.get('color', None)
 
+            # Validar que la matrícula sea única (sin tener en cuenta espacios, guiones o mayúsculas)
+            if matricula and Vehiculo.query.filter_by(matricula_normalizada=normalizar_matricula(matricula)).first():
+                flash("La matrícula ya está registrada.", "error")
+                return redirect(url_for('register'))
+
             hashed_password = generate_password_hash(password)
             new_user = User(name=username, password=hashed_password, email=email, dni=dni, phone=telefono)
             db.session.add(new_user)
@@ -97,6 +139,8 @@ def register_routes(app):
                 db.session.add(new_vehiculo)
 
             db.session.commit()
+            if matricula:
+                registro_matriculas.agregar(matricula)
             return redirect('/login')
 
         return render_template('register.html')
@@ -162,8 +206,8 @@ def register_routes(app):
                 flash("Todos los campos son obligatorios.", "error")
                 return redirect(url_for('create_vehicle'))
             
-            # Validar que la matrícula sea única
-            existing_vehicle = Vehiculo.query.filter_by(matricula=matricula).first()
+            # Validar que la matrícula sea única (sin tener en cuenta espacios, guiones o mayúsculas)
+            existing_vehicle = Vehiculo.query.filter_by(matricula_normalizada=normalizar_matricula(matricula)).first()
             if existing_vehicle:
                 flash("La matrícula ya está registrada.", "error")
                 return redirect(url_for('create_vehicle'))
@@ -178,6 +222,7 @@ def register_routes(app):
             )
             db.session.add(new_vehicle)
             db.session.commit()
+            registro_matriculas.agregar(matricula)
             
             flash("Vehículo creado exitosamente.", "success")
             return redirect(url_for('profile'))
@@ -215,12 +260,13 @@ def register_routes(app):
                 return redirect(url_for('edit_vehicle', vehicle_id=vehicle_id))
             
             # Validar que la matrícula sea única (excepto para el mismo vehículo)
-            existing_vehicle = Vehiculo.query.filter_by(matricula=matricula).first()
+            existing_vehicle = Vehiculo.query.filter_by(matricula_normalizada=normalizar_matricula(matricula)).first()
             if existing_vehicle and existing_vehicle.id != vehicle.id:
                 flash("La matrícula ya está registrada.", "error")
                 return redirect(url_for('edit_vehicle', vehicle_id=vehicle_id))
             
             # Actualizar los datos del vehículo
+            matricula_anterior = vehicle.matricula
             vehicle.marca = marca
             vehicle.modelo = modelo
             vehicle.matricula = matricula
@@ -228,6 +274,8 @@ def register_routes(app):
             
             # Guardar cambios en la base de datos
             db.session.commit()
+            registro_matriculas.eliminar(matricula_anterior)
+            registro_matriculas.agregar(matricula)
             
             flash("Vehículo actualizado exitosamente.", "success")
             return redirect(url_for('profile'))
@@ -257,6 +305,7 @@ def register_routes(app):
         # Eliminar el vehículo
         db.session.delete(vehicle)
         db.session.commit()
+        registro_matriculas.eliminar(vehicle.matricula)
         
         flash("Vehículo eliminado exitosamente.", "success")
         return redirect(url_for('profile'))
@@ -266,82 +315,115 @@ def register_routes(app):
     def about():
         return render_template('info.html')
     
-    # Ruta Parking Inferior
-    @app.route('/parkinginferior', methods=["GET", "POST"])
-    def parkinf():
-
-        plazas_data = ParkingInferior.query.all()
+    # Página de un nivel del parking
+    @app.route('/parking/<nivel>', methods=["GET", "POST"])
+    def parking_nivel(nivel):
+        datos_nivel = ocupacion.nivel(nivel)
+        if not datos_nivel:
+            abort(404)
 
         if request.method == 'POST':
-            numero_plaza = request.form.get('numero')
-            parking_inferior = ParkingInferior.query.filter_by(numero=numero_plaza).first()
-
-            if parking_inferior:
-                ParkingInferior.ocupada = int(request.form.get('ocupada'))  
-                db.session.commit()
-
-            plazas_data = parking_inferior.query.all()
-                
-        return render_template('parkinf.html', plazas=plazas_data)
+            try:
+                numero_plaza = int(request.form.get('numero'))
+                ocupada = bool(int(request.form.get('ocupada')))
+            except (TypeError, ValueError):
+                numero_plaza = None
+            if numero_plaza is not None and ocupacion.existe(nivel, numero_plaza):
+                if ocupacion.marcar(nivel, numero_plaza, ocupada):
+                    db.session.commit()
+                    eventos.publicar(nivel, numero_plaza, ocupada)
+
+        plazas_data = Plaza.query.filter_by(sitio=datos_nivel["sitio"], nivel=nivel).order_by(Plaza.numero).all()
+        return render_template('parking.html', nivel=datos_nivel, plazas=plazas_data)
+
+    # Rutas antiguas de cada planta
+    @app.route('/parkinginferior', methods=["GET", "POST"])
+    def parkinf():
+        return parking_nivel('PI')
 
-        
-    
-    # Ruta Parking Superior
     @app.route('/parkingsuperior', methods=["GET", "POST"])
     def parksup():
+        return parking_nivel('PS')
+
+    @app.route('/api/ocupacion', methods=['GET'])
+    def contadores_ocupacion():
+        # Contadores en memoria: sin consultas; si no ha cambiado nada se responde 304
+        version, cuerpo = ocupacion.contadores()
+        etag = f"{generacion_etag}-{version}"
+        if request.if_none_match.contains(etag):
+            respuesta = Response(status=304)
+        else:
+            respuesta = Response(cuerpo, mimetype='application/json')
+        respuesta.set_etag(etag)
+        respuesta.headers['Cache-Control'] = 'no-cache'
+        return respuesta
 
-        plazas_data = ParkingSuperior.query.all()
-
-        if request.method == 'POST':
-            numero_plaza = request.form.get('numero')
-            parking_superior = ParkingSuperior.query.filter_by(numero=numero_plaza).first()
-
-            if parking_superior:
-                ParkingSuperior.ocupada = int(request.form.get('ocupada')) 
-                db.session.commit()
-
-            # Volvemos a obtener todas las plazas después de actualizar
-            plazas_data = parking_superior.query.all()
-                
-        return render_template('parksup.html', plazassup=plazas_data)
+    @app.route('/api/niveles', methods=['GET'])
+    def listar_niveles():
+        sitio = request.args.get('sitio')
+        resumen = resumen_bd(sitio)
+        return jsonify([
+            dict(datos, **resumen.get((datos["sitio"], datos["codigo"]), {"ocupadas": 0, "total": 0}))
+            for datos in ocupacion.niveles(sitio)
+        ]), 200
 
 
     @app.route('/api/entrada', methods=['POST'])
     def entrada():
         data = request.get_json(force=True)
-        matricula = data.get('matricula')
         
-        reg = Vehiculo.query.filter_by(matricula=matricula).first()
+        # Matrícula tal como está registrada, aunque el OCR la lea con otro formato
+        matricula = registro_matriculas.buscar(data.get('matricula'))
 
-        if not reg:
+        if not matricula:
             return jsonify({'error': 'Matrícula no registrada'}), 403
-        
-        spot_libre_inf = ParkingInferior.query.filter_by(ocupada=False).first()
-        spot_libre_sup = ParkingSuperior.query.filter_by(ocupada=False).first()
 
-        if spot_libre_inf:
-            new_log = ParkingLog(
-                matricula=matricula,
-                tiempo_entrada=datetime.now(),
-                tiempo_salida=None
-            )
-            db.session.add(new_log)
-            spot_libre_inf.ocupada = True  
-            db.session.commit()
-            return jsonify({'success': 'Entrada registrada'}), 200
+        # La cámara puede repetir la entrada de un vehículo que ya está dentro: se
+        # devuelve su plaza sin abrir otra sesión (ni dejar la anterior huérfana).
+        # Las dos comprobaciones miran la memoria y solo van a la base de datos para
+        # confirmar un vehículo que ya estaba dentro
+        plaza = ocupacion.plaza_asignada(matricula)
+        if plaza or sesiones_abiertas.abierta(matricula):
+            if not plaza:
+                return jsonify({'error': 'El vehículo ya está dentro del parking'}), 409
+            return jsonify({
+                'success': 'El vehículo ya tenía la entrada registrada',
+                'nivel': plaza[0],
+                'plaza': plaza[1]
+            }), 200
+
+        # Reservar plaza (UPDATE condicional o SKIP LOCKED) en la misma transacción que el registro de entrada
+        plaza = ocupacion.asignar(matricula, data.get('sitio') or app.config.get('SITIO'))
 
-        elif spot_libre_sup:
-            new_log = ParkingLog(
-                matricula=matricula,
-                tiempo_entrada=datetime.now(),
-                tiempo_salida=None
-            )
-            db.session.add(new_log)
-            spot_libre_sup.ocupada = True  
+        if not plaza:
+            return jsonify({'error': 'Parking completo'}), 409
+
+        tiempo_entrada = datetime.now()
+        new_log = ParkingLog(
+            matricula=matricula,
+            tiempo_entrada=tiempo_entrada,
+            tiempo_salida=None
+        )
+        db.session.add(new_log)
+        try:
+            db.session.flush()
+            id_log = new_log.id
             db.session.commit()
-            return jsonify({'success': 'Entrada registrada en parking superior'}), 200
+        except Exception:
+            db.session.rollback()
+            ocupacion.deshacer_asignacion(matricula)
+            raise
+
+        sesiones_abiertas.abrir(matricula, id_log, tiempo_entrada)
+        eventos.publicar(*plaza, True)
+        estadisticas.registrar_entrada(plaza[0], tiempo_entrada)
 
-        return jsonify({'error': 'Parking completo'}), 409
+        nombre_nivel = ocupacion.nivel(plaza[0])["nombre"] or plaza[0]
+        return jsonify({
+            'success': f'Entrada registrada en {nombre_nivel}',
+            'nivel': plaza[0],
+            'plaza': plaza[1]
+        }), 200
 
 
     @app.route('/api/actualizarplaza', methods=['POST'])
@@ -350,21 +432,22 @@ def register_routes(app):
         
         sensor_id = data.get('sensorID')  
         plaza_id = data.get('plazaID')
-        estado = data.get('estado')  
+        estado = estado_ocupada(data.get('estado'))
         
-        if sensor_id not in ['PS', 'PI']:
+        if not isinstance(sensor_id, str) or not ocupacion.nivel(sensor_id):
             return jsonify({'error': 'ID de sensor inválido'}), 400
 
-        if sensor_id == 'PS':
-            plaza = ParkingSuperior.query.filter_by(numero=plaza_id).first()
-        else:  # sensor_id == 'PI'
-            plaza = ParkingInferior.query.filter_by(numero=plaza_id).first()
+        try:
+            plaza_id = int(plaza_id)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Plaza no encontrada'}), 404
 
-        if not plaza:
+        if not ocupacion.existe(sensor_id, plaza_id):
             return jsonify({'error': 'Plaza no encontrada'}), 404
 
-        plaza.ocupada = bool(estado)
-        db.session.commit()
+        if ocupacion.marcar(sensor_id, plaza_id, estado):
+            db.session.commit()
+            eventos.publicar(sensor_id, plaza_id, estado)
 
         return jsonify({'success': 'Plaza actualizada'}), 200
 
@@ -373,33 +456,83 @@ def register_routes(app):
     @app.route('/api/salida', methods=['POST'])
     def salida():
         data = request.get_json(force=True)
-        matricula = data.get('matricula')
-
-        reg = Vehiculo.query.filter_by(matricula=matricula).first()
+        matricula = registro_matriculas.buscar(data.get('matricula'))
 
-        if not reg:
+        if not matricula:
             return jsonify({'error': 'Matricula no registrada'}), 403
         
-        log = ParkingLog.query.filter_by(matricula=matricula, tiempo_salida=None).first()
+        # Cerrar la sesión abierta del vehículo sin recorrer el historial
+        tiempo_salida = datetime.now()
+        tiempo_entrada = sesiones_abiertas.cerrar(matricula, tiempo_salida)
 
-        if not log:
+        if not tiempo_entrada:
             return jsonify({'error': 'No hay registro de entrada para esta matrícula'}), 404
 
-        log.tiempo_salida = datetime.now()
-
-        # Liberar la plaza ocupada por el vehículo
-        plaza_inf = ParkingInferior.query.filter_by(ocupada=True).first()
-        plaza_sup = ParkingSuperior.query.filter_by(ocupada=True).first()
-
-        if plaza_inf:
-            plaza_inf.ocupada = False
-        elif plaza_sup:
-            plaza_sup.ocupada = False
+        # Liberar la plaza asignada a este vehículo (si sigue ocupada por él)
+        plaza = ocupacion.liberar(matricula)
 
         db.session.commit()
+        if plaza:
+            eventos.publicar(*plaza, False)
+        estadisticas.registrar_salida(plaza[0] if plaza else None, tiempo_entrada, tiempo_salida)
         return jsonify({'success': 'Salida registrada'}), 200
 
 
+    @app.route('/api/stats', methods=['GET'])
+    def consultar_estadisticas():
+        periodo = request.args.get('periodo', 'hora')
+        nivel = request.args.get('nivel')
+
+        if periodo not in PERIODOS:
+            return jsonify({'error': 'Periodo inválido'}), 400
+
+        try:
+            hasta = datetime.fromisoformat(request.args['hasta']) if 'hasta' in request.args else datetime.now()
+            if 'desde' in request.args:
+                desde = datetime.fromisoformat(request.args['desde'])
+            else:
+                desde = hasta - (timedelta(hours=1) if periodo == 'minuto' else timedelta(days=1))
+        except ValueError:
+            return jsonify({'error': 'Formato de fecha inválido'}), 400
+
+        return jsonify({
+            'periodo': periodo,
+            'desde': desde.isoformat(),
+            'hasta': hasta.isoformat(),
+            'datos': estadisticas.consultar(periodo, desde, hasta, nivel)
+        }), 200
+
+
+    @app.route('/api/historial', methods=['GET'])
+    def historial():
+        # Cada usuario solo ve las entradas y salidas de sus propios vehículos
+        if 'user_id' not in session:
+            return jsonify({'error': 'Inicia sesión para consultar el historial'}), 401
+        propias = [matricula for (matricula,) in db.session.query(Vehiculo.matricula).filter(
+            Vehiculo.id_user == session['user_id'], Vehiculo.matricula.isnot(None))]
+
+        matricula = request.args.get('matricula')
+        if matricula:
+            matricula = registro_matriculas.buscar(matricula, aproximada=False) or matricula
+            if matricula not in propias:
+                return jsonify({'error': 'La matrícula no es de ninguno de tus vehículos'}), 403
+            propias = [matricula]
+
+        try:
+            desde = datetime.fromisoformat(request.args['desde']) if 'desde' in request.args else None
+            hasta = datetime.fromisoformat(request.args['hasta']) if 'hasta' in request.args else None
+        except ValueError:
+            return jsonify({'error': 'Formato de fecha inválido'}), 400
+
+        sesiones = consultar_historial(desde=desde, hasta=hasta, matriculas=propias)
+        return jsonify([{
+            'id': sesion['id'],
+            'matricula': sesion['matricula'],
+            'tiempo_entrada': sesion['tiempo_entrada'].isoformat(),
+            'tiempo_salida': sesion['tiempo_salida'].isoformat() if sesion['tiempo_salida'] else None
+        } for sesion in sesiones]), 200
+
+
     @app.route('/parking_log', methods=['POST'])
     def verificar_cambio():
         try:
@@ -423,6 +556,37 @@ def register_routes(app):
             print(f"❌ Error al verificar cambios en la base de datos: {e}")
             return jsonify({"error": "Error en la base de datos"}), 500
 
+    @app.context_processor
+    def url_stream():
+        def url_stream_plazas():
+            """Stream SSE para los paneles: el servidor asyncio de la ingesta si está activo."""
+            if app.config.get('SSE_URL'):
+                return app.config['SSE_URL']
+            if not app.config.get('INGESTA_ACTIVA'):
+                return url_for('stream_plazas')
+            host = urlsplit(request.host_url).hostname
+            host = f"[{host}]" if ':' in host else host
+            return f"{request.scheme}://{host}:{app.config['INGESTA_PUERTO']}/api/plazas/stream"
+        return {'url_stream_plazas': url_stream_plazas}
+
+    @app.route('/api/plazas/stream')
+    def stream_plazas():
+        # Server-Sent Events con los cambios de estado de las plazas, para cuando la
+        # ingesta no está activa. Cada stream ocupa un hilo del servidor: por encima
+        # del límite se rechaza para no dejar sin hilos a la barrera; el navegador lo
+        # reintenta solo
+        cola = eventos.suscribir()
+        if cola is None:
+            return jsonify({'error': 'Demasiados clientes conectados'}), 503, {'Retry-After': '30'}
+        respuesta = Response(
+            eventos.escuchar(cola),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+        # Si el cliente se va antes de empezar a leer el generador no llega a cerrarse
+        respuesta.call_on_close(lambda: eventos.cancelar(cola))
+        return respuesta
+
     @app.route('/sensorpuerta', methods=['POST'])
     def recibir_datos_sensor():
         try:
@@ -432,6 +596,9 @@ def register_routes(app):
 
             if sensor_id is not None and estado is not None:
                 print(f"📡 Sensor {sensor_id} ha detectado un objeto cerca: {estado}")
+                sensores.visto(NIVEL_PUERTA, 0)
+                puerta_status["estado"] = estado
+                puerta_status["tiempo"] = datetime.now()
                 return jsonify({"mensaje": "Datos recibidos correctamente"}), 200
             else:
                 return jsonify({"error": "Datos inválidos"}), 400
@@ -439,16 +606,23 @@ def register_routes(app):
             print(f"❌ Error procesando datos del sensor: {e}")
             return jsonify({"error": "Error interno"}), 500
 
+    @app.route('/sensorpuerta', methods=['GET'])
+    def consultar_sensor_puerta():
+        tiempo = puerta_status["tiempo"]
+        return jsonify({
+            "estado": puerta_status["estado"],
+            "segundos": (datetime.now() - tiempo).total_seconds() if tiempo else None
+        }), 200
+
     @app.route('/sensor', methods=['POST'])
     def receive_sensor_data():
         global sensor_status
         data = request.get_json()
     
-        if data and "sensorID" in data and "plazaID" in data and "estado" in data:
+        if isinstance(data, dict) and "sensorID" in data and "plazaID" in data and "estado" in data:
             try:
-                sensorID = data["sensorID"]
-                plazaID = int(data["plazaID"])
-                estado = bool(data["estado"])  # Convertir a booleano
+                sensorID, plazaID = ids_lectura(data)
+                estado = estado_ocupada(data["estado"])
 
                 sensor_status = {
                     "sensorID": sensorID,
@@ -458,15 +632,72 @@ def register_routes(app):
 
                 print("Datos recibidos:", sensor_status)
 
-                # Hacer una petición interna a '/api/actualizarplaza'
-                with app.test_request_context('/api/actualizarplaza', method='POST', json=sensor_status):
-                    return actualizarplaza()
+                if not ocupacion.nivel(sensorID):
+                    return jsonify({'error': 'ID de sensor inválido'}), 400
+
+                if not ocupacion.existe(sensorID, plazaID):
+                    return jsonify({'error': 'Plaza no encontrada'}), 404
+
+                sensores.visto(sensorID, plazaID)
+                if ocupacion.marcar(sensorID, plazaID, estado):
+                    db.session.commit()
+                    eventos.publicar(sensorID, plazaID, estado)
+
+                return jsonify({'success': 'Plaza actualizada'}), 200
 
             except ValueError:
                 return jsonify({"error": "Formato de datos inválido"}), 400
         else:
             return jsonify({"error": "Datos inválidos"}), 400
 
+    @app.route('/api/sensores/estado', methods=['GET'])
+    def estado_sensores():
+        # Última lectura de cada sensor; los que no informan hace tiempo salen como inactivos
+        lista = sensores.estado()
+        return jsonify({
+            "sensores": lista,
+            "inactivos": sum(1 for sensor in lista if sensor["inactivo"]),
+            "limite_segundos": sensores.limite
+        }), 200
+
+    @app.route('/api/sensores/batch', methods=['POST'])
+    def recibir_lote_sensores():
+        data = request.get_json(silent=True)
+
+        if not isinstance(data, list):
+            return jsonify({"error": "Se esperaba una lista de lecturas"}), 400
+
+        lecturas = []
+        desconocidas = []
+        for lectura in data:
+            if not isinstance(lectura, dict) or not {"sensorID", "plazaID", "estado"} <= lectura.keys():
+                return jsonify({"error": "Datos inválidos"}), 400
+            try:
+                sensor_id, plaza_id = ids_lectura(lectura)
+            except ValueError as e:
+                return jsonify({"error": "Formato de datos inválido", "detalle": str(e)}), 400
+
+            if not ocupacion.existe(sensor_id, plaza_id):
+                desconocidas.append({"sensorID": sensor_id, "plazaID": plaza_id})
+                continue
+            lecturas.append((sensor_id, plaza_id, estado_ocupada(lectura["estado"])))
+
+        sensores.visto_lote(lecturas)
+
+        # Todas las lecturas en la misma transacción; solo se guardan y publican los cambios
+        cambios = ocupacion.marcar_lote(lecturas)
+        if cambios:
+            db.session.commit()
+        for cambio in cambios:
+            eventos.publicar(*cambio)
+
+        return jsonify({
+            "success": "Lote procesado",
+            "recibidas": len(data),
+            "actualizadas": len(cambios),
+            "desconocidas": desconocidas
+        }), 200
+
     # Ruta de inicio
     @app.route('/')
     def index():
@@ -480,19 +711,15 @@ def register_routes(app):
     @app.route('/logout')
     def logout():
         session.clear()
-<<<<<<< HEAD
         flash("Sesión cerrada correctamente.")
         return redirect('/login')
-=======
-        return redirect('/')
->>>>>>> origin/alex
 
     # Ruta de sesión activa
     @app.route('/home')
     def home():
         username = session.get('username')
         if username:
-            return render_template('home.html', username=username)
+            return render_template('home.html', username=username, niveles=ocupacion.niveles())
         else:
             flash("Por favor inicia sesión primero.")
             return redirect('/login')
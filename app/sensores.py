@@ -0,0 +1,68 @@
+import threading
+from datetime import datetime, timedelta
+
+from . import db
+
+
+class VigilanciaSensores:
+    """Última vez que se ha recibido cada sensor, para detectar los que han dejado de informar.
+
+    Los sensores solo envían cuando cambia una plaza, pero mandan un latido con el
+    estado completo cada pocos segundos; si un sensor pasa más de `limite` segundos
+    sin enviar nada se considera inactivo (sin batería, sin WiFi, averiado...).
+    Al arrancar se vigilan todas las plazas de la tabla plazas, como vistas en ese
+    momento: un sensor que no llega a enviar nunca también acaba como inactivo.
+    """
+
+    def __init__(self, limite=90):
+        self.limite = limite
+        self._lock = threading.Lock()
+        self._vistos = {}
+
+    def init_app(self, app):
+        self.limite = app.config.get('SENSOR_INACTIVO_SEGUNDOS', self.limite)
+        with app.app_context():
+            try:
+                self.sembrar()
+            except Exception as e:
+                print(f"❌ Error al cargar los sensores de las plazas: {e}")
+
+    def sembrar(self, momento=None):
+        """Empieza a vigilar todas las plazas, sin pisar las lecturas ya recibidas."""
+        from .models import Plaza
+
+        momento = momento or datetime.now()
+        plazas = db.session.query(Plaza.nivel, Plaza.numero).all()
+        with self._lock:
+            for nivel, numero in plazas:
+                self._vistos.setdefault((nivel, numero), momento)
+
+    def visto(self, nivel, numero, momento=None):
+        with self._lock:
+            self._vistos[(nivel, numero)] = momento or datetime.now()
+
+    def visto_lote(self, lecturas, momento=None):
+        momento = momento or datetime.now()
+        with self._lock:
+            for nivel, numero, _ in lecturas:
+                self._vistos[(nivel, numero)] = momento
+
+    def estado(self):
+        """Lista de sensores con la última lectura y si se consideran inactivos."""
+        ahora = datetime.now()
+        limite = timedelta(seconds=self.limite)
+        with self._lock:
+            vistos = sorted(self._vistos.items(), key=lambda item: (str(item[0][0]), item[0][1]))
+        return [{
+            "nivel": nivel,
+            "numero": numero,
+            "ultima_lectura": momento.isoformat(),
+            "segundos": round((ahora - momento).total_seconds(), 1),
+            "inactivo": ahora - momento > limite
+        } for (nivel, numero), momento in vistos]
+
+    def inactivos(self):
+        return [sensor for sensor in self.estado() if sensor["inactivo"]]
+
+
+sensores = VigilanciaSensores()
@@ -0,0 +1,92 @@
+import threading
+
+from . import db
+from .models import ParkingLog
+
+
+class SesionesAbiertas:
+    """Vehículos que están dentro del parking: matrícula -> (id de parking_log, tiempo_entrada).
+
+    Permite cerrar la sesión de un vehículo que sale con un UPDATE por clave primaria,
+    sin buscar en todo el historial. Si la matrícula no está en memoria (p. ej. entró
+    por otro proceso) se busca en la tabla con el índice (matricula, tiempo_salida).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sesiones = {}
+        self._cargado = False
+
+    def init_app(self, app):
+        with app.app_context():
+            try:
+                self.cargar()
+            except Exception as e:
+                print(f"❌ Error al cargar las sesiones abiertas del parking: {e}")
+
+    def cargar(self):
+        sesiones = {}
+        consulta = db.session.query(ParkingLog.id, ParkingLog.matricula, ParkingLog.tiempo_entrada)
+        for id_log, matricula, tiempo_entrada in consulta.filter(ParkingLog.tiempo_salida.is_(None)):
+            sesiones[matricula] = (id_log, tiempo_entrada)
+
+        with self._lock:
+            self._sesiones = sesiones
+            self._cargado = True
+
+    def abierta(self, matricula):
+        """True si la matrícula tiene una sesión sin salida.
+
+        Solo se consulta la base de datos cuando la memoria dice que sí, para confirmar
+        que esa fila sigue abierta: otro proceso (o alguien a mano) puede haberla
+        cerrado, y entonces se olvida. Una entrada nueva no hace ninguna consulta.
+        """
+        if not self._cargado:
+            self.cargar()
+        with self._lock:
+            sesion = self._sesiones.get(matricula)
+        if sesion is None:
+            return False
+
+        sigue_abierta = db.session.query(ParkingLog.id).filter(
+            ParkingLog.id == sesion[0], ParkingLog.tiempo_salida.is_(None)
+        ).first() is not None
+        if not sigue_abierta:
+            with self._lock:
+                if self._sesiones.get(matricula) == sesion:
+                    del self._sesiones[matricula]
+        return sigue_abierta
+
+    def abrir(self, matricula, id_log, tiempo_entrada):
+        with self._lock:
+            self._sesiones[matricula] = (id_log, tiempo_entrada)
+
+    def cerrar(self, matricula, tiempo_salida):
+        """Marca la salida de la sesión abierta de la matrícula en la sesión de base de datos.
+
+        Devuelve el tiempo de entrada, o None si la matrícula no tiene sesión abierta.
+        El commit lo hace quien llama.
+        """
+        if not self._cargado:
+            self.cargar()
+
+        with self._lock:
+            sesion = self._sesiones.pop(matricula, None)
+
+        if sesion:
+            id_log, tiempo_entrada = sesion
+            # Solo si sigue abierta: otro proceso puede haberla cerrado ya
+            actualizadas = db.session.query(ParkingLog).filter(
+                ParkingLog.id == id_log, ParkingLog.tiempo_salida.is_(None)
+            ).update({'tiempo_salida': tiempo_salida}, synchronize_session=False)
+            if actualizadas:
+                return tiempo_entrada
+
+        log = ParkingLog.query.filter_by(matricula=matricula, tiempo_salida=None).first()
+        if not log:
+            return None
+        log.tiempo_salida = tiempo_salida
+        return log.tiempo_entrada
+
+
+sesiones_abiertas = SesionesAbiertas()
@@ -0,0 +1,338 @@
+"""Prueba de carga del servidor: simula los sensores de plaza, el sensor de la entrada y las cámaras.
+
+Arranca la aplicación con waitress sobre una base de datos de pruebas (SQLite por
+defecto, o la URL de MySQL que se indique), genera tráfico con llegadas de Poisson
+a las tasas indicadas y muestra, por tipo de petición, latencias p50/p95/p99,
+throughput, errores y consultas SQL por petición. Los resultados se pueden guardar
+como referencia y comparar con ejecuciones posteriores.
+
+    python benchmark/carga.py --sensores 200 --periodo-sensor 1 --duracion 30
+    python benchmark/carga.py --guardar            # guarda benchmark/referencia.json
+    python benchmark/carga.py --comparar           # compara con la referencia
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REFERENCIA = os.path.join(RAIZ, 'benchmark', 'referencia.json')
+
+# Rutas de cada tipo de tráfico (endpoint de Flask -> nombre en el informe)
+ENDPOINTS = {
+    'receive_sensor_data': 'sensor',
+    'recibir_datos_sensor': 'puerta',
+    'entrada': 'entrada',
+    'salida': 'salida',
+}
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+
+def preparar_app(url_bd, niveles, plazas, vehiculos, hilos):
+    """Crea la aplicación sobre una base de datos vacía con plazas y vehículos de prueba."""
+    os.environ['DATABASE_URL'] = url_bd
+    os.environ.setdefault('DB_POOL_SIZE', str(hilos))
+    sys.path.insert(0, RAIZ)
+
+    from app import create_app, db
+    from app.models import Nivel, Plaza, User, Vehiculo
+
+    app = create_app('production')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        for orden, codigo in enumerate(niveles, 1):
+            db.session.add(Nivel(id=orden, sitio=app.config['SITIO'], codigo=codigo, nombre=codigo, orden=orden))
+            for numero in range(1, plazas + 1):
+                db.session.add(Plaza(sitio=app.config['SITIO'], nivel=codigo, numero=numero, ocupada=False))
+        usuario = User(name='carga', password='x', email='carga@parkease', dni='00000000T', phone=600000000)
+        db.session.add(usuario)
+        db.session.flush()
+        matriculas = [f'{i:04d}BCH' for i in range(vehiculos)]
+        db.session.add_all(Vehiculo(id_user=usuario.id, matricula=m) for m in matriculas)
+        db.session.commit()
+
+        from app.ocupacion import ocupacion
+        from app.matriculas import registro_matriculas
+        from app.sesiones import sesiones_abiertas
+        ocupacion.cargar()
+        registro_matriculas.cargar()
+        sesiones_abiertas.cargar()
+
+    contar_consultas(app)
+    return app, matriculas
+
+
+def contar_consultas(app):
+    """Cuenta las sentencias SQL de cada petición (cada hilo de waitress atiende una a la vez)."""
+    from sqlalchemy import event
+    from flask import request
+
+    from app import db
+
+    local = threading.local()
+    app.consultas = {}
+    lock = threading.Lock()
+
+    with app.app_context():
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def antes(conexion, cursor, sentencia, parametros, contexto, multiples):
+            if getattr(local, 'activa', False):
+                local.consultas += 1
+
+    @app.before_request
+    def empezar():
+        local.activa = True
+        local.consultas = 0
+
+    @app.after_request
+    def terminar(respuesta):
+        nombre = ENDPOINTS.get(request.endpoint)
+        if nombre:
+            with lock:
+                total = app.consultas.setdefault(nombre, [0, 0])
+                total[0] += local.consultas
+                total[1] += 1
+        local.activa = False
+        return respuesta
+
+
+class Generador:
+    """Lanza peticiones con llegadas de Poisson (bucle abierto: no espera a las respuestas)."""
+
+    def __init__(self, puerto, clientes):
+        self.puerto = puerto
+        self._local = threading.local()
+        self._ejecutor = ThreadPoolExecutor(clientes)
+        self._lock = threading.Lock()
+        self.latencias = {}
+        self.errores = {}
+        self.dentro = set()
+
+    def _conexion(self):
+        if not hasattr(self._local, 'conexion'):
+            self._local.conexion = http.client.HTTPConnection('127.0.0.1', self.puerto, timeout=30)
+        return self._local.conexion
+
+    def enviar(self, nombre, ruta, datos, esperados=(200,)):
+        """Hace la petición y anota su latencia; devuelve el código HTTP (None si falla la conexión)."""
+        cuerpo = json.dumps(datos)
+        estado = None
+        inicio = time.perf_counter()
+        try:
+            conexion = self._conexion()
+            conexion.request('POST', ruta, cuerpo, {'Content-Type': 'application/json'})
+            respuesta = conexion.getresponse()
+            respuesta.read()
+            estado = respuesta.status
+        except (OSError, http.client.HTTPException):
+            self._local.__dict__.pop('conexion', None)
+        duracion = time.perf_counter() - inicio
+        with self._lock:
+            self.latencias.setdefault(nombre, []).append(duracion)
+            if estado not in esperados:
+                self.errores[nombre] = self.errores.get(nombre, 0) + 1
+        return estado
+
+    def flujo(self, tasa, fin, tarea):
+        """Genera llegadas a `tasa` peticiones por segundo hasta `fin` (time.monotonic)."""
+        if tasa <= 0:
+            return
+        siguiente = time.monotonic()
+        while siguiente < fin:
+            espera = siguiente - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            self._ejecutor.submit(tarea)
+            siguiente += random.expovariate(tasa)
+
+    def cerrar(self):
+        self._ejecutor.shutdown(wait=True)
+
+
+def ejecutar(args):
+    carpeta = tempfile.mkdtemp(prefix='parkease-carga-')
+    url_bd = args.db or f"sqlite:///{os.path.join(carpeta, 'carga.db')}"
+    niveles = args.niveles.split(',')
+    app, matriculas = preparar_app(url_bd, niveles, args.plazas, args.vehiculos, args.hilos)
+
+    from waitress import create_server
+    servidor = create_server(app, host='127.0.0.1', port=args.puerto, threads=args.hilos)
+    threading.Thread(target=servidor.run, daemon=True).start()
+
+    generador = Generador(args.puerto, args.clientes)
+    fuera = list(matriculas)
+    lock = threading.Lock()
+
+    def sensor():
+        generador.enviar('sensor', '/sensor', {
+            'sensorID': random.choice(niveles),
+            'plazaID': random.randint(1, args.plazas),
+            'estado': random.choice(('ocupado', 'libre'))
+        })
+
+    def puerta():
+        generador.enviar('puerta', '/sensorpuerta', {
+            'sensorID': 'entrada',
+            'estado': random.choice(('detecto', 'no_deteccion'))
+        })
+
+    def entrada():
+        with lock:
+            if not fuera:
+                return
+            matricula = fuera.pop(random.randrange(len(fuera)))
+        # 409 (parking completo) es una respuesta válida: el vehículo se queda fuera
+        if generador.enviar('entrada', '/api/entrada', {'matricula': matricula}, esperados=(200, 409)) == 200:
+            with lock:
+                generador.dentro.add(matricula)
+        else:
+            with lock:
+                fuera.append(matricula)
+
+    def salida():
+        with lock:
+            if not generador.dentro:
+                return
+            matricula = generador.dentro.pop()
+        generador.enviar('salida', '/api/salida', {'matricula': matricula})
+        with lock:
+            fuera.append(matricula)
+
+    flujos = [
+        (args.sensores / args.periodo_sensor, sensor),
+        (args.puertas / args.periodo_puerta, puerta),
+        (args.entradas / 60, entrada),
+        (args.salidas / 60, salida),
+    ]
+    print(f"🚦 {args.duracion}s de carga contra {url_bd} "
+          f"({args.sensores} sensores, {args.puertas} entradas, {args.entradas}/{args.salidas} vehículos por minuto)")
+    inicio = time.monotonic()
+    fin = inicio + args.duracion
+    hilos = [threading.Thread(target=generador.flujo, args=(tasa, fin, tarea)) for tasa, tarea in flujos]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    generador.cerrar()
+    duracion = time.monotonic() - inicio
+
+    resultados = {}
+    for nombre in ENDPOINTS.values():
+        latencias = generador.latencias.get(nombre, [])
+        if not latencias:
+            continue
+        consultas, peticiones = app.consultas.get(nombre, (0, 0))
+        resultados[nombre] = {
+            'peticiones': len(latencias),
+            'errores': generador.errores.get(nombre, 0),
+            'throughput': round(len(latencias) / duracion, 1),
+            'p50_ms': round(percentil(latencias, 50) * 1000, 2),
+            'p95_ms': round(percentil(latencias, 95) * 1000, 2),
+            'p99_ms': round(percentil(latencias, 99) * 1000, 2),
+            'consultas_por_peticion': round(consultas / peticiones, 2) if peticiones else None,
+        }
+    return resultados
+
+
+def mostrar(resultados, referencia=None, tolerancia=0.2):
+    """Imprime la tabla de resultados; con referencia marca lo que empeora más de `tolerancia`."""
+    columnas = ('peticiones', 'errores', 'throughput', 'p50_ms', 'p95_ms', 'p99_ms', 'consultas_por_peticion')
+    print(f"{'':10}" + ''.join(f"{columna:>24}" for columna in columnas))
+    regresiones = []
+    for nombre, datos in resultados.items():
+        fila = f"{nombre:10}"
+        for columna in columnas:
+            valor = datos[columna]
+            texto = '-' if valor is None else str(valor)
+            anterior = (referencia or {}).get(nombre, {}).get(columna)
+            if anterior and valor is not None and columna not in ('peticiones', 'errores'):
+                # El throughput depende de la carga generada; solo cuentan latencias y consultas
+                cambio = (valor - anterior) / anterior
+                peor = columna != 'throughput' and cambio > tolerancia
+                texto += f" ({cambio:+.0%}{' ⚠' if peor else ''})"
+                if peor:
+                    regresiones.append(f"{nombre}.{columna}")
+            fila += f"{texto:>24}"
+        print(fila)
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de ParkEase")
+    parser.add_argument('--db', help="URL de una base de datos de pruebas (por defecto un SQLite temporal)")
+    parser.add_argument('--vaciar-bd', action='store_true',
+                        help="Confirmar que la base de datos de --db se puede borrar y volver a crear")
+    parser.add_argument('--duracion', type=float, default=20, help="Segundos de carga")
+    parser.add_argument('--sensores', type=int, default=100, help="Sensores de plaza simulados")
+    parser.add_argument('--periodo-sensor', type=float, default=1.0, help="Segundos entre lecturas de cada sensor")
+    parser.add_argument('--puertas', type=int, default=2, help="Sensores de entrada simulados")
+    parser.add_argument('--periodo-puerta', type=float, default=0.5, help="Segundos entre lecturas de cada entrada")
+    parser.add_argument('--entradas', type=float, default=120, help="Entradas de vehículos por minuto")
+    parser.add_argument('--salidas', type=float, default=120, help="Salidas de vehículos por minuto")
+    parser.add_argument('--niveles', default='PI,PS', help="Códigos de los niveles separados por comas")
+    parser.add_argument('--plazas', type=int, default=100, help="Plazas por nivel")
+    parser.add_argument('--vehiculos', type=int, default=1000, help="Vehículos registrados")
+    parser.add_argument('--hilos', type=int, default=16, help="Hilos del servidor")
+    parser.add_argument('--clientes', type=int, default=64, help="Peticiones simultáneas máximas")
+    parser.add_argument('--puerto', type=int, default=18081)
+    parser.add_argument('--referencia', default=REFERENCIA, help="Fichero JSON de referencia")
+    parser.add_argument('--guardar', action='store_true', help="Guardar los resultados como referencia")
+    parser.add_argument('--comparar', action='store_true', help="Comparar con la referencia guardada")
+    parser.add_argument('--perfil-sql', action='store_true',
+                        help="Activar el perfil SQL de la aplicación y mostrar sus avisos (N+1, cargas ansiosas)")
+    parser.add_argument('--tolerancia', type=float, default=0.2, help="Empeoramiento admitido al comparar (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    if args.db and not args.vaciar_bd:
+        parser.error("--db borra todas las tablas de esa base de datos: añade --vaciar-bd para confirmarlo")
+
+    if args.perfil_sql:
+        os.environ['PARKEASE_PERFIL_SQL'] = '1'
+
+    resultados = ejecutar(args)
+
+    referencia = None
+    if args.comparar:
+        if os.path.exists(args.referencia):
+            with open(args.referencia) as fichero:
+                referencia = json.load(fichero)['resultados']
+        else:
+            print(f"❌ No existe la referencia {args.referencia}")
+
+    regresiones = mostrar(resultados, referencia, args.tolerancia)
+
+    if args.perfil_sql:
+        from app.perfil_sql import perfil_sql
+        print("\nPerfil SQL por endpoint:")
+        print(perfil_sql.texto_resumen())
+
+    if args.guardar:
+        with open(args.referencia, 'w') as fichero:
+            json.dump({
+                'fecha': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'parametros': {clave: valor for clave, valor in vars(args).items()
+                               if clave not in ('guardar', 'comparar', 'referencia', 'db', 'vaciar_bd', 'perfil_sql')},
+                'resultados': resultados
+            }, fichero, indent=2)
+        print(f"💾 Referencia guardada en {args.referencia}")
+
+    if regresiones:
+        print(f"⚠ Empeoran respecto a la referencia: {', '.join(regresiones)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
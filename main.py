@@ -1,7 +1,13 @@
-from app import create_app 
+import os
+
+# El servidor de desarrollo arranca también la ingesta de sensores (PARKEASE_INGESTA=0 para no hacerlo)
+os.environ.setdefault('PARKEASE_INGESTA', '1')
+
+from app import create_app  # noqa: E402
 
 app = create_app()
 # Inicializar base de datos y ejecutar la aplicación
 if __name__ == "__main__":
     
-    app.run(host='0.0.0.0', port=81, debug=True)
+    # Sin el recargador: el proceso que vigila los ficheros también abriría los puertos de la ingesta
+    app.run(host='0.0.0.0', port=81, debug=True, use_reloader=False)
@@ -2,6 +2,7 @@ from machine import Pin, PWM
 import time
 import urequests
 import network
+from protocolo_udp import ClienteUDP
 
 # Configuración de WiFi
 wlan = network.WLAN(network.STA_IF)
@@ -17,6 +18,19 @@ sensors = [
     {"id": "PS", "plaza": 18, "trigger": 12, "echo": 13},
     {"id": "PI", "plaza": 12, "trigger": 14, "echo": 27}
 ]
+for sensor in sensors:
+    sensor["ocupada"] = None  # Estado confirmado (None hasta la primera lectura)
+    sensor["ciclos"] = 0      # Ciclos seguidos que la lectura contradice el estado
+
+# Filtrado de las lecturas de plaza
+LECTURAS_MEDIANA = 5     # Medidas por ciclo; se usa la mediana
+UMBRAL_OCUPADO = 8       # cm: por debajo, una plaza libre pasa a ocupada
+UMBRAL_LIBRE = 12        # cm: por encima, una plaza ocupada pasa a libre (histéresis)
+CICLOS_CONFIRMACION = 2  # Ciclos seguidos con el nuevo estado antes de cambiarlo
+
+# Envío: solo los cambios, y el estado completo como latido cada LATIDO segundos
+LATIDO = 30
+REPETICIONES = 2  # Ciclos en los que se reenvía un cambio por si se pierde la trama
 
 # Configuración del sensor de entrada
 trigger_entrada = Pin(26, Pin.OUT)
@@ -27,8 +41,12 @@ servo_pin = Pin(33)
 servo = PWM(servo_pin, freq=50)
 
 # URLs del servidor
-url_plazas = "http://172.16.1.248:81/sensor"
-url_entrada = "http://172.16.1.248:81/sensorpuerta"
+url_plazas = "http://172.16.1.248:8081/api/sensores/batch"
+url_entrada = "http://172.16.1.248:8081/sensorpuerta"
+
+# Protocolo binario por UDP (protocolo_udp.py); con False se usa JSON por HTTP
+usar_udp = True
+cliente_udp = ClienteUDP("172.16.1.248", 8082) if usar_udp else None
 
 def medir_distancia(trigger, echo):
     """Mide la distancia usando un sensor ultrasónico."""
@@ -73,36 +91,114 @@ def controlar_barrera(estado):
         servo.duty(77)  # 90°
     print(f"Barrera {estado}")
 
+def medir_mediana(trigger, echo, n=LECTURAS_MEDIANA):
+    """Mediana de n medidas válidas, para que una lectura con ruido no cambie la plaza."""
+    medidas = []
+    for _ in range(n):
+        distancia = medir_distancia(trigger, echo)
+        if distancia != -1:
+            medidas.append(distancia)
+        time.sleep_ms(10)
+    if not medidas:
+        return -1
+    medidas.sort()
+    return medidas[len(medidas) // 2]
+
+def actualizar_estado(sensor, distancia):
+    """Aplica histéresis y confirmación al estado de la plaza; devuelve True si cambia."""
+    ocupada = sensor["ocupada"]
+    if ocupada is None:
+        nuevo = distancia < (UMBRAL_OCUPADO + UMBRAL_LIBRE) / 2
+    elif ocupada:
+        nuevo = distancia <= UMBRAL_LIBRE
+    else:
+        nuevo = distancia < UMBRAL_OCUPADO
+
+    if nuevo == ocupada:
+        sensor["ciclos"] = 0
+        return False
+    sensor["ciclos"] += 1
+    if ocupada is not None and sensor["ciclos"] < CICLOS_CONFIRMACION:
+        return False
+    sensor["ocupada"] = nuevo
+    sensor["ciclos"] = 0
+    return True
+
 def monitorear_plazas():
-    """Monitorea las plazas de estacionamiento y envía los datos al servidor."""
+    """Mide las plazas y devuelve las lecturas (nivel, plaza, ocupada) de las que han cambiado."""
+    cambios = []
     for sensor in sensors:
         trigger = Pin(sensor["trigger"], Pin.OUT)
         echo = Pin(sensor["echo"], Pin.IN)
-        distancia = medir_distancia(trigger, echo)
+        distancia = medir_mediana(trigger, echo)
         if distancia == -1:
             continue  # Ignorar lectura inválida
-        estado = "ocupado" if distancia < 10 else "libre"
-        data_plaza = {"sensorID": sensor["id"], "plazaID": sensor["plaza"], "estado": estado}
-        enviar_datos(url_plazas, data_plaza)
-        print("Enviado:", data_plaza)
+        if actualizar_estado(sensor, distancia):
+            cambios.append((sensor["id"], sensor["plaza"], sensor["ocupada"]))
+    return cambios
+
+def estado_completo(estado_entrada):
+    """Lecturas de todas las plazas con estado conocido y de la entrada (latido)."""
+    lecturas = [(s["id"], s["plaza"], s["ocupada"]) for s in sensors if s["ocupada"] is not None]
+    if estado_entrada:
+        lecturas.append(("PUERTA", 0, estado_entrada == "detecto"))
+    return lecturas
+
+def enviar_lecturas(lecturas):
+    """Envía las lecturas por UDP en una trama o, si no se usa UDP, por HTTP."""
+    if not lecturas:
+        return
+    if usar_udp:
+        cliente_udp.enviar(lecturas)
+        return
+    plazas = [
+        {"sensorID": nivel, "plazaID": plaza, "estado": "ocupado" if ocupada else "libre"}
+        for nivel, plaza, ocupada in lecturas if nivel != "PUERTA"
+    ]
+    if plazas:
+        enviar_datos(url_plazas, plazas)
+    for nivel, _, ocupada in lecturas:
+        if nivel == "PUERTA":
+            enviar_datos(url_entrada, {"sensorID": "entrada", "estado": "detecto" if ocupada else "no_deteccion"})
+    print("Enviado:", lecturas)
 
 def monitorear_entrada():
-    """Monitorea la entrada y controla la barrera según la respuesta del servidor."""
+    """Mide la entrada, controla la barrera y devuelve el estado (None si la lectura no es válida)."""
     distancia = medir_distancia(trigger_entrada, echo_entrada)
     if distancia <= 0:
         return  # Ignorar lectura inválida
     estado = "detecto" if distancia < 10 else "no_deteccion"
-    data_entrada = {"sensorID": "entrada", "estado": estado}
-    respuesta = enviar_datos(url_entrada, data_entrada)
     controlar_barrera(estado)
-    
+    return estado
+
 
 def main():
+    pendientes = {}  # (nivel, plaza) -> [ocupada, envíos que quedan]
+    estado_entrada = None
+    ultimo_latido = None
     while True:
-        monitorear_plazas()
-        monitorear_entrada()
-        time.sleep(15)  # Ajustar según necesidad
+        for nivel, plaza, ocupada in monitorear_plazas():
+            pendientes[(nivel, plaza)] = [ocupada, REPETICIONES]
+
+        nuevo_estado_entrada = monitorear_entrada()
+        if nuevo_estado_entrada and nuevo_estado_entrada != estado_entrada:
+            estado_entrada = nuevo_estado_entrada
+            pendientes[("PUERTA", 0)] = [estado_entrada == "detecto", REPETICIONES]
+
+        ahora = time.ticks_ms()
+        if ultimo_latido is None or time.ticks_diff(ahora, ultimo_latido) >= LATIDO * 1000:
+            # El latido lleva el estado completo: el servidor sabe que el sensor sigue vivo
+            enviar_lecturas(estado_completo(estado_entrada))
+            ultimo_latido = ahora
+        else:
+            enviar_lecturas([(nivel, plaza, datos[0]) for (nivel, plaza), datos in pendientes.items()])
+
+        for clave in list(pendientes):
+            pendientes[clave][1] -= 1
+            if pendientes[clave][1] <= 0:
+                del pendientes[clave]
+
+        time.sleep(1)
 
 if __name__ == "__main__":
     main()
-
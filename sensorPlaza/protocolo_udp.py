@@ -0,0 +1,45 @@
+import socket
+import struct
+
+# Mismo formato que app/ingesta.py:
+#   cabecera: magia 'P', versión, secuencia (uint16), número de lecturas (uint8)
+#   lectura: código de nivel (uint8), número de plaza (uint16, bit 15 = ocupada)
+MAGIA_TRAMA = 0x50
+VERSION_TRAMA = 1
+BIT_OCUPADA = 0x8000
+# Código de cada nivel: su id en la tabla niveles del servidor (0 = entrada)
+CODIGOS_NIVEL = {"PUERTA": 0, "PI": 1, "PS": 2}
+MAX_LECTURAS = 255
+
+
+class ClienteUDP:
+    """Envía las lecturas de los sensores al servidor en tramas UDP de pocos bytes.
+
+    Cada llamada a enviar() manda una sola trama (5 bytes + 3 por lectura) sin esperar
+    respuesta. El bucle de codigo1.py solo pasa las plazas que han cambiado, cada una
+    en REPETICIONES ciclos seguidos, y el estado completo como latido cada LATIDO
+    segundos: un cambio cuya trama se pierde llega con la repetición o, como muy
+    tarde, con el siguiente latido.
+    """
+
+    def __init__(self, host, puerto=8082):
+        self.direccion = socket.getaddrinfo(host, puerto)[0][-1]
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.secuencia = 0
+
+    def trama(self, lecturas):
+        lecturas = lecturas[:MAX_LECTURAS]
+        trama = bytearray(struct.pack('>BBHB', MAGIA_TRAMA, VERSION_TRAMA, self.secuencia, len(lecturas)))
+        for nivel, numero, ocupada in lecturas:
+            trama += struct.pack('>BH', CODIGOS_NIVEL[nivel], numero | (BIT_OCUPADA if ocupada else 0))
+        return trama
+
+    def enviar(self, lecturas):
+        """Envía [(nivel, numero, ocupada)]; el nivel "PUERTA" es el sensor de la entrada."""
+        if not lecturas:
+            return
+        try:
+            self.socket.sendto(self.trama(lecturas), self.direccion)
+        except OSError as e:
+            print("Error al enviar la trama UDP:", e)
+        self.secuencia = (self.secuencia + 1) & 0xFFFF
@@ -0,0 +1,71 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CARPETA = tempfile.mkdtemp(prefix='parkease-tests-')
+URL_BD = f"sqlite:///{os.path.join(CARPETA, 'parkease.db')}"
+
+# La configuración lee DATABASE_URL al importarse
+os.environ['DATABASE_URL'] = URL_BD
+# Sin servidor de ingesta aunque el entorno lo active: las pruebas lo arrancan a mano
+os.environ['PARKEASE_INGESTA'] = '0'
+sys.path.insert(0, RAIZ)
+
+from app import create_app, db  # noqa: E402
+
+MATRICULAS = ['1234BCD', '5678FGH', '9012JKL']
+
+
+def sembrar():
+    """Dos niveles (PI y PS) con tres plazas cada uno y un usuario con tres vehículos."""
+    from app.models import Nivel, Plaza, User, Vehiculo
+
+    db.drop_all()
+    db.create_all()
+    for orden, codigo in enumerate(('PI', 'PS'), 1):
+        db.session.add(Nivel(id=orden, sitio='principal', codigo=codigo, nombre=codigo, orden=orden))
+        for numero in range(1, 4):
+            db.session.add(Plaza(sitio='principal', nivel=codigo, numero=numero, ocupada=False))
+    usuario = User(name='prueba', password='x', email='prueba@parkease', dni='00000000T', phone=600000000)
+    db.session.add(usuario)
+    db.session.flush()
+    db.session.add_all(Vehiculo(id_user=usuario.id, matricula=matricula) for matricula in MATRICULAS)
+    db.session.commit()
+
+
+def recargar():
+    from app.estadisticas import estadisticas
+    from app.matriculas import registro_matriculas
+    from app.ocupacion import ocupacion
+    from app.sesiones import sesiones_abiertas
+
+    ocupacion.cargar()
+    registro_matriculas.cargar()
+    sesiones_abiertas.cargar()
+    # Los contadores sin volcar de la prueba anterior no son de esta base de datos
+    with estadisticas._lock:
+        estadisticas._pendientes.clear()
+        estadisticas._maximos.clear()
+
+
+@pytest.fixture(scope='session')
+def app_sesion():
+    app = create_app('development')
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def app(app_sesion):
+    with app_sesion.app_context():
+        sembrar()
+        recargar()
+    return app_sesion
+
+
+@pytest.fixture
+def cliente(app):
+    return app.test_client()
@@ -0,0 +1,85 @@
+from datetime import datetime
+
+from app import db
+from app.archivo import archivar, consultar_historial, exportar, meses_archivados, meses_exportados
+from app.models import ParkingLog, User, Vehiculo
+
+
+def registrar(matricula, entrada, salida):
+    db.session.add(ParkingLog(matricula=matricula, tiempo_entrada=entrada, tiempo_salida=salida))
+    db.session.commit()
+
+
+def borrar_archivo():
+    for anio, mes in meses_archivados():
+        db.session.execute(db.text(f'DROP TABLE parking_log_{anio:04d}{mes:02d}'))
+    db.session.commit()
+
+
+def test_archivar_no_crea_tablas_de_meses_vacios(app):
+    with app.app_context():
+        borrar_archivo()
+        registrar('1234BCD', datetime(2024, 1, 10, 9), datetime(2024, 1, 10, 18))
+        registrar('5678FGH', datetime(2024, 4, 2, 9), datetime(2024, 4, 2, 10))
+
+        movidas = archivar(90)
+
+        assert movidas == {(2024, 1): 1, (2024, 4): 1}
+        assert meses_archivados() == [(2024, 1), (2024, 4)]
+        borrar_archivo()
+
+
+def test_exportar_otra_vez_el_mismo_mes_conserva_las_filas(app, tmp_path):
+    carpeta = str(tmp_path)
+    with app.app_context():
+        borrar_archivo()
+        registrar('1234BCD', datetime(2024, 1, 10, 9), datetime(2024, 1, 10, 18))
+        archivar(90)
+        assert exportar(carpeta, 0) == [(2024, 1)]
+
+        # Una salida tardía del mismo mes se archiva y se exporta después
+        registrar('5678FGH', datetime(2024, 1, 20, 9), datetime(2024, 1, 21, 9))
+        archivar(90)
+        assert exportar(carpeta, 0) == [(2024, 1)]
+
+        assert meses_exportados(carpeta) == [(2024, 1)]
+        historial = consultar_historial(desde=datetime(2024, 1, 1), hasta=datetime(2024, 1, 31), carpeta=carpeta)
+        assert [fila['matricula'] for fila in historial] == ['1234BCD', '5678FGH']
+
+
+def iniciar_sesion(cliente, nombre):
+    with cliente.application.app_context():
+        id_usuario = User.query.filter_by(name=nombre).one().id
+    with cliente.session_transaction() as sesion:
+        sesion['user_id'] = id_usuario
+        sesion['username'] = nombre
+
+
+def test_historial_sin_sesion_responde_401(app, cliente):
+    assert cliente.get('/api/historial').status_code == 401
+
+
+def test_historial_solo_de_los_vehiculos_del_usuario(app, cliente):
+    with app.app_context():
+        borrar_archivo()
+        otro = User(name='otro', password='x', email='otro@parkease', dni='1', phone=1)
+        db.session.add(otro)
+        db.session.flush()
+        db.session.add(Vehiculo(id_user=otro.id, matricula='3456MNP'))
+        db.session.commit()
+        registrar('1234BCD', datetime(2024, 1, 10, 9), datetime(2024, 1, 10, 18))
+        registrar('3456MNP', datetime(2024, 1, 11, 9), datetime(2024, 1, 11, 18))
+        # También los meses archivados
+        archivar(90)
+        registrar('5678FGH', datetime.now(), None)
+
+    iniciar_sesion(cliente, 'prueba')
+    todas = cliente.get('/api/historial').json
+    assert sorted(sesion['matricula'] for sesion in todas) == ['1234BCD', '5678FGH']
+    assert [s['matricula'] for s in cliente.get('/api/historial?matricula=1234-bcd').json] == ['1234BCD']
+    assert cliente.get('/api/historial?matricula=3456MNP').status_code == 403
+
+    iniciar_sesion(cliente, 'otro')
+    assert [s['matricula'] for s in cliente.get('/api/historial').json] == ['3456MNP']
+    with app.app_context():
+        borrar_archivo()
@@ -0,0 +1,30 @@
+import cv2
+import numpy as np
+
+from app import cam
+
+
+def imagen_con_cuadrado():
+    imagen = np.zeros((300, 400), np.uint8)
+    cv2.rectangle(imagen, (50, 50), (100, 100), 255, -1)  # cuadrado liso: nada que ver con una matrícula
+    return imagen
+
+
+def test_descarta_candidatos_sin_parecido_aunque_haya_menos_de_top_k():
+    candidatos, _ = cam.buscar_candidatos(imagen_con_cuadrado(), top_k=3)
+
+    assert candidatos == []
+
+
+def test_devuelve_la_matricula_como_mucho_top_k():
+    imagen = imagen_con_cuadrado()
+    cv2.rectangle(imagen, (150, 200), (338, 240), 255, -1)
+    for x in range(160, 330, 20):
+        cv2.rectangle(imagen, (x, 208), (x + 10, 232), 0, 2)  # "caracteres" que dan bordes dentro
+
+    candidatos, _ = cam.buscar_candidatos(imagen, top_k=3)
+
+    assert len(candidatos) == 1
+    x, y, ancho, alto = cv2.boundingRect(candidatos[0])
+    assert 150 - 2 <= x <= 150 and 4 < ancho / alto < 5
+    assert cam.buscar_candidatos(imagen, top_k=0)[0] == []
@@ -0,0 +1,76 @@
+from datetime import datetime
+
+from sqlalchemy import event
+
+from app import db
+from app.models import ParkingLog, Plaza
+from app.ocupacion import ocupacion
+
+
+def test_entrada_repetida_devuelve_la_misma_plaza_sin_otra_sesion(app, cliente):
+    primera = cliente.post('/api/entrada', json={'matricula': '1234BCD'})
+    segunda = cliente.post('/api/entrada', json={'matricula': '1234 BCD'})
+
+    assert primera.status_code == segunda.status_code == 200
+    assert (segunda.json['nivel'], segunda.json['plaza']) == (primera.json['nivel'], primera.json['plaza'])
+    with app.app_context():
+        assert ParkingLog.query.filter_by(matricula='1234BCD').count() == 1
+
+
+def test_salida_tras_entrada_repetida_cierra_la_unica_sesion(app, cliente):
+    cliente.post('/api/entrada', json={'matricula': '1234BCD'})
+    cliente.post('/api/entrada', json={'matricula': '1234BCD'})
+
+    assert cliente.post('/api/salida', json={'matricula': '1234BCD'}).status_code == 200
+    with app.app_context():
+        assert ParkingLog.query.filter_by(matricula='1234BCD', tiempo_salida=None).count() == 0
+    assert cliente.post('/api/entrada', json={'matricula': '1234BCD'}).status_code == 200
+
+
+def test_sesion_abierta_sin_plaza_responde_409(app, cliente):
+    cliente.post('/api/entrada', json={'matricula': '1234BCD'})
+    # El sensor ve la plaza vacía: el vehículo sigue dentro pero ya no tiene plaza
+    entrada = cliente.post('/api/entrada', json={'matricula': '1234BCD'}).json
+    cliente.post('/api/actualizarplaza', json={'sensorID': entrada['nivel'], 'plazaID': entrada['plaza'], 'estado': 0})
+
+    respuesta = cliente.post('/api/entrada', json={'matricula': '1234BCD'})
+
+    assert respuesta.status_code == 409
+    with app.app_context():
+        assert db.session.query(ParkingLog).filter_by(matricula='1234BCD').count() == 1
+
+
+def test_sesion_cerrada_por_otro_proceso_permite_volver_a_entrar(app, cliente):
+    entrada = cliente.post('/api/entrada', json={'matricula': '1234BCD'}).json
+    with app.app_context():
+        # Otro proceso (o alguien a mano) cierra la sesión y libera la plaza
+        db.session.query(ParkingLog).filter_by(matricula='1234BCD').update({'tiempo_salida': datetime.now()})
+        db.session.query(Plaza).filter_by(nivel=entrada['nivel'], numero=entrada['plaza']).update(
+            {'ocupada': False, 'matricula': None})
+        db.session.commit()
+        ocupacion.resincronizar()
+
+    respuesta = cliente.post('/api/entrada', json={'matricula': '1234BCD'})
+
+    assert respuesta.status_code == 200
+    with app.app_context():
+        assert ParkingLog.query.filter_by(matricula='1234BCD', tiempo_salida=None).count() == 1
+
+
+def test_entrada_nueva_no_consulta_sesiones_ni_plazas(app, cliente):
+    consultas = []
+
+    def anotar(conexion, cursor, sentencia, *args):
+        if sentencia.lstrip().upper().startswith('SELECT'):
+            consultas.append(sentencia)
+
+    with app.app_context():
+        motor = db.engine
+    event.listen(motor, 'before_cursor_execute', anotar)
+    try:
+        respuesta = cliente.post('/api/entrada', json={'matricula': '1234BCD'})
+    finally:
+        event.remove(motor, 'before_cursor_execute', anotar)
+
+    assert respuesta.status_code == 200
+    assert [sentencia for sentencia in consultas if 'parking_log' in sentencia or 'plazas' in sentencia] == []
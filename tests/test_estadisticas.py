@@ -0,0 +1,52 @@
+import threading
+from datetime import datetime
+
+from sqlalchemy import event
+
+from app import db
+from app.estadisticas import estadisticas
+
+
+def datos_hora(cliente, nivel):
+    respuesta = cliente.get('/api/stats', query_string={'periodo': 'hora', 'nivel': nivel})
+    assert respuesta.status_code == 200
+    return respuesta.json['datos']
+
+
+def test_stats_no_escribe_y_suma_lo_pendiente(app, cliente):
+    entrada = cliente.post('/api/entrada', json={'matricula': '1234BCD'}).json
+    escrituras = []
+    hilo = threading.get_ident()
+
+    def anotar(conexion, cursor, sentencia, *args):
+        # Solo las sentencias de esta petición, no las del hilo que vuelca
+        if threading.get_ident() == hilo and not sentencia.lstrip().upper().startswith('SELECT'):
+            escrituras.append(sentencia)
+
+    with app.app_context():
+        motor = db.engine
+    event.listen(motor, 'before_cursor_execute', anotar)
+    try:
+        antes = datos_hora(cliente, entrada['nivel'])
+    finally:
+        event.remove(motor, 'before_cursor_execute', anotar)
+
+    assert escrituras == []
+    assert [fila['entradas'] for fila in antes] == [1]
+    assert antes[0]['ocupadas_max'] >= 1
+
+    with app.app_context():
+        estadisticas.volcar()
+    assert [fila['entradas'] for fila in datos_hora(cliente, entrada['nivel'])] == [1]
+
+
+def test_stats_suma_la_tabla_y_la_memoria(app, cliente):
+    ahora = datetime.now()
+    with app.app_context():
+        estadisticas.registrar_salida('PS', ahora.replace(minute=0), ahora)
+        estadisticas.volcar()
+        estadisticas.registrar_salida('PS', ahora, ahora)
+
+    fila, = datos_hora(cliente, 'PS')
+    assert fila['salidas'] == 2
+    assert sum(fila['estancias'].values()) == 2
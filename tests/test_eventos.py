@@ -0,0 +1,111 @@
+import asyncio
+import threading
+
+from app.eventos import eventos
+from app.ingesta import EscritorSensores, ServidorIngesta
+
+
+def test_limite_de_streams_sse(app, cliente, monkeypatch):
+    monkeypatch.setattr(eventos, 'max_clientes', 2)
+
+    abiertos = [cliente.get('/api/plazas/stream', buffered=False) for _ in range(2)]
+    assert [respuesta.status_code for respuesta in abiertos] == [200, 200]
+    assert eventos.suscriptores() == 2
+
+    rechazado = cliente.get('/api/plazas/stream', buffered=False)
+    assert rechazado.status_code == 503
+    assert rechazado.headers['Retry-After']
+
+    # La barrera sigue atendiendo con los streams abiertos
+    assert cliente.post('/api/entrada', json={'matricula': '1234BCD'}).status_code == 200
+
+    abiertos[0].close()
+    assert eventos.suscriptores() == 1
+    otro = cliente.get('/api/plazas/stream', buffered=False)
+    assert otro.status_code == 200
+
+    for respuesta in abiertos[1:] + [otro]:
+        respuesta.close()
+    assert eventos.suscriptores() == 0
+
+
+async def leer_hasta(lector, marca, espera=5):
+    datos = b''
+    while marca not in datos:
+        datos += await asyncio.wait_for(lector.read(4096), timeout=espera)
+    return datos
+
+
+def test_stream_sse_desde_la_ingesta_sin_hilos(monkeypatch):
+    monkeypatch.setattr(eventos, 'max_clientes_asincronos', 20)
+    servidor = ServidorIngesta(EscritorSensores())
+
+    async def probar():
+        tcp = await asyncio.start_server(servidor._atender, '127.0.0.1', 0)
+        puerto = tcp.sockets[0].getsockname()[1]
+        async with tcp:
+            hilos = threading.active_count()
+            # Más paneles que hilos reservados para la ruta de Flask
+            conexiones = [await asyncio.open_connection('127.0.0.1', puerto) for _ in range(12)]
+            for lector, escritor in conexiones:
+                escritor.write(b'GET /api/plazas/stream HTTP/1.1\r\nHost: parkease\r\n\r\n')
+                await escritor.drain()
+            cabeceras = [await leer_hasta(lector, b'retry: 3000\n\n') for lector, _ in conexiones]
+            assert all(c.startswith(b'HTTP/1.1 200 ') and b'text/event-stream' in c for c in cabeceras)
+            assert b'Access-Control-Allow-Origin: *' in cabeceras[0]
+            assert eventos.suscriptores() == 12
+            assert threading.active_count() == hilos
+
+            # Publicado desde otro hilo, como el escritor de sensores o una petición de Flask
+            hilo = threading.Thread(target=eventos.publicar, args=('PI', 2, True))
+            hilo.start()
+            hilo.join()
+            mensaje = await leer_hasta(conexiones[5][0], b'\n\n')
+            assert mensaje == b'event: plaza\ndata: {"nivel": "PI", "numero": 2, "ocupada": true}\n\n'
+
+            for _, escritor in conexiones:
+                escritor.close()
+            for _ in range(50):
+                if eventos.suscriptores() == 0:
+                    break
+                await asyncio.sleep(0.05)
+            assert eventos.suscriptores() == 0
+
+    asyncio.run(probar())
+
+
+def test_stream_sse_de_la_ingesta_lleno_responde_503(monkeypatch):
+    monkeypatch.setattr(eventos, 'max_clientes_asincronos', 1)
+    servidor = ServidorIngesta(EscritorSensores())
+
+    async def probar():
+        tcp = await asyncio.start_server(servidor._atender, '127.0.0.1', 0)
+        puerto = tcp.sockets[0].getsockname()[1]
+        async with tcp:
+            abierto = await asyncio.open_connection('127.0.0.1', puerto)
+            abierto[1].write(b'GET /api/plazas/stream HTTP/1.1\r\n\r\n')
+            await leer_hasta(abierto[0], b'retry: 3000\n\n')
+
+            lector, escritor = await asyncio.open_connection('127.0.0.1', puerto)
+            escritor.write(b'GET /api/plazas/stream HTTP/1.1\r\n\r\n')
+            respuesta = await asyncio.wait_for(lector.read(), timeout=5)
+            assert respuesta.startswith(b'HTTP/1.1 503 ') and b'Retry-After: 30' in respuesta
+            escritor.close()
+            abierto[1].close()
+            for _ in range(50):
+                if eventos.suscriptores() == 0:
+                    break
+                await asyncio.sleep(0.05)
+            assert eventos.suscriptores() == 0
+
+    asyncio.run(probar())
+
+
+def test_el_panel_usa_el_stream_de_la_ingesta(app, cliente, monkeypatch):
+    monkeypatch.setitem(app.config, 'INGESTA_ACTIVA', True)
+    pagina = cliente.get('/parking/PI', base_url='http://parkease.local:81').get_data(as_text=True)
+    assert 'new EventSource("http://parkease.local:8081/api/plazas/stream")' in pagina
+
+    monkeypatch.setitem(app.config, 'INGESTA_ACTIVA', False)
+    pagina = cliente.get('/parking/PI').get_data(as_text=True)
+    assert 'new EventSource("/api/plazas/stream")' in pagina
@@ -0,0 +1,166 @@
+import asyncio
+import importlib
+import importlib.util
+import json
+from pathlib import Path
+
+import click
+import pytest
+
+from app import config, create_app, ingesta
+from app.ingesta import (EscritorSensores, ReceptorUDP, ServidorIngesta, codificar_trama, decodificar_trama,
+                         secuencia_posterior)
+from app.ocupacion import ocupacion
+
+
+async def peticion_cruda(servidor, datos):
+    tcp = await asyncio.start_server(servidor._atender, '127.0.0.1', 0)
+    puerto = tcp.sockets[0].getsockname()[1]
+    async with tcp:
+        lector, escritor = await asyncio.open_connection('127.0.0.1', puerto)
+        escritor.write(datos)
+        await escritor.drain()
+        respuesta = await asyncio.wait_for(lector.read(), timeout=5)
+        escritor.close()
+    return respuesta
+
+
+@pytest.mark.parametrize('longitud', [b'abc', b'-5', b'1.5'])
+def test_content_length_invalido_responde_400(longitud):
+    servidor = ServidorIngesta(EscritorSensores())
+    datos = b'POST /sensor HTTP/1.1\r\nContent-Length: ' + longitud + b'\r\n\r\n{}'
+
+    respuesta = asyncio.run(peticion_cruda(servidor, datos))
+
+    assert respuesta.startswith(b'HTTP/1.1 400 ')
+    assert b'Content-Length' in respuesta
+
+
+def test_valida_contra_la_foto_de_niveles_sin_tocar_la_base_de_datos(app, monkeypatch):
+    servidor = ServidorIngesta(EscritorSensores(), app)
+    servidor.cargar_niveles()
+    receptor = ReceptorUDP(servidor)
+
+    # En el bucle de eventos no hay contexto de Flask: cualquier carga fallaría
+    def sin_base_de_datos():
+        raise RuntimeError("consulta a la base de datos fuera del contexto de la aplicación")
+    monkeypatch.setattr(ocupacion, '_cargado', False)
+    monkeypatch.setattr(ocupacion, 'cargar', sin_base_de_datos)
+
+    lote = [{'sensorID': 'PI', 'plazaID': 1, 'estado': 1}, {'sensorID': 'PX', 'plazaID': 1, 'estado': 1}]
+    estado, respuesta = servidor.procesar('POST', '/api/sensores/batch', json.dumps(lote).encode())
+    assert estado == 202
+    assert respuesta['encoladas'] == 1
+    assert respuesta['desconocidas'] == [{'sensorID': 'PX', 'plazaID': 1}]
+
+    receptor.datagram_received(codificar_trama(1, [('PS', 3, True), ('PS', 9, True)], servidor.codigos),
+                               ('10.0.0.5', 5000))
+    assert receptor.contadores['tramas'] == 1
+    assert servidor.escritor.pendientes() == 2
+
+
+CODIGOS = {0: 'PUERTA', 1: 'PI', 2: 'PS'}
+
+
+def test_trama_ida_y_vuelta():
+    lecturas = [('PI', 1, True), ('PS', 0x7FFF, False), ('PUERTA', 0, True)]
+
+    trama = codificar_trama(0x1234, lecturas, CODIGOS)
+
+    assert len(trama) == 5 + 3 * len(lecturas)
+    assert trama[5:8] == b'\x01\x80\x01' and trama[11:14] == b'\x00\x80\x00'  # bit 15 = ocupada, código 0 = puerta
+    assert decodificar_trama(trama, CODIGOS) == (0x1234, lecturas)
+
+
+def test_trama_con_el_registro_de_niveles(app):
+    with app.app_context():
+        trama = codificar_trama(0x10005, [('PI', 2, False), ('PS', 4, True)])
+        assert decodificar_trama(trama) == (5, [('PI', 2, False), ('PS', 4, True)])
+
+
+def test_trama_del_firmware_la_entiende_el_servidor():
+    ruta = Path(__file__).resolve().parent.parent / 'sensorPlaza' / 'protocolo_udp.py'
+    especificacion = importlib.util.spec_from_file_location('protocolo_udp', ruta)
+    protocolo_udp = importlib.util.module_from_spec(especificacion)
+    especificacion.loader.exec_module(protocolo_udp)
+    cliente = protocolo_udp.ClienteUDP('127.0.0.1')
+    cliente.secuencia = 7
+
+    trama = bytes(cliente.trama([('PS', 12, True), ('PUERTA', 0, False)]))
+
+    assert decodificar_trama(trama, CODIGOS) == (7, [('PS', 12, True), ('PUERTA', 0, False)])
+
+
+@pytest.mark.parametrize('datos', [
+    b'P\x01\x00',                                  # más corta que la cabecera
+    b'Q\x01\x00\x01\x00',                          # otra magia
+    b'P\x02\x00\x01\x00',                          # otra versión
+    b'P\x01\x00\x01\x02\x01\x00\x01',              # dice 2 lecturas y trae 1
+    b'P\x01\x00\x01\x01\x09\x00\x01',              # código de nivel desconocido
+])
+def test_trama_invalida(datos):
+    with pytest.raises(ValueError):
+        decodificar_trama(datos, CODIGOS)
+
+
+@pytest.mark.parametrize('anterior, actual, posterior', [
+    (1, 2, True),
+    (2, 1, False),
+    (5, 5, False),
+    (0xFFFF, 0, True),
+    (0xFFF0, 0x0010, True),
+    (0, 0xFFFF, False),
+    (0x0010, 0xFFF0, False),
+    (0, 0x7FFF, True),
+    (0, 0x8000, False),
+])
+def test_secuencia_posterior_da_la_vuelta(anterior, actual, posterior):
+    assert secuencia_posterior(anterior, actual) is posterior
+
+
+def test_receptor_descarta_repetidas_y_desordenadas_al_dar_la_vuelta():
+    servidor = ServidorIngesta(EscritorSensores())
+    servidor.codigos = CODIGOS
+    servidor.existe = lambda nivel, numero: True
+    receptor = ReceptorUDP(servidor)
+    emisor = ('10.0.0.7', 5000)
+
+    for secuencia in (0xFFFE, 0xFFFF, 0xFFFF, 0, 0xFFFE, 1):
+        receptor.datagram_received(codificar_trama(secuencia, [('PI', 1, True)], CODIGOS), emisor)
+
+    assert receptor.contadores['tramas'] == 4
+    assert receptor.contadores['descartadas'] == 2
+    assert servidor.escritor.pendientes() == 4
+
+
+@pytest.fixture
+def recargar_config(monkeypatch):
+    def recargar(valor):
+        if valor is None:
+            monkeypatch.delenv('PARKEASE_INGESTA', raising=False)
+        else:
+            monkeypatch.setenv('PARKEASE_INGESTA', valor)
+        importlib.reload(config)
+    yield recargar
+    monkeypatch.undo()
+    importlib.reload(config)
+
+
+def test_ingesta_desactivada_por_defecto(recargar_config):
+    recargar_config(None)
+    assert config.Config.INGESTA_ACTIVA is False
+    recargar_config('1')
+    assert config.Config.INGESTA_ACTIVA is True
+
+
+def test_los_comandos_de_flask_no_arrancan_la_ingesta(recargar_config, monkeypatch):
+    recargar_config('1')
+    arrancadas = []
+    monkeypatch.setattr(ingesta, 'init_app', arrancadas.append)
+
+    with click.Context(click.Command('archivar-log')):
+        create_app('development')
+    assert arrancadas == []
+
+    app = create_app('development')
+    assert arrancadas == [app]
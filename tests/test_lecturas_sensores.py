@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+from app import db
+from app.eventos import eventos
+from app.ingesta import EscritorSensores, ServidorIngesta
+from app.models import Plaza
+
+IDS_INVALIDOS = [
+    {'sensorID': ['PI'], 'plazaID': 1},
+    {'sensorID': {'nivel': 'PI'}, 'plazaID': 1},
+    {'sensorID': 1, 'plazaID': 1},
+    {'sensorID': 'PI', 'plazaID': [1]},
+    {'sensorID': 'PI', 'plazaID': 1.5},
+    {'sensorID': 'PI', 'plazaID': True},
+]
+
+
+@pytest.fixture
+def publicados():
+    """Función que devuelve los eventos SSE publicados hasta el momento."""
+    cola = eventos.suscribir()
+    mensajes = []
+
+    def recoger():
+        while not cola.empty():
+            mensajes.append(json.loads(cola.get_nowait()))
+        return mensajes
+
+    yield recoger
+    eventos.cancelar(cola)
+
+
+def ocupadas(app):
+    with app.app_context():
+        return {(plaza.nivel, plaza.numero) for plaza in Plaza.query.filter_by(ocupada=True)}
+
+
+def test_lote_con_lecturas_validas_y_desconocidas(app, cliente, publicados):
+    lote = [
+        {'sensorID': 'PI', 'plazaID': 1, 'estado': 'ocupado'},
+        {'sensorID': 'PI', 'plazaID': 2, 'estado': 'libre'},    # ya libre: latido
+        {'sensorID': 'PS', 'plazaID': '3', 'estado': True},
+        {'sensorID': 'PS', 'plazaID': 99, 'estado': 1},         # plaza que no existe
+        {'sensorID': 'PX', 'plazaID': 1, 'estado': 1},          # nivel que no existe
+    ]
+
+    respuesta = cliente.post('/api/sensores/batch', json=lote)
+
+    assert respuesta.status_code == 200
+    assert respuesta.json['recibidas'] == 5
+    assert respuesta.json['actualizadas'] == 2
+    assert respuesta.json['desconocidas'] == [{'sensorID': 'PS', 'plazaID': 99}, {'sensorID': 'PX', 'plazaID': 1}]
+    assert ocupadas(app) == {('PI', 1), ('PS', 3)}
+    assert publicados() == [
+        {'nivel': 'PI', 'numero': 1, 'ocupada': True},
+        {'nivel': 'PS', 'numero': 3, 'ocupada': True},
+    ]
+
+    # El latido siguiente con el mismo estado no actualiza ni publica nada
+    repetido = cliente.post('/api/sensores/batch', json=lote)
+    assert repetido.json['actualizadas'] == 0
+    assert len(publicados()) == 2
+
+
+@pytest.mark.parametrize('lote', [
+    {'sensorID': 'PI', 'plazaID': 1, 'estado': 1},                                       # no es una lista
+    [{'sensorID': 'PI', 'plazaID': 1, 'estado': 1}, {'sensorID': 'PI', 'plazaID': 2}],  # falta el estado
+    [{'sensorID': 'PI', 'plazaID': 1, 'estado': 1}, 'PI-2-1'],                          # no es un objeto
+])
+def test_lote_mal_formado_no_guarda_nada(app, cliente, publicados, lote):
+    respuesta = cliente.post('/api/sensores/batch', json=lote)
+
+    assert respuesta.status_code == 400
+    assert ocupadas(app) == set()
+    assert publicados() == []
+
+
+@pytest.mark.parametrize('ids', IDS_INVALIDOS)
+def test_lote_con_ids_invalidos_responde_400(app, cliente, ids):
+    lote = [{'sensorID': 'PI', 'plazaID': 1, 'estado': 1}, dict(ids, estado=1)]
+
+    respuesta = cliente.post('/api/sensores/batch', json=lote)
+
+    assert respuesta.status_code == 400
+    assert respuesta.json['error'] == 'Formato de datos inválido'
+
+
+@pytest.mark.parametrize('ids', IDS_INVALIDOS)
+def test_sensor_con_ids_invalidos_responde_400(app, cliente, ids):
+    assert cliente.post('/sensor', json=dict(ids, estado=1)).status_code == 400
+
+
+@pytest.mark.parametrize('ids', IDS_INVALIDOS)
+def test_ingesta_con_ids_invalidos_responde_400(app, ids):
+    servidor = ServidorIngesta(EscritorSensores(), app)
+    servidor.cargar_niveles()
+    cuerpo = json.dumps([dict(ids, estado=1)]).encode()
+
+    estado, respuesta = servidor.procesar('POST', '/api/sensores/batch', cuerpo)
+
+    assert estado == 400
+    assert servidor.escritor.pendientes() == 0
+
+
+def test_plaza_como_texto_numerico_se_acepta(app, cliente):
+    respuesta = cliente.post('/sensor', json={'sensorID': 'PI', 'plazaID': '2', 'estado': 'ocupado'})
+    assert respuesta.status_code == 200
@@ -0,0 +1,56 @@
+import pytest
+
+from app import db
+from app.matriculas import RegistroMatriculas, registro_matriculas
+from app.models import User, Vehiculo
+
+
+@pytest.mark.parametrize('lectura', ['1234BCD', '1234 bcd', '1234-BCD', '1234BC0', 'I234BCD', '1Z34BCD'])
+def test_acepta_la_matricula_y_sus_confusiones_ocr(app, lectura):
+    with app.app_context():
+        assert registro_matriculas.buscar(lectura) == '1234BCD'
+
+
+@pytest.mark.parametrize('lectura', ['1234BCF', '1234BC', '91234BCD', '1234BC00', '8234BCD'])
+def test_rechaza_errores_que_no_son_confusiones(app, lectura):
+    with app.app_context():
+        assert registro_matriculas.buscar(lectura) is None
+
+
+def test_sin_aproximada_solo_coincidencia_exacta(app):
+    with app.app_context():
+        assert registro_matriculas.buscar('1234BC0', aproximada=False) is None
+
+
+def test_umbral_mayor_rechaza_empates(app):
+    registro = RegistroMatriculas(recarga=0, umbral=1.0)
+    with app.app_context():
+        registro.cargar()
+        # Un error cualquiera se admite solo con un umbral mayor y si no hay empate
+        assert registro.buscar('1234BCF') == '1234BCD'
+        registro.agregar('1234BCE')
+        assert registro.buscar('1234BCF') is None
+
+
+def test_buscar_no_recarga_en_la_peticion(app):
+    registro = RegistroMatriculas(recarga=60)
+    with app.app_context():
+        registro.cargar()
+        db.session.add(Vehiculo(id_user=1, matricula='3456MNP'))
+        db.session.commit()
+        # Otro proceso ha registrado la matrícula: aparece con la siguiente recarga, no al buscar
+        registro._cargado_en -= 3600
+        assert registro.buscar('3456MNP') is None
+        registro.cargar()
+        assert registro.buscar('3456MNP') == '3456MNP'
+
+
+def test_registro_rechaza_la_misma_matricula_con_otro_formato(app, cliente):
+    formulario = {'username': 'otro', 'password': 'x', 'email': 'otro@example.com', 'dni': '1', 'telefono': '1',
+                  'marca': 'Seat', 'modelo': 'Ibiza', 'color': 'rojo', 'matricula': '1234-bcd'}
+    respuesta = cliente.post('/register', data=formulario)
+
+    assert respuesta.status_code == 302 and respuesta.headers['Location'].endswith('/register')
+    with app.app_context():
+        assert Vehiculo.query.filter_by(matricula_normalizada='1234BCD').count() == 1
+        assert User.query.filter_by(name='otro').count() == 0
@@ -0,0 +1,90 @@
+from sqlalchemy import inspect, text
+
+from app import db
+from app.esquema import actualizar_esquema
+from app.models import Nivel, Plaza
+from app.ocupacion import ocupacion
+
+
+def sembrar_esquema_antiguo():
+    """Base de datos anterior a la tabla plazas: una tabla por planta."""
+    db.session.remove()
+    Plaza.__table__.drop(db.engine)
+    Nivel.__table__.drop(db.engine)
+    with db.engine.begin() as conexion:
+        for tabla in ('parking_inferior', 'parking_superior'):
+            conexion.execute(text(f"DROP TABLE IF EXISTS {tabla}"))
+            conexion.execute(text(f"CREATE TABLE {tabla} (numero INTEGER PRIMARY KEY, ocupada BOOLEAN)"))
+        conexion.execute(text("INSERT INTO parking_inferior VALUES (1, 1), (2, 0), (3, NULL)"))
+        conexion.execute(text("INSERT INTO parking_superior VALUES (1, 0), (2, 1)"))
+
+
+def test_migra_las_tablas_por_planta(app):
+    with app.app_context():
+        sembrar_esquema_antiguo()
+
+        actualizar_esquema(app)
+
+        niveles = [nivel.to_dict() for nivel in Nivel.query.order_by(Nivel.id)]
+        assert [(n["id"], n["codigo"], n["nombre"], n["orden"], n["sitio"]) for n in niveles] == [
+            (1, 'PI', 'Parking inferior', 1, 'principal'),
+            (2, 'PS', 'Parking superior', 2, 'principal'),
+        ]
+        plazas = db.session.query(Plaza.nivel, Plaza.numero, Plaza.ocupada).order_by(Plaza.nivel, Plaza.numero).all()
+        assert [tuple(plaza) for plaza in plazas] == [
+            ('PI', 1, True), ('PI', 2, False), ('PI', 3, False),
+            ('PS', 1, False), ('PS', 2, True),
+        ]
+        assert 'matricula' in {columna['name'] for columna in inspect(db.engine).get_columns('plazas')}
+        # Las tablas antiguas se conservan
+        assert inspect(db.engine).has_table('parking_inferior')
+
+        # Con las plazas ya migradas, volver a arrancar no copia nada otra vez
+        actualizar_esquema(app)
+        assert Plaza.query.count() == 5
+        ocupacion.cargar()
+
+
+def test_rutas_antiguas_tras_migrar(app, cliente):
+    with app.app_context():
+        sembrar_esquema_antiguo()
+        actualizar_esquema(app)
+        ocupacion.cargar()
+
+    inferior = cliente.get('/parkinginferior')
+    superior = cliente.get('/parkingsuperior')
+
+    assert inferior.status_code == 200 and superior.status_code == 200
+    assert 'PARKING INFERIOR' in inferior.get_data(as_text=True)
+    assert inferior.get_data(as_text=True).count('class="parking-spot') == 3
+    assert superior.get_data(as_text=True).count('class="parking-spot occupied"') == 1
+    assert [(n["codigo"], n["ocupadas"], n["total"]) for n in cliente.get('/api/niveles').get_json()] == [
+        ('PI', 1, 3), ('PS', 1, 2),
+    ]
+
+
+def test_nivel_nuevo_sin_tocar_el_codigo(app, cliente):
+    with app.app_context():
+        db.session.add(Nivel(id=3, sitio='anexo', codigo='P3', nombre='Planta 3', orden=3))
+        db.session.add_all(Plaza(sitio='anexo', nivel='P3', numero=n, ocupada=n == 2) for n in (1, 2))
+        db.session.commit()
+        ocupacion.cargar()
+
+    pagina = cliente.get('/parking/P3')
+    assert pagina.status_code == 200
+    assert 'PLANTA 3' in pagina.get_data(as_text=True)
+
+    cliente.post('/parking/P3', data={'numero': '1', 'ocupada': '1'})
+    with app.app_context():
+        assert db.session.get(Plaza, ('anexo', 'P3', 1)).ocupada
+
+    todos = cliente.get('/api/niveles').get_json()
+    assert [n["codigo"] for n in todos] == ['P3', 'PI', 'PS']  # por sitio y orden
+    assert cliente.get('/api/niveles?sitio=anexo').get_json() == [
+        {"id": 3, "sitio": 'anexo', "codigo": 'P3', "nombre": 'Planta 3', "orden": 3, "ocupadas": 2, "total": 2}
+    ]
+
+
+def test_nivel_desconocido_responde_404(cliente):
+    assert cliente.get('/parking/PX').status_code == 404
+    assert cliente.get('/api/niveles?sitio=otro').get_json() == []
@@ -0,0 +1,176 @@
+import pytest
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import ParkingLog, Plaza
+from app.ocupacion import MotorOcupacion, ocupacion, resumen_bd
+
+
+@pytest.fixture(scope='module')
+def app_otro_proceso():
+    """Segunda aplicación con su propio engine y su propia sesión, como otro worker."""
+    return create_app('development')
+
+
+@pytest.fixture
+def otro_motor(app, app_otro_proceso):
+    # Cargado antes de las entradas de la prueba: su memoria queda atrasada
+    motor = MotorOcupacion()
+    with app_otro_proceso.app_context():
+        motor.cargar()
+    return motor
+
+
+def estado_plaza(app, nivel, numero):
+    with app.app_context():
+        plaza = db.session.get(Plaza, ('principal', nivel, numero))
+        return plaza.ocupada, plaza.matricula
+
+
+def test_entrada_guarda_la_matricula_en_la_plaza(app, cliente):
+    respuesta = cliente.post('/api/entrada', json={'matricula': '1234BCD'})
+
+    assert respuesta.status_code == 200
+    assert estado_plaza(app, respuesta.json['nivel'], respuesta.json['plaza']) == (True, '1234BCD')
+
+
+def test_salida_por_otro_proceso_libera_la_plaza(app, cliente, app_otro_proceso, otro_motor):
+    entrada = cliente.post('/api/entrada', json={'matricula': '1234BCD'}).json
+    plaza = (entrada['nivel'], entrada['plaza'])
+
+    with app_otro_proceso.app_context():
+        assert otro_motor.liberar('1234BCD') == plaza
+        db.session.commit()
+
+    assert estado_plaza(app, *plaza) == (False, None)
+
+
+def test_salida_por_otro_proceso_cierra_sesion_y_plaza(app, cliente, app_otro_proceso):
+    entrada = cliente.post('/api/entrada', json={'matricula': '5678FGH'}).json
+    # El otro proceso no conoce ni la sesión ni la plaza en memoria
+
+    with app_otro_proceso.test_client() as otro_cliente:
+        respuesta = otro_cliente.post('/api/salida', json={'matricula': '5678FGH'})
+
+    assert respuesta.status_code == 200
+    assert estado_plaza(app, entrada['nivel'], entrada['plaza']) == (False, None)
+    with app.app_context():
+        assert ParkingLog.query.filter_by(matricula='5678FGH', tiempo_salida=None).count() == 0
+
+
+def test_asignar_con_memoria_atrasada_no_repite_plaza(app, cliente, app_otro_proceso, otro_motor):
+    entrada = cliente.post('/api/entrada', json={'matricula': '1234BCD'}).json
+
+    with app_otro_proceso.app_context():
+        plaza = otro_motor.asignar('5678FGH', 'principal')
+        db.session.commit()
+
+    assert plaza != (entrada['nivel'], entrada['plaza'])
+    assert estado_plaza(app, *plaza) == (True, '5678FGH')
+
+
+def test_sensor_escribe_aunque_la_memoria_no_cambie(app, cliente, app_otro_proceso, otro_motor):
+    entrada = cliente.post('/api/entrada', json={'matricula': '1234BCD'}).json
+    plaza = (entrada['nivel'], entrada['plaza'])
+
+    # Para el otro proceso la plaza ya estaba libre: su memoria no cambia, la tabla sí
+    with app_otro_proceso.app_context():
+        assert otro_motor.marcar(*plaza, False) is True
+        db.session.commit()
+
+    assert estado_plaza(app, *plaza) == (False, None)
+
+
+def test_lectura_sin_cambios_no_cambia_la_tabla(app):
+    with app.app_context():
+        # Latido: la plaza sigue libre, no hay nada que guardar ni publicar
+        assert ocupacion.marcar('PI', 1, False) is False
+        assert db.session.query(Plaza).filter_by(nivel='PI', numero=1).update(
+            {'ocupada': True}, synchronize_session=False) == 1
+        assert ocupacion.marcar('PI', 1, True) is False
+        db.session.rollback()
+
+
+def test_lote_sin_cambios_no_escribe(app):
+    actualizaciones = []
+
+    def anotar(conexion, cursor, sentencia, *args):
+        if sentencia.lstrip().upper().startswith('UPDATE'):
+            actualizaciones.append(sentencia)
+
+    with app.app_context():
+        motor = db.engine
+        event.listen(motor, 'before_cursor_execute', anotar)
+        try:
+            assert ocupacion.marcar_lote([('PI', 2, False), ('PS', 1, False)]) == []
+        finally:
+            event.remove(motor, 'before_cursor_execute', anotar)
+            db.session.rollback()
+
+    assert actualizaciones == []
+
+
+def test_lote_solo_devuelve_y_escribe_los_cambios(app):
+    with app.app_context():
+        cambios = ocupacion.marcar_lote([('PI', 1, True), ('PI', 2, False), ('PS', 3, True), ('PS', 3, False)])
+        db.session.commit()
+
+    assert cambios == [('PI', 1, True)]
+    assert estado_plaza(app, 'PI', 1) == (True, None)
+    assert estado_plaza(app, 'PS', 3) == (False, None)
+
+
+def test_resincronizar_recoge_los_cambios_de_otro_proceso(app, cliente, app_otro_proceso, otro_motor):
+    cliente.post('/api/entrada', json={'matricula': '1234BCD'})
+
+    with app_otro_proceso.app_context():
+        otro_motor.resincronizar()
+        assert otro_motor.resumen() == ocupacion.resumen()
+        assert otro_motor.plaza_de('1234BCD') == ocupacion.plaza_de('1234BCD')
+
+
+def test_ocupacion_responde_304_hasta_que_cambia_una_plaza(app, cliente):
+    primera = cliente.get('/api/ocupacion')
+    etag = primera.headers['ETag']
+    assert primera.status_code == 200
+    assert primera.get_json()['niveles']['PI'] == {'sitio': 'principal', 'libres': 3, 'ocupadas': 0, 'total': 3}
+
+    sin_cambios = cliente.get('/api/ocupacion', headers={'If-None-Match': etag})
+    assert sin_cambios.status_code == 304
+    assert sin_cambios.get_data() == b''
+    assert sin_cambios.headers['ETag'] == etag
+
+    with app.app_context():
+        # Un latido con el mismo estado no cambia la versión
+        ocupacion.marcar('PI', 2, False)
+        assert cliente.get('/api/ocupacion', headers={'If-None-Match': etag}).status_code == 304
+
+        ocupacion.marcar('PI', 1, True)
+        db.session.commit()
+
+    cambiada = cliente.get('/api/ocupacion', headers={'If-None-Match': etag})
+    assert cambiada.status_code == 200
+    assert cambiada.headers['ETag'] != etag
+    assert cambiada.get_json()['version'] > primera.get_json()['version']
+    assert cambiada.get_json()['niveles']['PI']['ocupadas'] == 1
+    assert cambiada.get_json()['libres'] == primera.get_json()['libres'] - 1
+
+
+def test_resumen_bd_lee_la_tabla_por_sitio_y_nivel(app, app_otro_proceso):
+    with app.app_context():
+        db.session.add(Plaza(sitio='anexo', nivel='PS', numero=9, ocupada=True))
+        ocupacion.marcar('PI', 1, True)
+        db.session.commit()
+    with app_otro_proceso.app_context():
+        # Cambio de otro worker que la memoria de este proceso no ha visto
+        db.session.query(Plaza).filter_by(nivel='PS', numero=2).update({'ocupada': True})
+        db.session.commit()
+
+    with app.app_context():
+        assert resumen_bd() == {
+            ('principal', 'PI'): {'ocupadas': 1, 'total': 3},
+            ('principal', 'PS'): {'ocupadas': 1, 'total': 3},
+            ('anexo', 'PS'): {'ocupadas': 1, 'total': 1},
+        }
+        assert resumen_bd('anexo') == {('anexo', 'PS'): {'ocupadas': 1, 'total': 1}}
+        assert resumen_bd('otro') == {}
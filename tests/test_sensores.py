@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta
+
+from app.sensores import VigilanciaSensores
+
+
+def test_las_plazas_sin_lecturas_acaban_inactivas(app):
+    vigilancia = VigilanciaSensores(limite=90)
+    arranque = datetime.now() - timedelta(seconds=120)
+    with app.app_context():
+        vigilancia.sembrar(arranque)
+    vigilancia.visto('PI', 1)
+
+    estado = {(sensor['nivel'], sensor['numero']): sensor['inactivo'] for sensor in vigilancia.estado()}
+    assert len(estado) == 6
+    assert estado[('PI', 1)] is False
+    assert estado[('PS', 3)] is True
+
+
+def test_sembrar_no_pisa_las_lecturas_recibidas(app):
+    vigilancia = VigilanciaSensores()
+    lectura = datetime.now()
+    vigilancia.visto('PI', 2, lectura)
+    with app.app_context():
+        vigilancia.sembrar(lectura - timedelta(hours=1))
+
+    ultima = {(sensor['nivel'], sensor['numero']): sensor['ultima_lectura'] for sensor in vigilancia.estado()}
+    assert ultima[('PI', 2)] == lectura.isoformat()
@@ -0,0 +1,27 @@
+import os
+
+from waitress import serve
+
+# Punto de entrada de producción: PARKEASE_ENV=production python wsgi.py
+# (también sirve para cualquier servidor WSGI: gunicorn --threads 16 wsgi:app).
+# El servidor web arranca también la ingesta de sensores (PARKEASE_INGESTA=0 para no
+# hacerlo); con varios workers solo uno abre los puertos 8081/8082 y los demás lo avisan
+os.environ.setdefault('PARKEASE_INGESTA', '1')
+
+from app import create_app  # noqa: E402
+
+app = create_app('production')
+
+if __name__ == "__main__":
+    # Un solo proceso con varios hilos: la ocupación, las matrículas y las sesiones
+    # abiertas se guardan en memoria y así todos los hilos comparten el mismo estado
+    serve(
+        app,
+        host=app.config['SERVIDOR_HOST'],
+        port=app.config['SERVIDOR_PUERTO'],
+        # Los paneles usan el stream SSE del servidor asyncio de la ingesta, que no
+        # ocupa hilos. Si la ingesta está desactivada lo sirve Flask y cada stream
+        # ocupa un hilo mientras está abierto: se suman aparte para no quitárselos a la barrera
+        threads=app.config['SERVIDOR_HILOS'] + app.config['SSE_MAX_CLIENTES'],
+        channel_timeout=120,
+    )